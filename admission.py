@@ -0,0 +1,255 @@
+"""
+Admission control for exam-day spikes.
+
+Every request is sorted into a route class before its view runs:
+
+  exam     what students need while sitting an exam (/exam, /exam/data,
+           /exam/submit, autosave, receipts). Highest priority.
+  heavy    extraction, bulk ingest, exports, re-grading, analytics and
+           duplicate detection. Lowest priority, few at a time.
+  default  everything else.
+
+Each class has a concurrency limit and a bounded wait queue per worker
+process. A request that finds its class full waits up to the class's
+wait_seconds for a slot; if the queue is already full, or the wait runs
+out, it is answered 503 with Retry-After straight away instead of piling
+up behind slower work. On top of the class limits, at most max_active
+requests run at once per worker, and the last `reserved` of those slots
+only go to exam traffic. When a slot frees up, waiting exam requests get
+it before anything else.
+
+Each browser session also has a token bucket per class (rate per second,
+burst), answered 429 with Retry-After when it runs dry. Buckets follow the
+session cookie, not the address: a classroom often shares one address,
+and behind a reverse proxy every request comes from the proxy's. So a
+client's first request, and every request of a client that never keeps
+the cookie, is deliberately not rate-limited; those are still held to
+the concurrency limits and queues. Buckets live in each worker, so with N
+workers a client may get up to N times the rate.
+
+The limits act between the threads of one worker, so the app has to run
+on threaded workers (gunicorn -k gthread --threads N, as in
+DEPLOYMENT_GUIDE.md). A sync worker runs one request at a time and never
+queues anything; a gunicorn sync worker logs a warning on its first request.
+
+Streams (job events, live results) and static files are not counted: a
+stream is long-lived and capped on its own.
+
+Queue depth and active requests are exported as gauges, rejections as
+keeplearning_admission_rejected_total{route_class, reason}, and waits as
+keeplearning_admission_wait_seconds.
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import g, jsonify, request, session
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+EXAM_ENDPOINTS = frozenset({
+    'exam_page', 'get_exam_data', 'submit_exam', 'save_draft', 'get_draft', 'submission_receipt',
+})
+HEAVY_ENDPOINTS = frozenset({
+    'upload_file', 'library_upload', 'library_bulk_ingest', 'download_results', 'results_regrade',
+    'results_analytics', 'library_duplicates',
+})
+EXEMPT_ENDPOINTS = frozenset({
+    'static', 'fingerprinted_asset', 'metrics_endpoint', 'job_events', 'results_live_events',
+})
+
+MAX_BUCKETS = 10000  # sessions remembered per worker for rate limiting
+
+
+class RouteClass:
+    __slots__ = ('name', 'priority', 'concurrency', 'queue_size', 'wait_seconds', 'rate', 'burst',
+                 'retry_after', 'active', 'waiting')
+
+    def __init__(self, name, priority, concurrency, queue_size, wait_seconds, rate, burst, retry_after):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.wait_seconds = wait_seconds
+        self.rate = rate  # tokens per second per session
+        self.burst = burst
+        self.retry_after = retry_after  # seconds, sent with 503
+        self.active = 0
+        self.waiting = 0
+
+
+def default_classes(max_active=32, heavy_concurrency=2, heavy_queue=4):
+    return {
+        'exam': RouteClass('exam', 2, max_active, 4 * max_active, 5.0, rate=5.0, burst=30, retry_after=2),
+        'default': RouteClass('default', 1, max(1, max_active // 2), max_active, 5.0, rate=10.0, burst=50,
+                              retry_after=2),
+        'heavy': RouteClass('heavy', 0, heavy_concurrency, heavy_queue, 15.0, rate=0.2, burst=5, retry_after=10),
+    }
+
+
+class Admission:
+    def __init__(self, classes, max_active=32, reserved=4, rate_limit=True, metrics=None):
+        self.classes = classes
+        self.max_active = max_active
+        self.reserved = reserved
+        self.rate_limit = rate_limit
+        self.metrics = metrics or Metrics(None)
+        self.active = 0
+        self._top_priority = max(c.priority for c in classes.values())
+        self._cond = threading.Condition()
+        self._buckets = OrderedDict()  # (session key, class name) -> [tokens, last refill]
+        self._bucket_lock = threading.Lock()
+        self._warned_sync = False
+
+    def classify(self, endpoint):
+        """The RouteClass for a Flask endpoint, or None if it is not admission-controlled."""
+        if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+            return None
+        if endpoint in EXAM_ENDPOINTS:
+            return self.classes['exam']
+        if endpoint in HEAVY_ENDPOINTS:
+            return self.classes['heavy']
+        return self.classes['default']
+
+    # --- Rate limiting ---
+
+    def take_token(self, route_class, key):
+        """0 if the session may go ahead, else the seconds until it may."""
+        now = time.monotonic()
+        bucket_key = (key, route_class.name)
+        with self._bucket_lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = [route_class.burst, now]
+                while len(self._buckets) > MAX_BUCKETS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(bucket_key)
+                bucket[0] = min(route_class.burst, bucket[0] + (now - bucket[1]) * route_class.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / route_class.rate
+
+    # --- Concurrency ---
+
+    def _can_admit(self, route_class):
+        if route_class.active >= route_class.concurrency:
+            return False
+        limit = self.max_active if route_class.priority == self._top_priority else self.max_active - self.reserved
+        if self.active >= limit:
+            return False
+        # A freed slot goes to waiting higher-priority requests first
+        return not any(other.waiting and other.priority > route_class.priority
+                       and other.active < other.concurrency for other in self.classes.values())
+
+    def _admit(self, route_class):
+        route_class.active += 1
+        self.active += 1
+
+    def _report(self, route_class, active, waiting):
+        # Outside the lock: a metrics flush writes a file
+        self.metrics.set_gauge('admission_active', active, route_class=route_class.name)
+        self.metrics.set_gauge('admission_queue_depth', waiting, route_class=route_class.name)
+
+    def acquire(self, route_class):
+        """Take a slot, waiting in the class's queue if needed. Returns None or the rejection reason."""
+        started = time.monotonic()
+        reason = None
+        with self._cond:
+            if self._can_admit(route_class):
+                self._admit(route_class)
+                counts = (route_class.active, route_class.waiting)
+                waited = False
+            elif route_class.waiting >= route_class.queue_size:
+                return 'queue_full'
+            else:
+                waited = True
+                route_class.waiting += 1
+                deadline = started + route_class.wait_seconds
+                try:
+                    while not self._can_admit(route_class):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            reason = 'timeout'
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._admit(route_class)
+                finally:
+                    route_class.waiting -= 1
+                    # Lower-priority waiters may have been holding back for this one
+                    self._cond.notify_all()
+                counts = (route_class.active, route_class.waiting)
+        self._report(route_class, *counts)
+        if waited and reason is None:
+            self.metrics.observe('admission_wait_seconds', time.monotonic() - started, route_class=route_class.name)
+        return reason
+
+    def release(self, route_class):
+        with self._cond:
+            route_class.active -= 1
+            self.active -= 1
+            self._cond.notify_all()
+            counts = (route_class.active, route_class.waiting)
+        self._report(route_class, *counts)
+
+    # --- Flask integration ---
+
+    def _reject(self, route_class, status, reason, retry_after):
+        self.metrics.inc('admission_rejected_total', route_class=route_class.name, reason=reason)
+        logger.debug('Refused %s %s (%s, %s)', request.method, request.path, route_class.name, reason)
+        message = 'Too many requests, slow down' if status == 429 else 'Server busy, try again shortly'
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @staticmethod
+    def _client_key():
+        """This browser's rate-limit key, or None on its first request (the key is set then)."""
+        key = session.get('client_id')
+        if key is None:
+            # Unlimited until the cookie comes back; see the module docstring for why not the address
+            session['client_id'] = uuid.uuid4().hex[:16]
+        return key
+
+    def _check_threaded(self):
+        environ = request.environ
+        if (not self._warned_sync and not environ.get('wsgi.multithread')
+                and environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+            self._warned_sync = True
+            logger.warning('Admission limits need threaded workers (gunicorn -k gthread --threads N); '
+                           'this worker serves one request at a time, so they have no effect')
+
+    def init_app(self, app):
+        @app.before_request
+        def _admit_request():
+            route_class = self.classify(request.endpoint)
+            if route_class is None:
+                return None
+            self._check_threaded()
+            key = self._client_key() if self.rate_limit else None
+            if key is not None:
+                wait = self.take_token(route_class, key)
+                if wait:
+                    return self._reject(route_class, 429, 'rate_limited', wait)
+            reason = self.acquire(route_class)
+            if reason is not None:
+                return self._reject(route_class, 503, reason, route_class.retry_after)
+            g._admission_class = route_class
+            return None
+
+        # For streamed responses (exports) this runs once the stream is done
+        @app.teardown_request
+        def _release_request(exc):
+            route_class = g.pop('_admission_class', None)
+            if route_class is not None:
+                self.release(route_class)
@@ -0,0 +1,156 @@
+"""
+Versioned answer-key registry.
+
+When an exam is loaded, its questions and correct answers are registered
+here under the exam ID. Submissions then only carry the exam ID and the
+student's answers: the server scores them against its own copy of the key
+instead of whatever questions the client posts back, and stored results
+record (exam_id, key_version) instead of embedding every question.
+
+A key is never changed in place. Correcting it (see regrade.py) registers
+a new version, so every result can still be shown with exactly the key it
+was scored against.
+
+Keys live in the results database. Versions are immutable, so parsed keys
+are cached per process; scorers hold SequenceMatcher state and are cached
+per thread.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from db import get_connection, transaction
+from scoring import ExamScorer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answer_keys (
+    exam_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    questions TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    PRIMARY KEY (exam_id, version)
+);
+"""
+
+KEY_CACHE_SIZE = 256     # parsed key versions kept per process
+SCORER_CACHE_SIZE = 64   # scorers kept per thread
+
+
+def normalize_answer(answer):
+    return (answer or '').strip().lower()
+
+
+class AnswerKey:
+    __slots__ = ('exam_id', 'version', 'questions', 'normalized')
+
+    def __init__(self, exam_id, version, questions, normalized):
+        self.exam_id = exam_id
+        self.version = version
+        self.questions = questions
+        self.normalized = normalized
+
+
+class AnswerKeyRegistry:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._ready_pid = None
+        self._keys = OrderedDict()  # (exam_id, version) -> AnswerKey
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript(SCHEMA)
+            self._ready_pid = os.getpid()
+        return conn
+
+    def _remember(self, key):
+        with self._lock:
+            self._keys[(key.exam_id, key.version)] = key
+            self._keys.move_to_end((key.exam_id, key.version))
+            while len(self._keys) > KEY_CACHE_SIZE:
+                self._keys.popitem(last=False)
+        return key
+
+    @staticmethod
+    def _from_row(row):
+        return AnswerKey(row['exam_id'], row['version'], json.loads(row['questions']), json.loads(row['normalized']))
+
+    def register(self, exam_id, questions):
+        """
+        Store questions as the current key for exam_id and return it. A new
+        version is only created if the questions differ from the latest one.
+        """
+        raw = json.dumps(questions, sort_keys=True)
+        normalized = [normalize_answer(q.get('correct_answer')) for q in questions]
+        with transaction(self._conn()) as conn:
+            row = conn.execute(
+                'SELECT version, questions FROM answer_keys WHERE exam_id = ? ORDER BY version DESC LIMIT 1',
+                (exam_id,)
+            ).fetchone()
+            if row and row['questions'] == raw:
+                version = row['version']
+            else:
+                version = row['version'] + 1 if row else 1
+                conn.execute(
+                    'INSERT INTO answer_keys (exam_id, version, created_at, questions, normalized) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (exam_id, version, datetime.now().isoformat(), raw, json.dumps(normalized))
+                )
+        return self._remember(AnswerKey(exam_id, version, json.loads(raw), normalized))
+
+    def get(self, exam_id, version):
+        with self._lock:
+            key = self._keys.get((exam_id, version))
+        if key is not None:
+            return key
+        row = self._conn().execute(
+            'SELECT * FROM answer_keys WHERE exam_id = ? AND version = ?', (exam_id, version)
+        ).fetchone()
+        return self._remember(self._from_row(row)) if row else None
+
+    def latest_version(self, exam_id):
+        row = self._conn().execute(
+            'SELECT MAX(version) FROM answer_keys WHERE exam_id = ?', (exam_id,)
+        ).fetchone()
+        return row[0]
+
+    def latest(self, exam_id):
+        """Return the current key for exam_id, or None if it was never registered."""
+        version = self.latest_version(exam_id)
+        return self.get(exam_id, version) if version is not None else None
+
+    def iter_latest(self):
+        """Yield the current key of every registered exam."""
+        rows = self._conn().execute(
+            'SELECT exam_id, MAX(version) AS version FROM answer_keys GROUP BY exam_id ORDER BY exam_id'
+        ).fetchall()
+        for row in rows:
+            yield self.get(row['exam_id'], row['version'])
+
+    def scorer(self, key):
+        """Return this thread's ExamScorer for a key version."""
+        scorers = getattr(self._local, 'scorers', None)
+        if scorers is None:
+            scorers = self._local.scorers = OrderedDict()
+        cache_key = (key.exam_id, key.version)
+        scorer = scorers.get(cache_key)
+        if scorer is None:
+            scorer = scorers[cache_key] = ExamScorer(key.questions, normalized=key.normalized)
+            while len(scorers) > SCORER_CACHE_SIZE:
+                scorers.popitem(last=False)
+        else:
+            scorers.move_to_end(cache_key)
+        return scorer
+
+    def hydrate(self, result):
+        """Attach the questions of the key a result was scored against."""
+        if 'questions' in result or not result.get('exam_id'):
+            return result
+        key = self.get(result['exam_id'], result.get('key_version'))
+        return dict(result, questions=key.questions if key else [])
@@ -1,33 +1,156 @@
-from flask import render_template
-from flask import Flask, request, jsonify, make_response, session, redirect, url_for
+from flask import Flask, request, jsonify, session, redirect, url_for, Response, stream_with_context, send_file
 import os
+import shutil
+import tempfile
+import zipfile
 from werkzeug.utils import secure_filename
 import json
 from datetime import datetime
-from io import StringIO
 from difflib import SequenceMatcher
 import re
+import time
+import threading
+import logging
 from functools import wraps
+from collections import Counter
+from results_store import ResultsStore
+from exam_store import create_exam_store
+from results_export import export_results
+from extraction_cache import ExtractionCache, code_fingerprint, file_sha256
+from jobs import JobQueue, FINISHED
+import question_parser
+import docx_reader
+import regrade
+from library_index import LibraryIndex
+from library_search import LibrarySearch
+import library_ingest
+from library_duplicates import DuplicateIndex, DEFAULT_THRESHOLD as DUPLICATE_THRESHOLD
+from exam_composer import compose_exam, CompositionError
+from answer_keys import AnswerKeyRegistry
+from grading_memo import GradingMemo
+from results_archive import ResultsArchive
+from live_results import LiveResults, LiveFull
+from metrics import Metrics
+from admission import Admission, default_classes
+from http_cache import StaticAssets, PageCache, conditional_response, not_modified
+from submission_pipeline import SubmissionPipeline, PipelineFull
+from draft_store import DraftStore, DraftError, check_answers
 
 app = Flask(__name__)
 app.secret_key = 'keeplearning_hub_secret_2025'  # Secret key for session management
 
+# LOG_LEVEL=DEBUG logs submission payloads; the default INFO skips them without formatting
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+logger = logging.getLogger('keeplearning')
+
 # Get the application directory
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(APP_DIR, 'uploads')
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(APP_DIR, 'uploads'))
 ALLOWED_EXTENSIONS = {'docx', 'txt'}
-RESULTS_FILE = os.path.join(APP_DIR, 'exam_results.json')
+RESULTS_FILE = os.environ.get('RESULTS_FILE', os.path.join(APP_DIR, 'exam_results.json'))  # legacy, imported once into RESULTS_DB
+RESULTS_DB = os.environ.get('RESULTS_DB', os.path.join(APP_DIR, 'exam_results.db'))
+
+# Opt-in metrics (/metrics) and sampled request profiling
+metrics = Metrics(
+    os.environ.get('METRICS_DIR', os.path.join(APP_DIR, 'metrics')),
+    enabled=os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    profile_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+    profile_dir=os.environ.get('PROFILE_DIR', os.path.join(APP_DIR, 'profiles')),
+)
+metrics.init_app(app)
+
+# Per-route-class concurrency limits, wait queues and per-session rate limits
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', '32'))  # requests at once per worker
+admission = Admission(
+    default_classes(ADMISSION_MAX_ACTIVE,
+                    heavy_concurrency=int(os.environ.get('ADMISSION_HEAVY_CONCURRENCY', '2')),
+                    heavy_queue=int(os.environ.get('ADMISSION_HEAVY_QUEUE', '4'))),
+    max_active=ADMISSION_MAX_ACTIVE,
+    reserved=int(os.environ.get('ADMISSION_EXAM_RESERVED', '4')),
+    rate_limit=os.environ.get('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes'),
+    metrics=metrics,
+)
+if os.environ.get('ADMISSION_ENABLED', '1').lower() in ('1', 'true', 'yes'):
+    admission.init_app(app)
+
+# Fingerprinted /assets/ URLs with immutable caching, and pages rendered once per worker
+static_assets = StaticAssets(app)
+page_cache = PageCache(app)
 
 # Library folder and metadata
-LIBRARY_FOLDER = os.path.join(APP_DIR, 'library_docs')
+LIBRARY_FOLDER = os.environ.get('LIBRARY_FOLDER', os.path.join(APP_DIR, 'library_docs'))
 LIBRARY_META_FOLDER = os.path.join(LIBRARY_FOLDER, 'meta')
 if not os.path.exists(LIBRARY_FOLDER):
     os.makedirs(LIBRARY_FOLDER)
 if not os.path.exists(LIBRARY_META_FOLDER):
     os.makedirs(LIBRARY_META_FOLDER)
 
-# Store current exam session in memory
-exam_session = {}
+# Per-worker catalog of library documents, refreshed by metadata file mtime
+library_index = LibraryIndex(LIBRARY_META_FOLDER)
+
+# Full-text index over library questions, shared by all workers
+LIBRARY_SEARCH_DB = os.environ.get('LIBRARY_SEARCH_DB', os.path.join(APP_DIR, 'library_search.db'))
+library_search = LibrarySearch(LIBRARY_SEARCH_DB, LIBRARY_META_FOLDER)
+
+# MinHash/LSH signatures of library questions, for /library/duplicates
+duplicate_index = DuplicateIndex(LIBRARY_SEARCH_DB, LIBRARY_META_FOLDER)
+
+# Exam sessions, shared across workers ('sqlite') or per process ('memory')
+EXAM_SESSION_BACKEND = os.environ.get('EXAM_SESSION_BACKEND', 'sqlite')
+EXAM_SESSION_DB = os.environ.get('EXAM_SESSION_DB', os.path.join(APP_DIR, 'exam_sessions.db'))
+exam_store = create_exam_store(EXAM_SESSION_BACKEND, EXAM_SESSION_DB)
+
+# Autosaved answers, coalesced per worker and written every DRAFT_FLUSH_INTERVAL seconds
+draft_store = DraftStore(EXAM_SESSION_DB, flush_interval=float(os.environ.get('DRAFT_FLUSH_INTERVAL', '2')))
+
+# Append-only results storage shared by all workers
+results_store = ResultsStore(RESULTS_DB, legacy_json=RESULTS_FILE)
+
+# Server-side answer keys, versioned per exam ID; results reference a key version
+answer_keys = AnswerKeyRegistry(RESULTS_DB)
+
+# Grading decisions shared by all workers, so repeated answers are scored by lookup
+GRADING_MEMO_SIZE = int(os.environ.get('GRADING_MEMO_SIZE', '100000'))  # 0 disables the memo
+grading_memo = GradingMemo(RESULTS_DB, max_entries=GRADING_MEMO_SIZE, metrics=metrics) if GRADING_MEMO_SIZE else None
+
+# Submissions are journaled and acknowledged, then scored and stored in batches
+SUBMISSION_JOURNAL_DIR = os.environ.get('SUBMISSION_JOURNAL_DIR', os.path.join(APP_DIR, 'submission_journal'))
+SUBMISSION_RETRY_AFTER = 2  # seconds, sent with 503 when the queue is full
+submission_pipeline = SubmissionPipeline(
+    SUBMISSION_JOURNAL_DIR, results_store, answer_keys,
+    max_queue=int(os.environ.get('SUBMISSION_QUEUE_SIZE', '1000')),
+    batch_size=int(os.environ.get('SUBMISSION_BATCH_SIZE', '100')),
+    metrics=metrics,
+    grading_memo=grading_memo,
+)
+
+@app.before_request
+def start_submission_writer():
+    # Once per worker process; also replays journals left by crashed workers
+    submission_pipeline.start()
+
+# Old results compacted into column files (python results_archive.py)
+RESULTS_ARCHIVE_DIR = os.environ.get('RESULTS_ARCHIVE_DIR', os.path.join(APP_DIR, 'results_archive'))
+results_archive = ResultsArchive(RESULTS_ARCHIVE_DIR, results_store, answer_keys)
+
+# Live proctor dashboard: one results tail per worker, fanned out to every open stream
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', '20'))  # open dashboards per worker
+LIVE_RETRY_AFTER = 5  # seconds, sent with 503 when a worker has no stream slot left
+live_results = LiveResults(results_store, answer_keys, max_streams=LIVE_MAX_STREAMS,
+                           stream_seconds=int(os.environ.get('LIVE_STREAM_SECONDS', '300')))
+
+# Background extraction for large uploads
+JOBS_DB = os.environ.get('JOBS_DB', os.path.join(APP_DIR, 'jobs.db'))
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', '2'))
+ASYNC_EXTRACTION_BYTES = int(os.environ.get('ASYNC_EXTRACTION_BYTES', str(1024 * 1024)))
+JOB_EVENTS_TIMEOUT = 600  # seconds an SSE job stream stays open
+REGRADE_WORKERS = int(os.environ.get('REGRADE_WORKERS', '2'))
+job_queue = JobQueue(JOBS_DB, max_workers=EXTRACTION_WORKERS)
+
+# Bulk library ingest (/library/ingest, python library_ingest.py)
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '0')) or None  # default: CPU count
+LIBRARY_INGEST_ROOT = os.environ.get('LIBRARY_INGEST_ROOT')  # folders /library/ingest may read
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -56,7 +179,7 @@ def login_page():
         else:
             return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
     
-    return render_template('login.html')
+    return page_cache.render('login.html')
 
 # Logout
 @app.route('/logout')
@@ -68,53 +191,192 @@ def logout():
 @app.route('/about')
 @login_required
 def about_page():
-    return render_template('about.html')
+    return page_cache.render('about.html')
 
-# Serve the results page (loads saved results)
+# Serve the results page (rows are fetched page by page from /results/query)
 @app.route('/results')
 @login_required
 def results_page():
-    results = []
-    if os.path.exists(RESULTS_FILE):
+    return page_cache.render('results.html')
+
+# Paginated results listing (summaries only, no questions/answers)
+@app.route('/results/query', methods=['GET'])
+@login_required
+def results_query():
+    try:
+        rows, next_cursor = results_store.query(
+            student_name=request.args.get('student_name', '').strip() or None,
+            date_from=request.args.get('from') or None,
+            date_to=request.args.get('to') or None,
+            sort=request.args.get('sort', 'timestamp'),
+            order=request.args.get('order', 'desc'),
+            limit=request.args.get('limit', 50),
+            cursor=request.args.get('cursor') or None,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Archived results are not listed here; say so rather than drop them silently
+    return jsonify({'results': rows, 'next_cursor': next_cursor,
+                    'archived_results': results_archive.count()}), 200
+
+# Full result detail, loaded when a row is expanded
+@app.route('/results/<int:result_id>', methods=['GET'])
+@login_required
+def result_detail(result_id):
+    result = results_store.get(result_id) or results_archive.get(result_id)
+    if result is None:
+        return jsonify({'error': 'Result not found'}), 404
+    return jsonify(answer_keys.hydrate(result)), 200
+
+# Score distribution and per-question difficulty/discrimination over archived and live results
+@app.route('/results/analytics', methods=['GET'])
+@login_required
+def results_analytics():
+    scope = request.args.get('scope', 'all')
+    if scope not in ('all', 'archive'):
+        return jsonify({'error': f'Invalid scope: {scope}'}), 400
+    try:
+        analytics = results_archive.analytics(include_live=scope == 'all',
+                                              exam_id=request.args.get('exam_id') or None)
+    except Exception as e:
+        logger.exception("Error computing analytics: %s", e)
+        return jsonify({'error': 'Error computing analytics'}), 500
+    return jsonify(analytics), 200
+
+def live_exam_id():
+    exam_id = request.args.get('exam_id') or session.get('exam_id') or exam_store.latest_id()
+    if not exam_id or answer_keys.latest_version(exam_id) is None:
+        return None
+    return exam_id
+
+def streams_allowed():
+    # A stream holds its thread; on a single-threaded (sync) worker it would block every other request
+    return bool(request.environ.get('wsgi.multithread'))
+
+# Live aggregates as JSON: the first load of the dashboard, and its polling fallback on sync workers
+@app.route('/results/live', methods=['GET'])
+@login_required
+def results_live():
+    exam_id = live_exam_id()
+    if exam_id is None:
+        return jsonify({'error': 'Exam not found'}), 404
+    try:
+        after_id = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid after'}), 400
+    view = live_results.view(exam_id, after_id)
+    view['stream'] = streams_allowed()
+    return jsonify(view), 200
+
+# Server-sent events stream of new submissions and running aggregates for one exam
+@app.route('/results/live/events', methods=['GET'])
+@login_required
+def results_live_events():
+    exam_id = live_exam_id()
+    if exam_id is None:
+        return jsonify({'error': 'Exam not found'}), 404
+    if not streams_allowed():
+        return jsonify({'error': 'Live streams need threaded workers; poll /results/live instead'}), 503
+    try:
+        subscriber, snapshot = live_results.subscribe(exam_id)
+    except LiveFull:
+        response = jsonify({'error': 'Too many live dashboards open, try again shortly'})
+        response.headers['Retry-After'] = str(LIVE_RETRY_AFTER)
+        return response, 503
+    response = Response(live_results.stream(subscriber, snapshot), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs when the browser goes away before the first event
+    response.call_on_close(lambda: live_results.unsubscribe(subscriber))
+    return response
+
+# Start (or resume) re-grading stored results against the current library answer keys
+@app.route('/results/regrade', methods=['POST'])
+@login_required
+def results_regrade():
+    data = request.json or {}
+    run_id = data.get('resume')
+    if run_id:
+        run = regrade.get_run(results_store, run_id)
+        if run is None:
+            return jsonify({'error': 'Re-grade run not found'}), 404
+        if run['status'] == 'done':
+            return jsonify({'error': 'Re-grade run already finished', 'run': run}), 409
+    else:
+        documents = data.get('documents') or None
+        run_id = regrade.create_run(results_store, documents)
+    # Only one thread, in any worker, may process a run
+    owner = regrade.claim_run(results_store, run_id)
+    if owner is None:
+        return jsonify({'error': 'Re-grade run is already running', 'run': regrade.get_run(results_store, run_id)}), 409
+
+    def worker():
         try:
-            with open(RESULTS_FILE, 'r') as f:
-                results = json.load(f)
+            regrade.run_regrade(results_store, LIBRARY_META_FOLDER, run_id, workers=REGRADE_WORKERS, owner=owner)
         except Exception as e:
-            print(f"Error reading results file: {e}")
-    return render_template('results.html', results=results)
+            logger.exception("Re-grade run %s failed: %s", run_id, e)
+
+    threading.Thread(target=worker, name=f'regrade-{run_id}', daemon=True).start()
+    return jsonify({
+        'run_id': run_id,
+        'status_url': url_for('results_regrade_status', run_id=run_id),
+        # Only the results table is re-graded
+        'archived_results_skipped': results_archive.count(),
+    }), 202
+
+# Progress of a re-grade run
+@app.route('/results/regrade/<run_id>', methods=['GET'])
+@login_required
+def results_regrade_status(run_id):
+    run = regrade.get_run(results_store, run_id)
+    if run is None:
+        return jsonify({'error': 'Re-grade run not found'}), 404
+    return jsonify(run), 200
 
 # Redirect root URL to /exams
 @app.route('/')
 def index():
     if 'logged_in' not in session:
         return redirect(url_for('login_page'))
-    return render_template('exams.html')
+    return page_cache.render('exams.html')
 
 # Serve the exams page (after app is defined)
 @app.route('/exams')
 @login_required
 def exams_page():
-    return render_template('exams.html')
+    return page_cache.render('exams.html')
 
 # Serve the dedicated exam page 
 @app.route('/exam')
 @login_required
 def exam_page():
-    return render_template('exam.html')
+    return page_cache.render('exam.html')
 
     # Serve the library page
 @app.route('/library')
 @login_required
 def library_page():
-    return render_template('library.html')
+    return page_cache.render('library.html')
 
 # Get exam data (questions extracted from uploaded document)
 @app.route('/exam/data', methods=['GET'])
 def get_exam_data():
-    global exam_session
-    if not exam_session or 'questions' not in exam_session:
+    # Explicit ?exam_id= wins, then the exam this browser loaded, then the latest exam
+    exam_id = request.args.get('exam_id') or session.get('exam_id')
+    version = exam_store.version(exam_id)
+    if version is None and exam_id:
+        exam_id = None
+        version = exam_store.version()
+    if version is None:
+        return jsonify({'error': 'No exam data available'}), 400
+    # Revisiting the exam page costs one small query
+    cached = not_modified(version)
+    if cached is not None:
+        return cached
+    raw = exam_store.get_raw(exam_id)
+    if raw is None:
         return jsonify({'error': 'No exam data available'}), 400
-    return jsonify(exam_session), 200
+    # Already serialized when the exam was stored, send it as-is
+    return conditional_response(raw, etag=version)
 
 # Function to check similarity between answers
 def calculate_similarity(user_answer, correct_answer):
@@ -163,126 +425,116 @@ def calculate_similarity(user_answer, correct_answer):
 @app.route('/exam/submit', methods=['POST'])
 def submit_exam():
     data = request.json
-    print(f"Submit received: {data}")  # DEBUG
-    if not data or 'questions' not in data:
+    logger.debug("Submit received: %s", data)
+    if not data:
         return jsonify({'error': 'Invalid exam data'}), 400
-    
-    questions = data['questions']
-    answers = data.get('answers', {})
-    
-    score = 0
-    total = len(questions)
-    
-    for q in questions:
-        q_id = f"q{q['id']}"
-        user_answer = answers.get(q_id, '').strip()
-        correct_answer = (q.get('correct_answer', '') or '').strip()
-
-        # Enforce 5000 character limit for descriptive/fill_blank
-        q_type = q.get('type', 'mcq')
-        if q_type in ['descriptive', 'fill_blank'] and len(user_answer) > 5000:
-            user_answer = user_answer[:5000]
-
-        if q_type == 'mcq' or q_type == 'true_false':
-            threshold = 0.95
-        elif q_type == 'fill_blank':
-            threshold = 0.85
-        else:
-            threshold = 0.70  # descriptive
-
-        if not user_answer:
-            # Empty answer gets 0 points
-            continue
 
-        # Score answer
-        similarity = calculate_similarity(user_answer, correct_answer)
-        if similarity >= threshold:
-            score += 1
-    
-    result = {
-        'score': score,
-        'total': total,
-        'percentage': round((score / total) * 100, 2) if total > 0 else 0,
-        'timestamp': datetime.now().isoformat(),
-        'student_name': data.get('student_name', 'Unknown'),
-        'started_at': data.get('started_at'),
-        'submitted_at': data.get('submitted_at'),
-        'questions': questions,
-        'answers': answers
-    }
-    print(f"Result created: {result}")  # DEBUG
-    
-    # Save result to results file
+    # Score against the server's answer key, never against posted questions
+    exam_id = data.get('exam_id') or session.get('exam_id')
+    key = answer_keys.latest(exam_id) if exam_id else None
+    if key is None and exam_id:
+        # Exam loaded before answer keys were registered
+        exam = exam_store.get(exam_id)
+        if exam is not None:
+            key = answer_keys.register(exam_id, exam['questions'])
+    if key is None:
+        return jsonify({'error': 'Unknown exam'}), 400
+
+    answers = data.get('answers') or {}
+    draft_id = data.get('draft_id')
     try:
-        print(f"Saving to {RESULTS_FILE}")  # DEBUG
-        if os.path.exists(RESULTS_FILE):
-            with open(RESULTS_FILE, 'r') as f:
-                all_results = json.load(f)
-        else:
-            all_results = []
-        all_results.append(result)
-        with open(RESULTS_FILE, 'w') as f:
-            json.dump(all_results, f, indent=2)
-        print(f"Saved successfully. Total results: {len(all_results)}")  # DEBUG
-    except Exception as e:
-        print(f"Error saving results: {e}")
-    
-    return jsonify(result), 200
-
-# Download results as JSON file
+        # Refused here: once acknowledged, a bad answer would only fail in the writer
+        check_answers(answers)
+        if draft_id:
+            # Fill in anything the browser lost since its last autosave
+            answers = draft_store.merge(draft_id, key.exam_id, answers)
+    except DraftError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Acknowledge once journaled; scoring and the results write happen in the writer thread
+    try:
+        receipt_id = submission_pipeline.submit(
+            key, answers,
+            student_name=data.get('student_name', 'Unknown'),
+            started_at=data.get('started_at'),
+            submitted_at=data.get('submitted_at'),
+        )
+    except PipelineFull:
+        response = jsonify({'error': 'Too many submissions in progress, please retry'})
+        response.headers['Retry-After'] = str(SUBMISSION_RETRY_AFTER)
+        return response, 503
+    if draft_id:
+        draft_store.discard(draft_id)
+
+    return jsonify({
+        'receipt_id': receipt_id,
+        'status': 'queued',
+        'status_url': url_for('submission_receipt', receipt_id=receipt_id),
+        'exam_id': key.exam_id,
+        'key_version': key.version,
+    }), 202
+
+# Autosave: only the answers changed since the previous autosave
+@app.route('/exam/draft', methods=['POST'])
+def save_draft():
+    data = request.get_json(silent=True) or {}
+    exam_id = data.get('exam_id')
+    draft_id = data.get('draft_id')
+    if not exam_id:
+        return jsonify({'error': 'exam_id is required'}), 400
+    if draft_id is None and exam_store.get_raw(exam_id) is None:
+        return jsonify({'error': 'Unknown exam'}), 400
+    try:
+        saved = draft_store.apply(draft_id, exam_id, data.get('seq'), data.get('changes') or {},
+                                  base_seq=data.get('base_seq') or 0)
+    except DraftError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(saved), 200
+
+# Restore a draft after a reload or crash
+@app.route('/exam/draft/<draft_id>', methods=['GET'])
+def get_draft(draft_id):
+    draft = draft_store.get(draft_id)
+    if draft is None:
+        return jsonify({'error': 'Unknown draft'}), 404
+    return jsonify(draft), 200
+
+# Final score of a submission, once the writer has stored it
+@app.route('/exam/receipt/<receipt_id>', methods=['GET'])
+def submission_receipt(receipt_id):
+    receipt = submission_pipeline.lookup(receipt_id)
+    if receipt is None:
+        return jsonify({'error': 'Unknown receipt'}), 404
+    if receipt['status'] in ('queued', 'pending'):
+        response = jsonify(receipt)
+        response.headers['Retry-After'] = '1'
+        return response, 202
+    return jsonify(receipt), 200
+
+# Download results as a streamed CSV, JSON or NDJSON file
 @app.route('/download/results', methods=['GET'])
 def download_results():
     format_type = request.args.get('format', 'json').lower()
-    
-    if not os.path.exists(RESULTS_FILE):
-        return jsonify({'error': 'No results file found'}), 404
-    
+    filters = {
+        'student_name': request.args.get('student_name', '').strip() or None,
+        'date_from': request.args.get('from') or None,
+        'date_to': request.args.get('to') or None,
+    }
+
     try:
-        with open(RESULTS_FILE, 'r') as f:
-            results = json.load(f)
+        if not results_store.exists(**filters) and not results_archive.exists(**filters):
+            return jsonify({'error': 'No results available'}), 404
+        mimetype, extension, chunks = export_results(results_store, format_type, hydrate=answer_keys.hydrate,
+                                                     archive=results_archive, **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error reading results file: {e}")
+        logger.exception("Error reading results: %s", e)
         return jsonify({'error': 'Error reading results'}), 500
-    
-    if not results:
-        return jsonify({'error': 'No results available'}), 404
-    
-    if format_type == 'csv':
-        # Generate CSV
-        output = StringIO()
-        output.write("Student Name,Score,Total,Percentage,Started,Submitted,Duration\n")
-        
-        for r in results:
-            try:
-                started = datetime.fromisoformat(r.get('started_at', '')).strftime('%b %d, %Y, %H:%M:%S %p')
-                submitted = datetime.fromisoformat(r.get('submitted_at', r.get('timestamp', ''))).strftime('%b %d, %Y, %H:%M:%S %p')
-                
-                # Calculate duration
-                if r.get('started_at') and r.get('submitted_at'):
-                    start = datetime.fromisoformat(r['started_at'])
-                    end = datetime.fromisoformat(r['submitted_at'])
-                    duration = end - start
-                    minutes = duration.total_seconds() // 60
-                    seconds = int(duration.total_seconds() % 60)
-                    duration_str = f"{int(minutes)}m {seconds}s"
-                else:
-                    duration_str = "N/A"
-                
-                output.write(f'"{r.get("student_name", "Unknown")}",{r.get("score", 0)},{r.get("total", 0)},{r.get("percentage", 0)}%,"{started}","{submitted}","{duration_str}"\n')
-            except Exception as e:
-                print(f"Error processing result: {e}")
-        
-        csv_data = output.getvalue()
-        response = make_response(csv_data)
-        response.headers['Content-Disposition'] = f'attachment; filename=exam_results_{datetime.now().strftime("%Y-%m-%d")}.csv'
-        response.headers['Content-Type'] = 'text/csv'
-        return response
-    
-    else:  # JSON format (default)
-        response = make_response(json.dumps(results, indent=2))
-        response.headers['Content-Disposition'] = f'attachment; filename=exam_results_{datetime.now().strftime("%Y-%m-%d")}.json'
-        response.headers['Content-Type'] = 'application/json'
-        return response
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=exam_results_{datetime.now().strftime("%Y-%m-%d")}.{extension}'
+    return response
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -300,45 +552,162 @@ def library_upload():
         filename = secure_filename(file.filename)
         filepath = os.path.join(LIBRARY_FOLDER, filename)
         file.save(filepath)
+        # Large files are extracted in the background
+        if use_background_job(filepath):
+            job_id = start_extraction_job(filepath, filename, 'library')
+            return jsonify({'message': 'Extraction started', 'filename': filename, 'job_id': job_id,
+                            'status_url': url_for('job_status', job_id=job_id)}), 202
         # Extract questions
         try:
             questions = extract_questions(filepath)
-            # Save metadata
-            meta_path = os.path.join(LIBRARY_META_FOLDER, filename + '.json')
-            with open(meta_path, 'w', encoding='utf-8') as f:
-                json.dump({'filename': filename, 'questions': questions, 'uploaded_at': datetime.now().isoformat()}, f, indent=2)
+            save_library_meta(filename, questions)
             return jsonify({'message': 'Library file uploaded', 'filename': filename, 'questions': questions}), 200
         except Exception as e:
             return jsonify({'error': f'Extraction failed: {str(e)}'}), 500
     else:
         return jsonify({'error': 'Invalid file type'}), 400
 
+# --- Bulk ingest: a zip archive, or a folder under LIBRARY_INGEST_ROOT ---
+@app.route('/library/ingest', methods=['POST'])
+@login_required
+def library_bulk_ingest():
+    force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+    workdir = None
+    if 'archive' in request.files:
+        archive = request.files['archive']
+        if not archive.filename.lower().endswith('.zip'):
+            return jsonify({'error': 'Expected a .zip archive'}), 400
+        workdir = tempfile.mkdtemp(prefix='ingest-', dir=UPLOAD_FOLDER)
+        source = os.path.join(workdir, 'upload.zip')
+        archive.save(source)
+        if not zipfile.is_zipfile(source):
+            shutil.rmtree(workdir, ignore_errors=True)
+            return jsonify({'error': 'Not a zip archive'}), 400
+        label = secure_filename(archive.filename)
+    else:
+        directory = (request.get_json(silent=True) or {}).get('directory')
+        if not directory:
+            return jsonify({'error': 'Send a zip file as "archive" or a JSON "directory"'}), 400
+        if not LIBRARY_INGEST_ROOT:
+            return jsonify({'error': 'Server-side folders are disabled (set LIBRARY_INGEST_ROOT)'}), 403
+        root = os.path.realpath(LIBRARY_INGEST_ROOT)
+        source = os.path.realpath(os.path.join(root, directory))
+        if os.path.commonpath([root, source]) != root or not os.path.isdir(source):
+            return jsonify({'error': 'Folder not found under LIBRARY_INGEST_ROOT'}), 400
+        label = directory
+
+    def run(progress):
+        def report_progress(report):
+            done = len(report['ingested']) + len(report['errors'])
+            progress(f"{done}/{report['files'] - len(report['skipped'])} documents extracted")
+        try:
+            return library_ingest.ingest_sources(
+                [source], workdir or UPLOAD_FOLDER, library_folder=LIBRARY_FOLDER, library_index=library_index,
+                library_search=library_search, extraction_cache=extraction_cache,
+                workers=INGEST_WORKERS, force=force, on_progress=report_progress)
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    job_id = job_queue.run_in_thread('ingest', label, run, ())
+    return jsonify({'message': 'Ingest started', 'job_id': job_id,
+                    'status_url': url_for('job_status', job_id=job_id)}), 202
+
 # --- List Library Documents Endpoint ---
 @app.route('/library/list', methods=['GET'])
 @login_required
 def library_list():
-    docs = []
-    for meta_file in os.listdir(LIBRARY_META_FOLDER):
-        if meta_file.endswith('.json'):
-            meta_path = os.path.join(LIBRARY_META_FOLDER, meta_file)
-            try:
-                with open(meta_path, 'r', encoding='utf-8') as f:
-                    meta = json.load(f)
-                docs.append(meta)
-            except Exception as e:
-                continue
-    return jsonify({'library': docs}), 200
+    # Summaries only; full questions come from /library/<filename>
+    etag, body = library_index.listing()
+    return conditional_response(body, etag=etag)
+
+# --- Search Library Questions ---
+@app.route('/library/search', methods=['GET'])
+@login_required
+def library_search_questions():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'No search query provided'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    filename = request.args.get('filename')
+    started = time.perf_counter()
+    hits = library_search.search(q, limit=limit, filename=secure_filename(filename) if filename else None,
+                                 q_type=request.args.get('type') or None)
+    return jsonify({'query': q, 'hits': hits,
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)}), 200
+
+# --- Near-duplicate questions across the library (or within one composed exam) ---
+@app.route('/library/duplicates', methods=['GET'])
+@login_required
+def library_duplicates():
+    try:
+        threshold = float(request.args.get('threshold', DUPLICATE_THRESHOLD))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'error': 'Invalid threshold or limit'}), 400
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'threshold must be between 0 and 1'}), 400
+    filename = request.args.get('filename')
+    members = None
+    exam_id = request.args.get('exam_id')
+    if exam_id:
+        exam = exam_store.get(exam_id)
+        if exam is None:
+            return jsonify({'error': 'Unknown exam'}), 404
+        # Composed exams remember where each question came from
+        members = {(q['source']['filename'], q['source']['question_id'])
+                   for q in exam['questions'] if q.get('source')}
+    started = time.perf_counter()
+    clusters = duplicate_index.clusters(threshold=threshold, members=members, limit=max(1, limit),
+                                        filename=secure_filename(filename) if filename else None)
+    return jsonify({'threshold': threshold, 'clusters': clusters,
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)}), 200
+
+# --- Library Document (full questions) ---
+@app.route('/library/<filename>', methods=['GET'])
+@login_required
+def library_document(filename):
+    meta_path = library_index.meta_path(secure_filename(filename))
+    if not os.path.exists(meta_path):
+        return jsonify({'error': 'Document not found'}), 404
+    # Sent as-is from disk with an mtime/size ETag; repeat requests get a 304
+    response = send_file(meta_path, mimetype='application/json', etag=True, conditional=True, max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # --- Set Exam from Library ---
 @app.route('/library/set-exam', methods=['POST'])
 @login_required
 def library_set_exam():
-    global exam_session
     data = request.json
     if not data or 'questions' not in data:
         return jsonify({'error': 'Invalid data'}), 400
-    exam_session = {'questions': data['questions'], 'answers': {}}
-    return jsonify({'message': 'Exam loaded from library'}), 200
+    exam_id = load_exam(data['questions'])
+    session['exam_id'] = exam_id
+    return jsonify({'message': 'Exam loaded from library', 'exam_id': exam_id}), 200
+
+# --- Compose Exam from Library References ---
+@app.route('/library/compose', methods=['POST'])
+@login_required
+def library_compose():
+    data = request.json
+    if not data or 'items' not in data:
+        return jsonify({'error': 'Invalid data'}), 400
+    try:
+        questions, skipped = compose_exam(library_index, library_search, data['items'],
+                                          seed=data.get('seed'), shuffle=bool(data.get('shuffle')))
+    except CompositionError as e:
+        return jsonify({'error': str(e)}), 400
+    exam_id = load_exam(questions)
+    session['exam_id'] = exam_id
+    response = {'message': 'Exam composed', 'exam_id': exam_id, 'question_count': len(questions),
+                'type_counts': Counter(q.get('type', 'mcq') for q in questions), 'skipped_questions': skipped}
+    if skipped:
+        response['warning'] = f'{skipped} picked questions were duplicates or no longer in the library'
+    return jsonify(response), 200
 
 # --- Library Delete Endpoint ---
 @app.route('/library/delete', methods=['POST'])
@@ -359,21 +728,90 @@ def library_delete():
             os.remove(doc_path)
         
         # Delete the metadata JSON
-        meta_path = os.path.join(LIBRARY_META_FOLDER, secure_filename(filename) + '.json')
-        if os.path.exists(meta_path):
-            os.remove(meta_path)
+        library_index.remove(secure_filename(filename))
+        library_search.remove_document(secure_filename(filename))
+        duplicate_index.remove_document(secure_filename(filename))
         
         return jsonify({'message': 'Document deleted successfully'}), 200
     except Exception as e:
-        print(f"Error deleting document: {e}")
+        logger.exception("Error deleting document: %s", e)
         return jsonify({'error': f'Failed to delete: {str(e)}'}), 500
 
+def load_exam(questions):
+    """Start a new exam session and register its answer key; return the exam ID."""
+    exam_id = exam_store.put(questions)
+    answer_keys.register(exam_id, questions)
+    return exam_id
+
+def save_library_meta(filename, questions):
+    meta = {'filename': filename, 'questions': questions, 'uploaded_at': datetime.now().isoformat()}
+    # Lets bulk ingest skip documents that are already in the library
+    filepath = os.path.join(LIBRARY_FOLDER, filename)
+    if os.path.exists(filepath):
+        meta['sha256'] = file_sha256(filepath)
+    library_index.save(meta)
+    library_search.index_document(meta)
+    duplicate_index.index_document(meta)
+
+def use_background_job(filepath):
+    """Extract in a background job if asked to (?async=1) or the file is large."""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return os.path.getsize(filepath) >= ASYNC_EXTRACTION_BYTES
+
+def start_extraction_job(filepath, filename, target):
+    """
+    Queue extraction of filepath. When it finishes the questions are saved
+    to library_docs/meta (target='library') or a new exam session (target='exam').
+    """
+    def on_done(questions):
+        result = {'filename': filename, 'question_count': len(questions)}
+        if target == 'library':
+            save_library_meta(filename, questions)
+        else:
+            result['exam_id'] = load_exam(questions)
+        return result
+    return job_queue.submit('extract', filename, extract_questions, (filepath,), on_done=on_done)
+
+# --- Background job status ---
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    # Point this browser at the exam the job created, like /upload does
+    if job['status'] == 'done' and job['result'] and job['result'].get('exam_id'):
+        session['exam_id'] = job['result']['exam_id']
+    return jsonify(job), 200
+
+# Server-sent events stream of job status changes
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    def stream():
+        last = None
+        deadline = time.time() + JOB_EVENTS_TIMEOUT
+        while time.time() < deadline:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Job not found"}\n\n'
+                return
+            payload = json.dumps(job)
+            if payload != last:
+                yield f'data: {payload}\n\n'
+                last = payload
+            if job['status'] in FINISHED:
+                return
+            time.sleep(0.5)
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    global exam_session
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -383,148 +821,52 @@ def upload_file():
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
+        # Large files are extracted in the background
+        if use_background_job(filepath):
+            job_id = start_extraction_job(filepath, filename, 'exam')
+            return jsonify({'message': 'Extraction started', 'filename': filename, 'job_id': job_id,
+                            'status_url': url_for('job_status', job_id=job_id)}), 202
         # Extraction logic
         try:
             extracted_data = extract_questions(filepath)
-            print(f"Successfully extracted {len(extracted_data)} questions")
-            # Store in session for exam page
-            exam_session = {'questions': extracted_data, 'answers': {}}
-            return jsonify({'message': 'File uploaded successfully', 'filename': filename, 'questions': extracted_data}), 200
+            logger.info("Extracted %d questions from %s", len(extracted_data), filename)
+            # Store in the shared exam session store for the exam page
+            exam_id = load_exam(extracted_data)
+            session['exam_id'] = exam_id
+            return jsonify({'message': 'File uploaded successfully', 'filename': filename, 'exam_id': exam_id, 'questions': extracted_data}), 200
         except Exception as e:
-            print(f"ERROR during extraction: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Extraction failed for %s: %s", filename, e)
             return jsonify({'error': f'Extraction failed: {str(e)}'}), 500
     else:
         return jsonify({'error': 'Invalid file type'}), 400
 
+# Extraction cache: same file bytes + same parser code => no re-parse
+EXTRACTION_CACHE_DIR = os.environ.get('EXTRACTION_CACHE_DIR', os.path.join(APP_DIR, 'extraction_cache'))
+EXTRACTION_CACHE_MEMORY_MB = int(os.environ.get('EXTRACTION_CACHE_MEMORY_MB', '64'))
+EXTRACTOR_VERSION = code_fingerprint(question_parser, docx_reader)
+extraction_cache = ExtractionCache(
+    EXTRACTION_CACHE_DIR, EXTRACTOR_VERSION, max_memory_bytes=EXTRACTION_CACHE_MEMORY_MB * 1024 * 1024
+)
+
+@metrics.timed('parse_document')
+def parse_document(filepath):
+    return question_parser.extract_questions_from_file(filepath)
+
+@metrics.timed('extract_questions')
 def extract_questions(filepath):
-    import re
-    
-    # Read file
-    if filepath.endswith('.docx'):
-        from docx import Document
-        doc = Document(filepath)
-        text = '\n'.join([para.text for para in doc.paragraphs])
-    elif filepath.endswith('.txt'):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            text = f.read()
-    else:
-        return []
-    
-    # Normalize line endings
-    text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
-    
-    # Find all Answer: positions
-    answer_matches = list(re.finditer(r'Answer\s*[\:\-]\s*', text, re.IGNORECASE))
-    
-    if not answer_matches:
-        return []
-    
-    processed = []
-    
-    for idx, ans_match in enumerate(answer_matches):
-        # Extract the answer text
-        answer_start_pos = ans_match.end()
-        
-        # Answer ends at the next newline or start of next answer
-        next_answer_start = answer_matches[idx + 1].start() if idx + 1 < len(answer_matches) else len(text)
-        answer_text = text[answer_start_pos:next_answer_start].split('\n')[0].strip()
-        
-        # Now find the question text
-        # Question starts after the PREVIOUS answer ends
-        if idx > 0:
-            q_start_pos = answer_matches[idx - 1].end()
-            # Skip to after first newline to avoid picking up previous answer
-            q_start_pos = text.find('\n', q_start_pos) + 1
-        else:
-            q_start_pos = 0
-        
-        q_end_pos = ans_match.start()
-        q_block = text[q_start_pos:q_end_pos].strip()
-        
-        if not q_block or len(q_block) < 3:
-            continue
-        
-        q_id = idx + 1
-        print(f"Q{q_id}: {q_block[:70].replace(chr(10), ' ')}...")
-        
-        # ===== MCQ DETECTION =====
-        mcq_pattern = r'^([A-D][\.\)]\s+.+?)$'
-        mcq_lines = re.findall(mcq_pattern, q_block, re.MULTILINE)
-        
-        if len(mcq_lines) >= 2:
-            print(f"  Type: MCQ ({len(mcq_lines)} options)")
-            
-            # Extract options text
-            options_text = []
-            for line in mcq_lines:
-                opt_text = re.sub(r'^[A-D][\.\)]\s+', '', line).strip()
-                options_text.append(opt_text)
-            
-            # Find answer letter
-            ans_match_letter = re.search(r'^([A-D])', answer_text, re.I)
-            answer_letter = ans_match_letter.group(1).upper() if ans_match_letter else None
-            
-            # Map letter to option text
-            correct_answer = answer_letter
-            if answer_letter:
-                idx_letter = ord(answer_letter) - ord('A')
-                if 0 <= idx_letter < len(options_text):
-                    correct_answer = options_text[idx_letter]
-            
-            processed.append({
-                'id': q_id,
-                'question': q_block,
-                'type': 'mcq',
-                'options': options_text,
-                'correct_answer': correct_answer
-            })
-        
-        # ===== TRUE/FALSE DETECTION =====
-        elif re.search(r'True or False', q_block, re.I):
-            print(f"  Type: True/False")
-            
-            correct_answer = answer_text if answer_text in ['True', 'False'] else 'True'
-            
-            processed.append({
-                'id': q_id,
-                'question': q_block,
-                'type': 'true_false',
-                'correct_answer': correct_answer
-            })
-        
-        # ===== FILL-IN-THE-BLANK DETECTION =====
-        elif '__' in q_block or '_____' in q_block or '________' in q_block or re.search(r'_+', q_block):
-            print(f"  Type: Fill-blank")
-            
-            processed.append({
-                'id': q_id,
-                'question': q_block,
-                'type': 'fill_blank',
-                'correct_answer': answer_text
-            })
-        
-        # ===== DESCRIPTIVE/SHORT ANSWER =====
-        else:
-            print(f"  Type: Descriptive/SQL")
-            
-            processed.append({
-                'id': q_id,
-                'question': q_block,
-                'type': 'descriptive',
-                'correct_answer': answer_text
-            })
-    
-    print(f"\n✓ Total extracted: {len(processed)} questions\n")
-    return processed
+    return extraction_cache.get_or_extract(filepath, parse_document)
+
+# Prometheus metrics, added up across all workers
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/clear_results', methods=['POST'])
 def clear_results():
-    import os
-    results_path = os.path.join(os.path.dirname(__file__), 'exam_results.json')
-    with open(results_path, 'w', encoding='utf-8') as f:
-        f.write('[]')
+    results_store.clear()
+    results_archive.clear()
     return redirect(url_for('results_page'))
 
 if __name__ == '__main__':
@@ -0,0 +1,79 @@
+"""
+Benchmark the single-pass question parser against the original
+regex-based extract_questions on synthetic question banks.
+
+    python -m benchmarks.bench_parser --sizes 1000 10000 50000
+
+The legacy parser prints a line per question; its output is discarded so
+only parsing time is compared (add --with-prints to include it).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.legacy_parser import legacy_parse_text
+from benchmarks.synthetic import question_bank_text
+from question_parser import parse_text
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes, repeat, with_prints):
+    rows = []
+    for size in sizes:
+        text = question_bank_text(size)
+
+        def legacy():
+            if with_prints:
+                return legacy_parse_text(text)
+            with contextlib.redirect_stdout(io.StringIO()):
+                return legacy_parse_text(text)
+
+        legacy_time = best_of(legacy, repeat)
+        new_time = best_of(lambda: parse_text(text), repeat)
+        rows.append({
+            'questions': size,
+            'chars': len(text),
+            'legacy_seconds': round(legacy_time, 4),
+            'single_pass_seconds': round(new_time, 4),
+            'speedup': round(legacy_time / new_time, 2) if new_time else None,
+            'questions_per_second': round(size / new_time) if new_time else None,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--with-prints', action='store_true', help="don't discard the legacy parser's prints")
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    rows = run(args.sizes, args.repeat, args.with_prints)
+    print(f"{'questions':>10} {'legacy s':>10} {'single-pass s':>14} {'speedup':>8} {'q/s':>10}")
+    for r in rows:
+        print(f"{r['questions']:>10} {r['legacy_seconds']:>10} {r['single_pass_seconds']:>14} "
+              f"{r['speedup']:>8} {r['questions_per_second']:>10}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
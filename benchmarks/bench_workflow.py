@@ -0,0 +1,251 @@
+"""
+Benchmark the exam workflow on synthetic data.
+
+    python -m benchmarks.bench_workflow --json bench.json
+    python -m benchmarks.bench_workflow --only extract --sizes 1000 20000
+
+Sections:
+  extract     extract_questions throughput and peak memory for .txt and
+              .docx banks, parsed from scratch and served from the cache
+  similarity  calculate_similarity per answer, and ExamScorer per submission
+  submit      /exam/submit acknowledgement latency by exam size, how
+              long the writer takes to store the whole burst, and the
+              grading memo's hit rate so far
+  library     /library/list latency as the library grows
+  results     /results/query and /results/analytics latency as results grow
+
+Everything runs against a temporary data folder (see harness.py), so the
+real library and results are never touched.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.harness import latency_summary, load_app, logged_in_client, run_info, timed_calls
+from benchmarks.synthetic import answers_for, parse_mix, question_bank_text, write_docx, write_txt
+
+SECTIONS = ('extract', 'similarity', 'submit', 'library', 'results')
+
+
+def synthetic_questions(question_parser, count, mix, seed=0):
+    return question_parser.parse_text(question_bank_text(count, mix, seed))
+
+
+def bench_extract(app, workdir, args):
+    import question_parser
+    rows = []
+    for fmt, writer in (('txt', write_txt), ('docx', write_docx)):
+        for size in args.sizes:
+            path = os.path.join(workdir, f'bank-{size}.{fmt}')
+            writer(path, size, args.mix)
+            parse = lambda: question_parser.extract_questions_from_file(path)
+            count = len(parse())
+            best = min(timed_calls(parse, args.repeat))
+
+            tracemalloc.start()
+            parse()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            cold = timed_calls(lambda: app.extract_questions(path), 1)[0]  # parse + cache write
+            warm = min(timed_calls(lambda: app.extract_questions(path), args.repeat))
+            rows.append({
+                'format': fmt,
+                'questions': count,
+                'file_bytes': os.path.getsize(path),
+                'parse_seconds': round(best, 4),
+                'questions_per_second': round(count / best) if best else None,
+                'peak_memory_mb': round(peak / 2 ** 20, 2),
+                'cache_cold_seconds': round(cold, 4),
+                'cache_warm_seconds': round(warm, 6),
+            })
+            print(f"  extract {fmt:>4} {count:>7} questions: {best:.3f}s "
+                  f"({rows[-1]['questions_per_second']} q/s), peak {rows[-1]['peak_memory_mb']} MB")
+    return rows
+
+
+def bench_similarity(app, args):
+    import question_parser
+    from scoring import ExamScorer
+    rng = random.Random(args.seed)
+    questions = synthetic_questions(question_parser, 500, args.mix, args.seed)
+    submissions = [answers_for(questions, rng) for _ in range(20)]
+
+    pairs = [(answers.get(f"q{q['id']}", ''), q.get('correct_answer') or '')
+             for answers in submissions for q in questions]
+    durations = []
+    for user_answer, correct in pairs:
+        start = time.perf_counter()
+        app.calculate_similarity(user_answer, correct)
+        durations.append(time.perf_counter() - start)
+
+    scorer = ExamScorer(questions)
+    per_submission = [timed_calls(lambda: scorer.score(answers), 1)[0] for answers in submissions]
+    result = {
+        'calculate_similarity_per_answer': latency_summary(durations),
+        'exam_scorer_per_submission': dict(latency_summary(per_submission), questions=len(questions)),
+    }
+    print(f"  calculate_similarity p50 {result['calculate_similarity_per_answer']['p50_ms']} ms, "
+          f"ExamScorer {len(questions)} questions p50 {result['exam_scorer_per_submission']['p50_ms']} ms")
+    return result
+
+
+def bench_submit(app, client, args):
+    import question_parser
+    rng = random.Random(args.seed)
+    rows = []
+    for size in args.exam_sizes:
+        questions = synthetic_questions(question_parser, size, args.mix, args.seed)
+        exam_id = app.load_exam(questions)
+        durations = []
+        burst_started = time.perf_counter()
+        for _ in range(args.repeat * 10):
+            payload = {'exam_id': exam_id, 'answers': answers_for(questions, rng), 'student_name': 'bench'}
+            start = time.perf_counter()
+            response = client.post('/exam/submit', json=payload)
+            durations.append(time.perf_counter() - start)
+            assert response.status_code == 202, response.get_data(as_text=True)
+        # Receipts are committed in order, so the last one being done means all are
+        status_url = response.get_json()['status_url']
+        while client.get(status_url).status_code == 202:
+            time.sleep(0.005)
+        stored = time.perf_counter() - burst_started
+        rows.append(dict(latency_summary(durations), questions=size, burst_stored_seconds=round(stored, 4)))
+        if app.grading_memo is not None:
+            memo = app.grading_memo.stats()
+            rows[-1]['grading_memo'] = {name: memo[name] for name in ('hits', 'misses', 'entries', 'hit_rate')}
+        print(f"  submit {size:>5} questions: ack p50 {rows[-1]['p50_ms']} ms, p95 {rows[-1]['p95_ms']} ms, "
+              f"{len(durations)} stored after {stored:.3f}s")
+    return rows
+
+
+def bench_library(app, client, args):
+    import question_parser
+    rows = []
+    stored = 0
+    for target in args.library_sizes:
+        while stored < target:
+            questions = synthetic_questions(question_parser, args.questions_per_doc, args.mix, seed=stored)
+            app.save_library_meta(f'bench-{stored:05d}.txt', questions)
+            stored += 1
+        # A new worker (or one that just saw many uploads) re-reads changed metadata first
+        fresh = app.LibraryIndex(app.LIBRARY_META_FOLDER)
+        cold = timed_calls(fresh.summaries, 1)[0]
+        warm = timed_calls(lambda: client.get('/library/list'), args.repeat * 10)
+        rows.append({'documents': target, 'cold_catalog_seconds': round(cold, 4),
+                     'list': latency_summary(warm)})
+        print(f"  library_list {target:>5} docs: p50 {rows[-1]['list']['p50_ms']} ms (cold catalog {cold:.3f}s)")
+    return rows
+
+
+def bench_results(app, client, args):
+    import question_parser
+    rng = random.Random(args.seed)
+    questions = synthetic_questions(question_parser, 20, args.mix, args.seed)
+    exam_id = app.load_exam(questions)
+    key = app.answer_keys.latest(exam_id)
+    scorer = app.answer_keys.scorer(key)
+    start_time = datetime(2025, 1, 1)
+
+    rows = []
+    stored = app.results_store.count()
+    for target in args.results_sizes:
+        batch = []
+        while stored < target:
+            answers = answers_for(questions, rng)
+            score = scorer.score(answers)
+            batch.append({
+                'score': score, 'total': scorer.total, 'percentage': round(score / scorer.total * 100, 2),
+                'timestamp': (start_time + timedelta(seconds=stored * 30)).isoformat(),
+                'student_name': f'student {rng.randrange(5000):04d}',
+                'exam_id': exam_id, 'key_version': key.version, 'answers': answers,
+            })
+            stored += 1
+            if len(batch) == 5000:
+                app.results_store.append_many(batch)
+                batch = []
+        if batch:
+            app.results_store.append_many(batch)
+
+        first_page = timed_calls(lambda: client.get('/results/query?limit=50'), args.repeat * 5)
+        by_name = timed_calls(lambda: client.get('/results/query?limit=50&student_name=student 12'),
+                              args.repeat * 5)
+
+        def deep_pages():
+            cursor = None
+            for _ in range(20):
+                url = '/results/query?limit=50' + (f'&cursor={cursor}' if cursor else '')
+                cursor = client.get(url).get_json()['next_cursor']
+                if not cursor:
+                    break
+        deep = timed_calls(deep_pages, args.repeat)
+        analytics = timed_calls(lambda: client.get('/results/analytics'), args.repeat)
+        rows.append({
+            'results': target,
+            'query_first_page': latency_summary(first_page),
+            'query_by_student': latency_summary(by_name),
+            'query_20_pages': latency_summary(deep),
+            'analytics': latency_summary(analytics),
+        })
+        print(f"  results {target:>6}: first page p50 {rows[-1]['query_first_page']['p50_ms']} ms, "
+              f"20 pages p50 {rows[-1]['query_20_pages']['p50_ms']} ms, "
+              f"analytics p50 {rows[-1]['analytics']['p50_ms']} ms")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--only', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='question bank sizes for the extract section')
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help='question type mix, e.g. mcq=0.5,true_false=0.3,descriptive=0.2')
+    parser.add_argument('--exam-sizes', type=int, nargs='+', default=[20, 100, 500])
+    parser.add_argument('--library-sizes', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--questions-per-doc', type=int, default=50)
+    parser.add_argument('--results-sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='keep the generated data here instead of a temporary folder')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='keeplearning-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        app = load_app(workdir)
+        client = logged_in_client(app)
+        report = {'run': run_info(args)}
+        for section in SECTIONS:
+            if section not in args.only:
+                continue
+            print(f"{section}:")
+            if section == 'extract':
+                report[section] = bench_extract(app, workdir, args)
+            elif section == 'similarity':
+                report[section] = bench_similarity(app, args)
+            elif section == 'submit':
+                report[section] = bench_submit(app, client, args)
+            elif section == 'library':
+                report[section] = bench_library(app, client, args)
+            else:
+                report[section] = bench_results(app, client, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
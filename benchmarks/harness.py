@@ -0,0 +1,110 @@
+"""
+Shared helpers for the workflow benchmarks and the load generator.
+
+load_app() points every data folder and database the app uses at a
+throw-away work directory before importing it, so benchmarks never touch
+the real library or results.
+"""
+
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Environment variable -> path inside the work directory
+DATA_PATHS = {
+    'RESULTS_DB': 'exam_results.db',
+    'RESULTS_FILE': 'exam_results.json',
+    'RESULTS_ARCHIVE_DIR': 'results_archive',
+    'EXAM_SESSION_DB': 'exam_sessions.db',
+    'SUBMISSION_JOURNAL_DIR': 'submission_journal',
+    'JOBS_DB': 'jobs.db',
+    'LIBRARY_FOLDER': 'library_docs',
+    'LIBRARY_SEARCH_DB': 'library_search.db',
+    'UPLOAD_FOLDER': 'uploads',
+    'EXTRACTION_CACHE_DIR': 'extraction_cache',
+    'METRICS_DIR': 'metrics',
+    'PROFILE_DIR': 'profiles',
+}
+
+
+# Benchmarks send many requests from one session; per-session rate limits would turn them into 429s
+BENCH_SETTINGS = {'RATE_LIMIT_ENABLED': '0'}
+
+
+def data_env(workdir):
+    """Environment variables that keep all of the app's data inside workdir, with rate limits off."""
+    env = {name: os.path.join(workdir, path) for name, path in DATA_PATHS.items()}
+    env.update(BENCH_SETTINGS)
+    return env
+
+
+def load_app(workdir):
+    """Import app with its data in workdir. Must run before anything else imports app."""
+    if 'app' in sys.modules:
+        raise RuntimeError('app was already imported with its real data folders')
+    os.environ.update(data_env(workdir))
+    import app
+    return app
+
+
+def logged_in_client(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+    return client
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(seconds):
+    """Mean and percentiles of a list of durations, in milliseconds."""
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        'count': len(values),
+        'mean_ms': ms(sum(values) / len(values)),
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]),
+    }
+
+
+def timed_calls(func, repeat):
+    """Call func repeat times and return the list of durations."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_info(args):
+    """Context recorded next to every benchmark run, for comparing runs over time."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'started_at': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+    }
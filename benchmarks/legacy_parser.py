@@ -0,0 +1,116 @@
+"""
+The original regex-based extract_questions, kept only so the benchmark can
+compare the single-pass parser against it. Takes the document text instead
+of a file path; otherwise unchanged, including the per-question prints.
+"""
+
+
+def legacy_parse_text(text):
+    import re
+    
+    # Normalize line endings
+    text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
+    
+    # Find all Answer: positions
+    answer_matches = list(re.finditer(r'Answer\s*[\:\-]\s*', text, re.IGNORECASE))
+    
+    if not answer_matches:
+        return []
+    
+    processed = []
+    
+    for idx, ans_match in enumerate(answer_matches):
+        # Extract the answer text
+        answer_start_pos = ans_match.end()
+        
+        # Answer ends at the next newline or start of next answer
+        next_answer_start = answer_matches[idx + 1].start() if idx + 1 < len(answer_matches) else len(text)
+        answer_text = text[answer_start_pos:next_answer_start].split('\n')[0].strip()
+        
+        # Now find the question text
+        # Question starts after the PREVIOUS answer ends
+        if idx > 0:
+            q_start_pos = answer_matches[idx - 1].end()
+            # Skip to after first newline to avoid picking up previous answer
+            q_start_pos = text.find('\n', q_start_pos) + 1
+        else:
+            q_start_pos = 0
+        
+        q_end_pos = ans_match.start()
+        q_block = text[q_start_pos:q_end_pos].strip()
+        
+        if not q_block or len(q_block) < 3:
+            continue
+        
+        q_id = idx + 1
+        print(f"Q{q_id}: {q_block[:70].replace(chr(10), ' ')}...")
+        
+        # ===== MCQ DETECTION =====
+        mcq_pattern = r'^([A-D][\.\)]\s+.+?)$'
+        mcq_lines = re.findall(mcq_pattern, q_block, re.MULTILINE)
+        
+        if len(mcq_lines) >= 2:
+            print(f"  Type: MCQ ({len(mcq_lines)} options)")
+            
+            # Extract options text
+            options_text = []
+            for line in mcq_lines:
+                opt_text = re.sub(r'^[A-D][\.\)]\s+', '', line).strip()
+                options_text.append(opt_text)
+            
+            # Find answer letter
+            ans_match_letter = re.search(r'^([A-D])', answer_text, re.I)
+            answer_letter = ans_match_letter.group(1).upper() if ans_match_letter else None
+            
+            # Map letter to option text
+            correct_answer = answer_letter
+            if answer_letter:
+                idx_letter = ord(answer_letter) - ord('A')
+                if 0 <= idx_letter < len(options_text):
+                    correct_answer = options_text[idx_letter]
+            
+            processed.append({
+                'id': q_id,
+                'question': q_block,
+                'type': 'mcq',
+                'options': options_text,
+                'correct_answer': correct_answer
+            })
+        
+        # ===== TRUE/FALSE DETECTION =====
+        elif re.search(r'True or False', q_block, re.I):
+            print(f"  Type: True/False")
+            
+            correct_answer = answer_text if answer_text in ['True', 'False'] else 'True'
+            
+            processed.append({
+                'id': q_id,
+                'question': q_block,
+                'type': 'true_false',
+                'correct_answer': correct_answer
+            })
+        
+        # ===== FILL-IN-THE-BLANK DETECTION =====
+        elif '__' in q_block or '_____' in q_block or '________' in q_block or re.search(r'_+', q_block):
+            print(f"  Type: Fill-blank")
+            
+            processed.append({
+                'id': q_id,
+                'question': q_block,
+                'type': 'fill_blank',
+                'correct_answer': answer_text
+            })
+        
+        # ===== DESCRIPTIVE/SHORT ANSWER =====
+        else:
+            print(f"  Type: Descriptive/SQL")
+            
+            processed.append({
+                'id': q_id,
+                'question': q_block,
+                'type': 'descriptive',
+                'correct_answer': answer_text
+            })
+    
+    print(f"\n✓ Total extracted: {len(processed)} questions\n")
+    return processed
@@ -0,0 +1,236 @@
+"""
+Local load generator for exam submissions.
+
+    python -m benchmarks.load_generator --clients 16 --duration 20
+    python -m benchmarks.load_generator --gunicorn 4 --clients 32 --json load.json
+    python -m benchmarks.load_generator --url http://127.0.0.1:8000 --clients 32
+
+Each virtual client loops: submit a synthetic set of answers to one shared
+exam, optionally mixed with results-page reads (--read-ratio), until the
+duration is up. Without --url/--gunicorn the app runs in this process and
+clients use Flask's test client from threads; --gunicorn starts a local
+gunicorn with that many gthread workers (--threads each) on a temporary
+data folder.
+"""
+
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from benchmarks.harness import ROOT, data_env, latency_summary, load_app, logged_in_client, run_info
+from benchmarks.synthetic import answers_for, parse_mix, write_txt
+
+USERNAME = 'keeplearninghub'
+PASSWORD = 'keepsleeping'
+
+
+class InProcessSession:
+    """Runs requests against the in-process app."""
+
+    def __init__(self, app_module):
+        self.client = logged_in_client(app_module)
+
+    def request(self, method, path, json_body=None):
+        response = self.client.open(path, method=method, json=json_body)
+        return response.status_code, response.get_data()
+
+
+class HttpSession:
+    """Runs requests against a server over HTTP, keeping its own session cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        status, _ = self.request('POST', '/login', {'username': USERNAME, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'Login failed with status {status}')
+
+    def request(self, method, path, json_body=None, body=None, content_type=None):
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            content_type = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            req.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def upload(self, path, filepath):
+        boundary = uuid.uuid4().hex
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        body = io.BytesIO()
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                   f'filename="{os.path.basename(filepath)}"\r\n'
+                   'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+        body.write(content)
+        body.write(f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+        return self.request('POST', path, body=body.getvalue(),
+                            content_type=f'multipart/form-data; boundary={boundary}')
+
+
+def create_exam(session_factory, workdir, args):
+    """Upload a synthetic question bank as the exam; return (exam_id, questions)."""
+    path = os.path.join(workdir, 'load-test-exam.txt')
+    write_txt(path, args.questions, args.mix, args.seed)
+    session = session_factory()
+    if isinstance(session, HttpSession):
+        status, body = session.upload('/upload', path)
+        if status != 200:
+            raise RuntimeError(f'Exam upload failed with status {status}: {body[:200]!r}')
+        data = json.loads(body)
+        return data['exam_id'], data['questions']
+    with open(path, 'rb') as f:
+        response = session.client.post('/upload', data={'file': (f, 'load-test-exam.txt')},
+                                       content_type='multipart/form-data')
+    data = response.get_json()
+    return data['exam_id'], data['questions']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, workdir, threads=8):
+    port = free_port()
+    env = dict(os.environ, **data_env(workdir))
+    # Same worker model as the production command in DEPLOYMENT_GUIDE.md
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-k', 'gthread', '--threads', str(threads), '-w', str(workers),
+         '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited: {process.stderr.read().decode(errors="replace")[-2000:]}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+def run_load(session_factory, exam_id, questions, args):
+    deadline = time.monotonic() + args.duration
+    samples = {'submit': [], 'results_query': []}
+    statuses = {}
+    lock = threading.Lock()
+
+    def client_loop(index):
+        rng = random.Random(args.seed * 1000 + index)
+        session = session_factory()
+        local = {'submit': [], 'results_query': []}
+        local_statuses = {}
+        while time.monotonic() < deadline:
+            if rng.random() < args.read_ratio:
+                op, method, path, body = 'results_query', 'GET', '/results/query?limit=50', None
+            else:
+                op, method, path = 'submit', 'POST', '/exam/submit'
+                body = {'exam_id': exam_id, 'answers': answers_for(questions, rng),
+                        'student_name': f'load client {index}'}
+            start = time.perf_counter()
+            status, _ = session.request(method, path, body)
+            local[op].append(time.perf_counter() - start)
+            local_statuses[f'{op} {status}'] = local_statuses.get(f'{op} {status}', 0) + 1
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000)
+        with lock:
+            for op, values in local.items():
+                samples[op].extend(values)
+            for key, count in local_statuses.items():
+                statuses[key] = statuses.get(key, 0) + count
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in samples.values())
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': total,
+        'requests_per_second': round(total / elapsed, 1) if elapsed else None,
+        'submissions_per_second': round(len(samples['submit']) / elapsed, 1) if elapsed else None,
+        'statuses': statuses,
+        'latency': {op: latency_summary(values) for op, values in samples.items() if values},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='drive an already running server')
+    target.add_argument('--gunicorn', type=int, metavar='WORKERS', help='start a local gunicorn with this many workers')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--questions', type=int, default=50, help='questions in the exam')
+    parser.add_argument('--mix', type=parse_mix, default=None)
+    parser.add_argument('--read-ratio', type=float, default=0.0, help='share of requests that load the results page')
+    parser.add_argument('--think-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='keeplearning-load-')
+    server = None
+    try:
+        if args.url or args.gunicorn:
+            url = args.url
+            if args.gunicorn:
+                server, url = start_gunicorn(args.gunicorn, workdir, args.threads)
+            session_factory = lambda: HttpSession(url)
+            mode = 'http'
+        else:
+            app_module = load_app(workdir)
+            session_factory = lambda: InProcessSession(app_module)
+            mode = 'test_client'
+
+        exam_id, questions = create_exam(session_factory, workdir, args)
+        print(f"Exam {exam_id} with {len(questions)} questions; {args.clients} clients for {args.duration}s ({mode})")
+        report = {'run': run_info(args), 'mode': mode, 'load': run_load(session_factory, exam_id, questions, args)}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    load = report['load']
+    print(f"{load['requests']} requests in {load['elapsed_seconds']}s: {load['requests_per_second']} req/s, "
+          f"{load['submissions_per_second']} submissions/s")
+    for op, summary in load['latency'].items():
+        print(f"  {op:>14}: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+    print(f"  statuses: {load['statuses']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
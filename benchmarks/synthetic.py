@@ -0,0 +1,91 @@
+"""
+Synthetic question banks for the benchmarks.
+
+Generates documents in the same layout instructors upload: question text,
+options for MCQs, then an "Answer: ..." line.
+"""
+
+import random
+
+WORDS = (
+    'table column index query cloud server network python function class '
+    'object record schema client employee task primary foreign key value '
+    'storage compute region latency cache thread process module package'
+).split()
+
+DEFAULT_MIX = {'mcq': 0.4, 'paren_mcq': 0.1, 'true_false': 0.2, 'fill_blank': 0.15, 'descriptive': 0.15}
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def question_lines(q_type, rng):
+    """Return the lines of one question of the given type."""
+    if q_type == 'mcq':
+        options = [_sentence(rng, 2) for _ in range(4)]
+        return ([f'Which of the following describes {_sentence(rng, 4).lower()}?'] +
+                [f'{letter}. {opt}' for letter, opt in zip('ABCD', options)] +
+                [f'Answer: {rng.choice("ABCD")}'])
+    if q_type == 'paren_mcq':
+        options = [_sentence(rng, 2) for _ in range(4)]
+        return ([f'Which of the following is a {_sentence(rng, 3).lower()}?'] +
+                [f'({letter}) {opt}' for letter, opt in zip('abcd', options)] +
+                [f'Answer: {rng.choice(options)}'])
+    if q_type == 'true_false':
+        return [f'True or False: {_sentence(rng, 8)}.', f'Answer: {rng.choice(["True", "False"])}']
+    if q_type == 'fill_blank':
+        return [f'{_sentence(rng, 6)} is called __________.', f'Answer: {_sentence(rng, 1)}']
+    return [f'Explain {_sentence(rng, 6).lower()}.', f'Answer: {_sentence(rng, 20)}.']
+
+
+def question_bank_lines(count, mix=None, seed=0):
+    """Yield the lines of a bank of `count` questions with the given type mix."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    types = list(mix)
+    weights = [mix[t] for t in types]
+    for _ in range(count):
+        yield from question_lines(rng.choices(types, weights)[0], rng)
+
+
+def question_bank_text(count, mix=None, seed=0):
+    return '\n'.join(question_bank_lines(count, mix, seed))
+
+
+def write_txt(path, count, mix=None, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in question_bank_lines(count, mix, seed):
+            f.write(line + '\n')
+
+
+def write_docx(path, count, mix=None, seed=0):
+    from docx import Document
+    doc = Document()
+    for line in question_bank_lines(count, mix, seed):
+        doc.add_paragraph(line)
+    doc.save(path)
+
+
+def parse_mix(text):
+    """Parse a --mix argument like 'mcq=0.5,true_false=0.3,descriptive=0.2'."""
+    mix = {}
+    for part in text.split(','):
+        q_type, _, weight = part.partition('=')
+        if q_type.strip() not in DEFAULT_MIX:
+            raise ValueError(f'Unknown question type in mix: {q_type}')
+        mix[q_type.strip()] = float(weight or 1)
+    return mix
+
+
+def answers_for(questions, rng, correct_rate=0.6):
+    """A plausible submission: correct answers for about correct_rate of the questions."""
+    answers = {}
+    for q in questions:
+        if rng.random() < correct_rate:
+            answers[f"q{q['id']}"] = q.get('correct_answer') or ''
+        elif q.get('options'):
+            answers[f"q{q['id']}"] = rng.choice(q['options'])
+        else:
+            answers[f"q{q['id']}"] = _sentence(rng, rng.randint(1, 12))
+    return answers
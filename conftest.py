@@ -0,0 +1,71 @@
+"""
+Shared test fixtures. Everything they create lives under pytest's tmp_path,
+so tests never touch the databases and folders next to the app.
+"""
+
+import pytest
+
+from answer_keys import AnswerKeyRegistry
+from benchmarks.harness import load_app
+from results_store import ResultsStore
+
+# A script that prints what the sample document extracts to; run it by hand.
+# Collecting it would import app with its real data folders.
+collect_ignore = ['test_extraction.py']
+
+EXAM_A = [
+    {'id': 1, 'type': 'mcq', 'question': 'Capital of France?', 'correct_answer': 'Paris'},
+    {'id': 2, 'type': 'true_false', 'question': 'Water is wet.', 'correct_answer': 'True'},
+]
+EXAM_B = [
+    {'id': 1, 'type': 'mcq', 'question': '2 + 2?', 'correct_answer': '4'},
+]
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The app, imported once with all of its databases and folders in a temp directory."""
+    return load_app(str(tmp_path_factory.mktemp('app')))
+
+
+@pytest.fixture
+def results_db(tmp_path):
+    return str(tmp_path / 'results.db')
+
+
+@pytest.fixture
+def store(results_db):
+    return ResultsStore(results_db)
+
+
+@pytest.fixture
+def answer_keys(results_db):
+    return AnswerKeyRegistry(results_db)
+
+
+@pytest.fixture
+def exam_keys(answer_keys):
+    """The current answer keys of two registered exams, by exam ID."""
+    return {'exam-a': answer_keys.register('exam-a', EXAM_A), 'exam-b': answer_keys.register('exam-b', EXAM_B)}
+
+
+@pytest.fixture
+def make_result(answer_keys):
+    """Build a result record scored against a key, as the submission pipeline stores it."""
+    def make(key, answers, name='Student', timestamp='2026-03-01T09:00:00'):
+        scorer = answer_keys.scorer(key)
+        score = scorer.score(answers)
+        return {
+            'timestamp': timestamp,
+            'student_name': name,
+            'score': score,
+            'total': scorer.total,
+            'percentage': round(score / scorer.total * 100, 2),
+            'started_at': None,
+            'submitted_at': None,
+            'exam_id': key.exam_id,
+            'key_version': key.version,
+            'answers': answers,
+            'receipt_id': f'r-{name}',
+        }
+    return make
@@ -0,0 +1,62 @@
+"""
+Small SQLite helpers shared by the on-disk stores.
+
+Every gunicorn worker (and every thread inside it) gets its own connection,
+so the stores can be used from any request without extra locking. SQLite in
+WAL mode handles the cross-process part for us.
+"""
+
+import os
+import sqlite3
+import threading
+
+_local = threading.local()
+
+
+def get_connection(db_path, synchronous='NORMAL'):
+    """
+    Return a per-thread, per-process connection to db_path.
+    Connections are opened in autocommit mode; callers that need a
+    transaction should use `with transaction(conn):`.
+
+    The synchronous level is a property of the connection, so each level
+    gets its own: a store that asked for FULL never ends up writing through
+    a NORMAL connection another store opened first. Pass the connection
+    along (conn=...) to write inside another store's transaction.
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    # Key on the pid too so a connection opened before a fork is never reused
+    key = (os.getpid(), db_path, synchronous)
+    conn = conns.get(key)
+    if conn is None:
+        folder = os.path.dirname(db_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={synchronous}')
+        conn.execute('PRAGMA busy_timeout=30000')
+        conns[key] = conn
+    return conn
+
+
+class transaction:
+    """Context manager that runs a block inside BEGIN IMMEDIATE ... COMMIT."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
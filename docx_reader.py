@@ -0,0 +1,94 @@
+"""
+Streaming .docx reader.
+
+python-docx loads the whole document into an lxml tree before we can read
+a single paragraph. iter_paragraphs() instead reads word/document.xml
+straight out of the zip with iterparse and yields one paragraph's text at a
+time, clearing each element once it has been read, so memory stays flat
+however large the question bank is.
+
+The text of each paragraph matches python-docx's `Paragraph.text`, and
+like `Document.paragraphs` only top-level body paragraphs are returned
+(paragraphs inside tables and text boxes are skipped).
+"""
+
+import posixpath
+import zipfile
+
+from lxml import etree
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W_NS + 'body'
+W_P = W_NS + 'p'
+W_R = W_NS + 'r'
+W_HYPERLINK = W_NS + 'hyperlink'
+W_T = W_NS + 't'
+W_TAB = W_NS + 'tab'
+W_PTAB = W_NS + 'ptab'
+W_BR = W_NS + 'br'
+W_CR = W_NS + 'cr'
+W_NO_BREAK_HYPHEN = W_NS + 'noBreakHyphen'
+W_TYPE = W_NS + 'type'
+
+RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+
+def _main_document_part(zf):
+    """Find the main document part from the package relationships."""
+    try:
+        rels = etree.fromstring(zf.read('_rels/.rels'))
+        for rel in rels.iter(RELS_NS + 'Relationship'):
+            if rel.get('Type') == OFFICE_DOCUMENT_REL:
+                return posixpath.normpath(rel.get('Target').lstrip('/'))
+    except (KeyError, etree.XMLSyntaxError):
+        pass
+    return 'word/document.xml'
+
+
+def _run_text(run):
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or '')
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append('\t')
+        elif tag == W_BR:
+            if child.get(W_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif tag == W_CR:
+            parts.append('\n')
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append('-')
+    return ''.join(parts)
+
+
+def paragraph_text(p):
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return ''.join(parts)
+
+
+def iter_paragraphs(filepath):
+    """Yield the text of each top-level paragraph in a .docx file."""
+    with zipfile.ZipFile(filepath) as zf:
+        with zf.open(_main_document_part(zf)) as xml_file:
+            context = etree.iterparse(xml_file, events=('end',), tag=W_P,
+                                      resolve_entities=False, no_network=True)
+            for _, p in context:
+                parent = p.getparent()
+                if parent is not None and parent.tag == W_BODY:
+                    yield paragraph_text(p)
+                    # Drop this paragraph and everything before it in the body
+                    p.clear()
+                    while p.getprevious() is not None:
+                        del parent[0]
+                # Nested paragraphs (tables, text boxes) are not part of
+                # Document.paragraphs; they go when their body-level ancestor
+                # is dropped
+            del context
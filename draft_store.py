@@ -0,0 +1,287 @@
+"""
+Autosaved exam drafts.
+
+exam.html posts only the answers that changed since the last autosave,
+tagged with a sequence number, to /exam/draft. Each worker applies the
+deltas to an in-memory copy of the draft and a background thread writes
+every changed draft in one transaction per DRAFT_FLUSH_INTERVAL, one row
+per draft overwritten in place. So a hundred students typing at once cost
+one small write every couple of seconds per worker, not a write per
+keystroke.
+
+Sequence numbers keep this safe across workers and retries:
+  - a delta whose seq is not newer than the draft's is ignored, so a
+    retried or reordered request never rolls answers back;
+  - the response carries saved_seq, the newest seq known to be on disk.
+    The browser keeps re-sending a change until saved_seq covers it, and
+    sends saved_seq back as base_seq. A worker whose copy is older than
+    base_seq reloads the draft from the database before applying, so it
+    never overwrites answers another worker already saved.
+
+At submit time the draft fills in the questions missing from the posted
+answers, and is deleted. Deleting leaves a tombstone, so a worker still
+holding unsaved changes to the draft never writes it back.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exam_drafts (
+    draft_id TEXT PRIMARY KEY,
+    exam_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    answers TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_exam_drafts_updated ON exam_drafts (updated_at);
+CREATE TABLE IF NOT EXISTS discarded_drafts (
+    draft_id TEXT PRIMARY KEY,
+    discarded_at REAL NOT NULL
+);
+"""
+
+DRAFT_MAX_AGE = 7 * 24 * 3600  # drafts never submitted (and tombstones) are dropped after this
+IDLE_EVICT_SECONDS = 600  # saved drafts untouched this long leave worker memory
+PURGE_EVERY = 300  # flushes between deletions of expired drafts
+MAX_CHANGES = 500
+MAX_ANSWERS = 2000
+MAX_ANSWER_LENGTH = 5000
+MAX_KEY_LENGTH = 64
+DRAFT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class DraftError(ValueError):
+    pass
+
+
+class _Draft:
+    __slots__ = ('exam_id', 'answers', 'seq', 'saved_seq', 'dirty', 'touched')
+
+    def __init__(self, exam_id, answers=None, seq=0):
+        self.exam_id = exam_id
+        self.answers = answers or {}
+        self.seq = seq
+        self.saved_seq = seq
+        self.dirty = False
+        self.touched = time.monotonic()
+
+
+def _check_values(answers):
+    for key, value in answers.items():
+        if len(key) > MAX_KEY_LENGTH:
+            raise DraftError('Invalid question key')
+        if value is not None and (not isinstance(value, str) or len(value) > MAX_ANSWER_LENGTH):
+            raise DraftError(f'Invalid answer for {key}')
+
+
+def _check_changes(changes):
+    if not isinstance(changes, dict):
+        raise DraftError('changes must be an object of question -> answer')
+    if len(changes) > MAX_CHANGES:
+        raise DraftError(f'At most {MAX_CHANGES} changes per autosave')
+    _check_values(changes)
+
+
+def check_answers(answers):
+    """Validate a submission's answers: question -> string (or null); raises DraftError."""
+    if not isinstance(answers, dict):
+        raise DraftError('answers must be an object of question -> answer')
+    if len(answers) > MAX_ANSWERS:
+        raise DraftError('Too many answers')
+    _check_values(answers)
+
+
+class DraftStore:
+    def __init__(self, db_path, flush_interval=2.0):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def start(self):
+        """Set up this process's draft cache and flush thread (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._conn().executescript(SCHEMA)
+            self._drafts = {}  # draft_id -> _Draft
+            self._lock = threading.Lock()
+            self._flushes = 0
+            self._pid = os.getpid()
+            threading.Thread(target=self._run_flusher, name='draft-flusher', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _load(self, draft_id):
+        row = self._conn().execute(
+            'SELECT exam_id, seq, answers FROM exam_drafts WHERE draft_id = ?', (draft_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return _Draft(row['exam_id'], json.loads(row['answers']), row['seq'])
+
+    def _current(self, draft_id, base_seq=0):
+        """The draft as this worker should see it, reloading if another worker saved newer answers."""
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+        if draft is not None and draft.seq >= base_seq:
+            return draft
+        loaded = self._load(draft_id)
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+            if loaded is not None and (draft is None or loaded.seq > draft.seq):
+                self._drafts[draft_id] = draft = loaded
+            return draft
+
+    # --- Request side ---
+
+    def apply(self, draft_id, exam_id, seq, changes, base_seq=0):
+        """
+        Apply one autosave delta. draft_id None starts a new draft.
+        Returns {'draft_id', 'seq', 'saved_seq'}.
+        """
+        self.start()
+        if not isinstance(seq, int) or seq < 1 or not isinstance(base_seq, int):
+            raise DraftError('seq must be a positive integer')
+        _check_changes(changes)
+        if draft_id is None:
+            draft_id = uuid.uuid4().hex
+            draft = None
+        elif not isinstance(draft_id, str) or not DRAFT_ID_RE.match(draft_id):
+            raise DraftError('Invalid draft_id')
+        else:
+            draft = self._current(draft_id, base_seq)
+
+        with self._lock:
+            if draft is None:
+                draft = self._drafts.setdefault(draft_id, _Draft(exam_id))
+            if draft.exam_id != exam_id:
+                raise DraftError('Draft belongs to a different exam')
+            if seq > draft.seq:
+                added = sum(1 for key, value in changes.items() if value is not None and key not in draft.answers)
+                if len(draft.answers) + added > MAX_ANSWERS:
+                    raise DraftError('Too many answers')
+                for key, value in changes.items():
+                    if value is None:
+                        draft.answers.pop(key, None)
+                    else:
+                        draft.answers[key] = value
+                draft.seq = seq
+                draft.dirty = True
+            draft.touched = time.monotonic()
+            return {'draft_id': draft_id, 'seq': draft.seq, 'saved_seq': draft.saved_seq}
+
+    def get(self, draft_id):
+        """Return {'draft_id', 'exam_id', 'seq', 'answers'} or None."""
+        self.start()
+        if not isinstance(draft_id, str) or not DRAFT_ID_RE.match(draft_id):
+            return None
+        draft = self._current(draft_id)
+        if draft is None:
+            return None
+        with self._lock:
+            return {'draft_id': draft_id, 'exam_id': draft.exam_id, 'seq': draft.seq,
+                    'answers': dict(draft.answers)}
+
+    def merge(self, draft_id, exam_id, answers):
+        """Answers for the final submission: every posted answer (even an empty one), then the draft's for questions not posted."""
+        check_answers(answers)
+        draft = self.get(draft_id) if draft_id else None
+        if draft is None or draft['exam_id'] != exam_id:
+            return answers
+        merged = draft['answers']
+        merged.update(answers)
+        return merged
+
+    def discard(self, draft_id):
+        """Delete a submitted draft and leave a tombstone that every worker's flush respects."""
+        self.start()
+        with self._lock:
+            self._drafts.pop(draft_id, None)
+        with transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM exam_drafts WHERE draft_id = ?', (draft_id,))
+            conn.execute('INSERT OR REPLACE INTO discarded_drafts (draft_id, discarded_at) VALUES (?, ?)',
+                         (draft_id, time.time()))
+
+    # --- Flushing ---
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception('Could not save drafts: %s', e)
+
+    def flush(self):
+        """Write every changed draft in one transaction, except those discarded meanwhile."""
+        if self._pid != os.getpid():
+            return
+        now = time.monotonic()
+        with self._lock:
+            dirty = [(draft_id, draft, draft.seq, json.dumps(draft.answers, separators=(',', ':')))
+                     for draft_id, draft in self._drafts.items() if draft.dirty]
+            for _, draft, _, _ in dirty:
+                draft.dirty = False
+            # Saved drafts nobody has touched in a while can be reloaded if needed
+            for draft_id in [d for d, draft in self._drafts.items()
+                             if not draft.dirty and draft.saved_seq == draft.seq
+                             and now - draft.touched > IDLE_EVICT_SECONDS]:
+                del self._drafts[draft_id]
+        self._flushes += 1
+        purge = self._flushes % PURGE_EVERY == 0
+        if not dirty and not purge:
+            return
+
+        wall_now = time.time()
+        try:
+            with transaction(self._conn()) as conn:
+                # Only ever move a draft forward; another worker may have saved a newer seq,
+                # or submitted and discarded the draft
+                conn.executemany(
+                    'INSERT INTO exam_drafts (draft_id, exam_id, seq, answers, updated_at) SELECT ?, ?, ?, ?, ? '
+                    'WHERE NOT EXISTS (SELECT 1 FROM discarded_drafts WHERE draft_id = ?) '
+                    'ON CONFLICT(draft_id) DO UPDATE SET seq = excluded.seq, answers = excluded.answers, '
+                    'updated_at = excluded.updated_at WHERE excluded.seq > exam_drafts.seq',
+                    [(draft_id, draft.exam_id, seq, answers, wall_now, draft_id)
+                     for draft_id, draft, seq, answers in dirty]
+                )
+                discarded = set()
+                ids = [draft_id for draft_id, _, _, _ in dirty]
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    discarded.update(row['draft_id'] for row in conn.execute(
+                        f"SELECT draft_id FROM discarded_drafts WHERE draft_id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ))
+                if purge:
+                    conn.execute('DELETE FROM exam_drafts WHERE updated_at < ?', (wall_now - DRAFT_MAX_AGE,))
+                    conn.execute('DELETE FROM discarded_drafts WHERE discarded_at < ?', (wall_now - DRAFT_MAX_AGE,))
+        except Exception:
+            with self._lock:
+                for _, draft, _, _ in dirty:
+                    draft.dirty = True
+            raise
+        with self._lock:
+            for draft_id, draft, seq, _ in dirty:
+                if draft_id in discarded:
+                    # Submitted through another worker
+                    if self._drafts.get(draft_id) is draft:
+                        del self._drafts[draft_id]
+                else:
+                    draft.saved_seq = max(draft.saved_seq, seq)
@@ -0,0 +1,151 @@
+"""
+Server-side exam composition.
+
+Instead of posting a whole question bank back through the browser, the
+client sends a short list of references and the server assembles the exam
+from the library:
+
+    {"filename": "bank.docx"}                              every question
+    {"filename": "bank.docx", "question_ids": [1, 4, 7]}   chosen questions
+    {"filename": "bank.docx", "question_id": 4}            one question (a search hit)
+    {"search": "decorators", "limit": 5, "type": "mcq"}    top search hits
+    {"random": {"mcq": 10, "true_false": 5}, "documents": ["bank.docx"]}
+
+Random picks are drawn from the catalog's per-document type counts, so
+only the documents that actually contribute a question are loaded. If a
+document changed after its summary was read, its picks are drawn again
+from the questions actually loaded. Questions are renumbered 1..N in the
+composed exam and keep a `source` reference to the library question they
+came from. A question picked twice (say by a search and a random item) is
+only included once; compose_exam reports how many picks were left out.
+"""
+
+import os
+import random
+from bisect import bisect_right
+
+MAX_EXAM_QUESTIONS = 500
+
+
+class CompositionError(ValueError):
+    pass
+
+
+def _positive_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise CompositionError(f'{name} must be a positive integer')
+    return value
+
+
+def _random_refs(library_index, counts, documents, rng):
+    """Pick (filename, question index within type) pairs without loading every document."""
+    summaries = library_index.summaries()
+    if documents:
+        summaries = [s for s in summaries if s['filename'] in documents]
+    refs = []
+    for q_type, count in counts.items():
+        count = _positive_int(count, f'random count for {q_type}')
+        offsets, docs, total = [], [], 0
+        for summary in summaries:
+            n = summary['type_counts'].get(q_type, 0)
+            if n:
+                offsets.append(total)
+                docs.append(summary['filename'])
+                total += n
+        if count > total:
+            raise CompositionError(f'Only {total} {q_type} questions available, {count} requested')
+        for position in sorted(rng.sample(range(total), count)):
+            i = bisect_right(offsets, position) - 1
+            refs.append((docs[i], q_type, position - offsets[i]))
+    return refs
+
+
+def compose_exam(library_index, library_search, items, seed=None, shuffle=False):
+    """
+    Resolve composition items into (exam questions, number of picked
+    questions left out as duplicates or no longer in the library).
+    """
+    if not isinstance(items, list) or not items:
+        raise CompositionError('items must be a non-empty list')
+    rng = random.Random(seed)
+    selected = []  # (filename, question)
+    seen = set()
+    requested = 0
+
+    def add(filename, question):
+        nonlocal requested
+        requested += 1
+        key = (filename, question.get('id'))
+        if key not in seen:
+            seen.add(key)
+            selected.append((filename, question))
+
+    def document(filename):
+        if not isinstance(filename, str) or not filename or os.path.basename(filename) != filename:
+            raise CompositionError(f'Invalid filename: {filename!r}')
+        questions = library_index.questions(filename)
+        if questions is None:
+            raise CompositionError(f'Document not found: {filename}')
+        return questions
+
+    for item in items:
+        if not isinstance(item, dict):
+            raise CompositionError('each item must be an object')
+
+        if 'random' in item:
+            counts = item['random']
+            if not isinstance(counts, dict) or not counts:
+                raise CompositionError('random must map question types to counts')
+            picks = {}  # (filename, type) -> ascending indices among that document's questions of the type
+            for filename, q_type, index in _random_refs(library_index, counts, item.get('documents'), rng):
+                picks.setdefault((filename, q_type), []).append(index)
+            for (filename, q_type), indices in picks.items():
+                pool = [q for q in document(filename) if q.get('type', 'mcq') == q_type]
+                if indices[-1] >= len(pool):
+                    # The document shrank after its summary was read
+                    available = min(len(indices), len(pool))
+                    requested += len(indices) - available
+                    indices = sorted(rng.sample(range(len(pool)), available))
+                for index in indices:
+                    add(filename, pool[index])
+
+        elif 'search' in item:
+            limit = _positive_int(item.get('limit', 10), 'limit')
+            for hit in library_search.search(str(item['search']), limit=limit, q_type=item.get('type')):
+                questions = document(hit['filename'])
+                for q in questions:
+                    if q.get('id') == hit['question_id']:
+                        add(hit['filename'], q)
+                        break
+
+        elif 'filename' in item:
+            filename = item['filename']
+            questions = document(filename)
+            ids = [item['question_id']] if 'question_id' in item else item.get('question_ids')
+            if ids is None:
+                for q in questions:
+                    add(filename, q)
+            elif not isinstance(ids, list):
+                raise CompositionError('question_ids must be a list')
+            else:
+                by_id = {q.get('id'): q for q in questions}
+                for q_id in ids:
+                    if q_id not in by_id:
+                        raise CompositionError(f'Question {q_id} not found in {filename}')
+                    add(filename, by_id[q_id])
+
+        else:
+            raise CompositionError('each item needs filename, search or random')
+
+        if len(selected) > MAX_EXAM_QUESTIONS:
+            raise CompositionError(f'An exam can have at most {MAX_EXAM_QUESTIONS} questions')
+
+    if not selected:
+        raise CompositionError('No questions matched')
+    if shuffle:
+        rng.shuffle(selected)
+    questions = [
+        dict(q, id=i, source={'filename': filename, 'question_id': q.get('id')})
+        for i, (filename, q) in enumerate(selected, start=1)
+    ]
+    return questions, requested - len(selected)
@@ -0,0 +1,137 @@
+"""
+Exam session storage.
+
+An exam session is the set of questions loaded by /upload or
+/library/set-exam and served to students by /exam/data. Sessions are keyed
+by an exam ID; the most recently loaded exam is also remembered so that
+students who were not given an ID still get the current exam.
+
+Two backends are available:
+  - SqliteExamSessionStore: shared by all gunicorn workers (default)
+  - MemoryExamSessionStore: single process only, handy for local dev
+
+Sessions are stored already serialized, so /exam/data can send the stored
+JSON as-is without parsing or re-extracting anything.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from db import get_connection, transaction
+
+# Exam sessions older than this are dropped when a new one is stored
+SESSION_MAX_AGE = 7 * 24 * 3600
+
+
+def new_exam_id():
+    return uuid.uuid4().hex[:12]
+
+
+def _serialize(exam_id, questions):
+    return json.dumps({'exam_id': exam_id, 'questions': questions, 'answers': {}})
+
+
+class MemoryExamSessionStore:
+    def __init__(self):
+        self._sessions = {}
+        self._versions = {}
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def put(self, questions, exam_id=None):
+        """Store an exam and return its ID."""
+        exam_id = exam_id or new_exam_id()
+        raw = _serialize(exam_id, questions)
+        with self._lock:
+            self._sessions[exam_id] = raw
+            self._versions[exam_id] = f'{exam_id}-{time.time()!r}'
+            self._latest = exam_id
+        return exam_id
+
+    def get_raw(self, exam_id=None):
+        """Return the stored JSON for exam_id (or the latest exam), or None."""
+        with self._lock:
+            return self._sessions.get(exam_id or self._latest)
+
+    def get(self, exam_id=None):
+        raw = self.get_raw(exam_id)
+        return json.loads(raw) if raw else None
+
+    def version(self, exam_id=None):
+        """Token that changes whenever exam_id (or the latest exam) is stored again, or None."""
+        with self._lock:
+            return self._versions.get(exam_id or self._latest)
+
+    def latest_id(self):
+        return self._latest
+
+
+class SqliteExamSessionStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._ready_pid = None
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS exam_sessions (
+                    exam_id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_exam_sessions_created ON exam_sessions (created_at);
+            """)
+            self._ready_pid = os.getpid()
+        return conn
+
+    def put(self, questions, exam_id=None):
+        """Store an exam and return its ID."""
+        exam_id = exam_id or new_exam_id()
+        raw = _serialize(exam_id, questions)
+        now = time.time()
+        with transaction(self._conn()) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO exam_sessions (exam_id, created_at, payload) VALUES (?, ?, ?)',
+                (exam_id, now, raw)
+            )
+            conn.execute('DELETE FROM exam_sessions WHERE created_at < ?', (now - SESSION_MAX_AGE,))
+        return exam_id
+
+    def get_raw(self, exam_id=None):
+        """Return the stored JSON for exam_id (or the latest exam), or None."""
+        conn = self._conn()
+        if exam_id:
+            row = conn.execute('SELECT payload FROM exam_sessions WHERE exam_id = ?', (exam_id,)).fetchone()
+        else:
+            row = conn.execute('SELECT payload FROM exam_sessions ORDER BY created_at DESC LIMIT 1').fetchone()
+        return row['payload'] if row else None
+
+    def get(self, exam_id=None):
+        raw = self.get_raw(exam_id)
+        return json.loads(raw) if raw else None
+
+    def version(self, exam_id=None):
+        """Token that changes whenever exam_id (or the latest exam) is stored again, or None."""
+        conn = self._conn()
+        if exam_id:
+            row = conn.execute('SELECT exam_id, created_at FROM exam_sessions WHERE exam_id = ?', (exam_id,)).fetchone()
+        else:
+            row = conn.execute('SELECT exam_id, created_at FROM exam_sessions ORDER BY created_at DESC LIMIT 1').fetchone()
+        return f"{row['exam_id']}-{row['created_at']!r}" if row else None
+
+    def latest_id(self):
+        row = self._conn().execute('SELECT exam_id FROM exam_sessions ORDER BY created_at DESC LIMIT 1').fetchone()
+        return row['exam_id'] if row else None
+
+
+def create_exam_store(backend, db_path):
+    """Build the exam session store named by backend ('sqlite' or 'memory')."""
+    if backend == 'memory':
+        return MemoryExamSessionStore()
+    if backend == 'sqlite':
+        return SqliteExamSessionStore(db_path)
+    raise ValueError(f'Unknown exam session backend: {backend}')
@@ -0,0 +1,128 @@
+"""
+Cache for extract_questions results.
+
+Entries are keyed by the SHA-256 of the uploaded file's bytes plus the
+extractor version, so re-uploading the same document skips parsing
+entirely. There are two tiers:
+  - an in-memory LRU per worker, bounded by total size in bytes
+  - an on-disk directory shared by all workers
+
+The extractor version is a fingerprint of the parser's source code, so any
+change to the parsing logic invalidates every cached entry automatically.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def code_fingerprint(*objects):
+    """Short hash of the source code of the given functions/modules."""
+    h = hashlib.sha256()
+    for obj in objects:
+        h.update(inspect.getsource(obj).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir, version, max_memory_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._prune_old_versions()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}-{self.version}.json')
+
+    def _prune_old_versions(self):
+        """Remove on-disk entries written by a different extractor version."""
+        suffix = f'-{self.version}.json'
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json') and not name.endswith(suffix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _remember(self, digest, raw):
+        with self._lock:
+            old = self._memory.pop(digest, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            if len(raw) > self.max_memory_bytes:
+                return
+            self._memory[digest] = raw
+            self._memory_bytes += len(raw)
+            # Evict least recently used entries until we are under budget
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get(self, digest):
+        """Return cached questions for digest, or None."""
+        with self._lock:
+            raw = self._memory.get(digest)
+            if raw is not None:
+                self._memory.move_to_end(digest)
+        if raw is None:
+            try:
+                with open(self._path(digest), 'r', encoding='utf-8') as f:
+                    raw = f.read()
+            except OSError:
+                return None
+            self._remember(digest, raw)
+        # Hand out a fresh copy so callers can't modify the cached entry
+        return json.loads(raw)
+
+    def put(self, digest, questions):
+        raw = json.dumps(questions)
+        # Write to a temp file and rename so other workers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(raw)
+            os.replace(tmp_path, self._path(digest))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remember(digest, raw)
+
+    def get_or_extract(self, filepath, extract, sha256=None):
+        """Return questions for filepath, calling extract(filepath) on a miss. Pass sha256 if already known."""
+        # The extension decides which reader is used, so it is part of the key
+        extension = os.path.splitext(filepath)[1].lstrip('.').lower()
+        digest = f'{extension}-{sha256 or file_sha256(filepath)}'
+        questions = self.get(digest)
+        if questions is not None:
+            self.hits += 1
+            return questions
+        self.misses += 1
+        questions = extract(filepath)
+        try:
+            self.put(digest, questions)
+        except OSError as e:
+            logger.warning("Error writing extraction cache: %s", e)
+        return questions
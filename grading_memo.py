@@ -0,0 +1,243 @@
+"""
+Shared memo of grading decisions.
+
+In a large class most answers to a fill-blank or MCQ question are the same
+few strings, yet each one used to go through keyword extraction and
+SequenceMatcher again. The memo keeps every decision made for
+(exam_id, key_version, question, normalized answer) in the results
+database, so all workers share it and a repeated answer is decided by a
+lookup: one query per batch of submissions, not one per answer.
+
+  - Only answers that need SequenceMatcher go through the memo. Blank
+    answers, exact matches and answers the keyword bounds settle
+    (QuestionKey.quick_decision) are cheaper to decide than to look up.
+  - Entries are keyed by answer-key version, so a corrected key never sees
+    decisions made against the old one. Entries for older versions of an
+    exam are deleted the first time a worker grades against a newer one.
+  - The memo is bounded to max_entries. Hits refresh an entry's used_at (at
+    most once per TOUCH_INTERVAL) and the least recently used entries are
+    evicted first.
+  - Hit, miss and eviction counts are kept in the database (stats()) and,
+    with metrics enabled, as keeplearning_grading_memo_total{result}.
+"""
+
+import logging
+import os
+import threading
+import time
+from hashlib import blake2b
+
+from db import get_connection, transaction
+from metrics import Metrics
+from scoring import MAX_ANSWER_CHARS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grading_memo (
+    exam_id TEXT NOT NULL,
+    key_version INTEGER NOT NULL,
+    answer_hash BLOB NOT NULL,
+    correct INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (exam_id, key_version, answer_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_grading_memo_used_at ON grading_memo (used_at);
+CREATE TABLE IF NOT EXISTS grading_memo_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+TOUCH_INTERVAL = 60.0  # seconds; hits on fresher entries don't rewrite used_at
+EVICT_TO = 0.9  # share of max_entries kept after an eviction
+LOOKUP_CHUNK = 500
+
+
+def answer_hash(question_key, normalized_answer):
+    return blake2b(f'{question_key}\0{normalized_answer}'.encode('utf-8'), digest_size=16).digest()
+
+
+class GradingMemo:
+    def __init__(self, db_path, max_entries=100000, metrics=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.metrics = metrics or Metrics(None)
+        self._ready_pid = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._new = {}  # (exam_id, key_version, answer_hash) -> correct
+        self._touched = set()
+        self._counts = {'hits': 0, 'misses': 0}
+        self._purged = set()  # (exam_id, key_version) whose older versions are gone
+        self._since_evict_check = None  # None: check on the first write
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript(SCHEMA)
+            self._ready_pid = os.getpid()
+        return conn
+
+    def _lookup(self, key, hashes):
+        """{answer_hash: (correct, used_at)} for the hashes already in the memo."""
+        conn = self._conn()
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            for row in conn.execute(
+                f"SELECT answer_hash, correct, used_at FROM grading_memo WHERE exam_id = ? AND key_version = ? "
+                f"AND answer_hash IN ({','.join('?' * len(chunk))})", [key.exam_id, key.version] + chunk
+            ):
+                found[row['answer_hash']] = (bool(row['correct']), row['used_at'])
+        return found
+
+    def score_many(self, key, scorer, submissions):
+        """
+        Scores for a list of answers dicts, all graded against one key version
+        (scorer is that version's ExamScorer). New decisions are written by
+        the next flush().
+        """
+        scores = [0] * len(submissions)
+        unresolved = {}  # answer_hash -> [QuestionKey, stripped answer, submission indexes]
+        for qkey in scorer.keys:
+            seen = {}  # stripped answer -> decision, or answer_hash while unresolved
+            for i, answers in enumerate(submissions):
+                user_answer = (answers.get(qkey.answer_key) or '').strip()
+                decision = seen.get(user_answer)
+                if decision is None:
+                    decision = qkey.quick_decision(user_answer)
+                    if decision is None and len(user_answer) > MAX_ANSWER_CHARS:
+                        # Rare, and is_correct() truncates these; not worth a memo entry
+                        decision = qkey.is_correct(user_answer)
+                    if decision is None:
+                        decision = answer_hash(qkey.answer_key, user_answer.lower())
+                        unresolved.setdefault(decision, [qkey, user_answer, []])
+                    seen[user_answer] = decision
+                if decision is True:
+                    scores[i] += 1
+                elif decision is not False:
+                    unresolved[decision][2].append(i)
+        if not unresolved:
+            return scores
+
+        found = self._lookup(key, list(unresolved))
+        now = time.time()
+        new, touched = {}, []
+        hits = misses = 0
+        for digest, (qkey, user_answer, indexes) in unresolved.items():
+            memo = found.get(digest)
+            if memo is None:
+                # The only place production scoring still runs the fuzzy comparison
+                with self.metrics.timer('calculate_similarity'):
+                    correct = qkey.is_correct(user_answer)
+                new[(key.exam_id, key.version, digest)] = correct
+                misses += 1
+                hits += len(indexes) - 1
+            else:
+                correct, used_at = memo
+                if now - used_at > TOUCH_INTERVAL:
+                    touched.append((key.exam_id, key.version, digest))
+                hits += len(indexes)
+            if correct:
+                for i in indexes:
+                    scores[i] += 1
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            self._new.update(new)
+            self._touched.update(touched)
+            self._counts['hits'] += hits
+            self._counts['misses'] += misses
+        if hits:
+            self.metrics.inc('grading_memo_total', hits, result='hit')
+        if misses:
+            self.metrics.inc('grading_memo_total', misses, result='miss')
+        return scores
+
+    def score(self, key, scorer, answers):
+        return self.score_many(key, scorer, [answers])[0]
+
+    def flush(self, conn=None):
+        """
+        Write new decisions, refreshed used_at values and counters. Pass conn
+        to write inside the caller's transaction; the writes are a cache, so
+        they are simply lost if that transaction rolls back.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            new, self._new = self._new, {}
+            touched, self._touched = self._touched, set()
+            counts, self._counts = self._counts, {'hits': 0, 'misses': 0}
+        if not new and not touched and not any(counts.values()):
+            return
+        if conn is None:
+            with transaction(self._conn()) as conn:
+                self._write(conn, new, touched, counts)
+        else:
+            self._write(conn, new, touched, counts)
+
+    def _write(self, conn, new, touched, counts):
+        now = time.time()
+        for exam_id, version in {(exam_id, version) for exam_id, version, _ in new} - self._purged:
+            # A newer key version makes the older versions' decisions useless
+            conn.execute('DELETE FROM grading_memo WHERE exam_id = ? AND key_version < ?', (exam_id, version))
+            self._purged.add((exam_id, version))
+        conn.executemany(
+            'INSERT OR IGNORE INTO grading_memo (exam_id, key_version, answer_hash, correct, used_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(exam_id, version, digest, int(correct), now) for (exam_id, version, digest), correct in new.items()]
+        )
+        conn.executemany(
+            'UPDATE grading_memo SET used_at = ? WHERE exam_id = ? AND key_version = ? AND answer_hash = ?',
+            [(now, exam_id, version, digest) for exam_id, version, digest in touched]
+        )
+        counts['evictions'] = self._evict(conn, len(new))
+        self._add_stats(conn, counts)
+
+    def _evict(self, conn, inserted):
+        """Trim the memo back under max_entries; count rows only every max_entries / 20 inserts."""
+        if self._since_evict_check is not None:
+            self._since_evict_check += inserted
+            if self._since_evict_check < max(1, self.max_entries // 20):
+                return 0
+        self._since_evict_check = 0
+        entries = conn.execute('SELECT COUNT(*) FROM grading_memo').fetchone()[0]
+        if entries <= self.max_entries:
+            return 0
+        excess = entries - int(self.max_entries * EVICT_TO)
+        conn.execute('DELETE FROM grading_memo WHERE rowid IN '
+                     '(SELECT rowid FROM grading_memo ORDER BY used_at LIMIT ?)', (excess,))
+        self.metrics.inc('grading_memo_total', excess, result='evicted')
+        logger.debug('Evicted %d grading memo entries', excess)
+        return excess
+
+    @staticmethod
+    def _add_stats(conn, counts):
+        conn.executemany(
+            'INSERT INTO grading_memo_stats (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            [(name, value) for name, value in counts.items() if value]
+        )
+
+    def stats(self):
+        """Entries and lifetime hit/miss/eviction counts, across all workers."""
+        conn = self._conn()
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        stats.update((row['name'], row['value']) for row in conn.execute('SELECT name, value FROM grading_memo_stats'))
+        stats['entries'] = conn.execute('SELECT COUNT(*) FROM grading_memo').fetchone()[0]
+        graded = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / graded, 4) if graded else None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+        with transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM grading_memo')
+            conn.execute('DELETE FROM grading_memo_stats')
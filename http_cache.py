@@ -0,0 +1,174 @@
+"""
+HTTP caching for pages, static assets and JSON payloads.
+
+StaticAssets
+    asset_url('style.css') in a template gives /assets/<content hash>/style.css.
+    Those URLs never change content, so they are served with a one-year
+    immutable Cache-Control and browsers stop revalidating them on every
+    page view. CSS/JS/SVG files are gzip-compressed once at startup and
+    sent compressed to clients that accept it. Plain /static/ URLs keep
+    working as before.
+
+PageCache
+    The page templates (/exams, /exam, /library, /results, /about) take no
+    per-request context, so each is rendered once per worker and kept as
+    bytes (plus a gzip copy) with an ETag. Repeat visits get 304. With
+    template auto-reload on (debug), pages are re-rendered when the
+    template file changes.
+
+conditional_response / not_modified
+    Add an ETag to a JSON body and answer 304 when the browser already has
+    it; /exam/data and /library/list use them.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, render_template, request, redirect
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt'}
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'private, no-cache'  # browser may keep it, but revalidates (cheap with an ETag)
+
+
+def make_etag(data):
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+
+def _send(body, gzipped, etag, mimetype, cache_control):
+    """Send body (or its gzip copy), honouring If-None-Match."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif gzipped is not None and accepts_gzip():
+        response = Response(gzipped, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if gzipped is not None:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def not_modified(etag):
+    """A 304 response if the client already has etag, else None (checked before loading the body)."""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
+
+
+def conditional_response(body, etag=None, mimetype='application/json'):
+    """Response with an ETag for body (str or bytes); 304 if the client has it."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return _send(body, None, etag or make_etag(body), mimetype, REVALIDATE)
+
+
+class _Asset:
+    __slots__ = ('path', 'version', 'fingerprint', 'body', 'gzipped', 'mimetype')
+
+
+class StaticAssets:
+    def __init__(self, app, url_prefix='/assets'):
+        self.app = app
+        self.static_folder = app.static_folder
+        self.url_prefix = url_prefix
+        self._assets = {}  # filename relative to static/ -> _Asset
+        self._lock = threading.Lock()
+        app.add_url_rule(f'{url_prefix}/<fingerprint>/<path:filename>', 'fingerprinted_asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+        self.preload()
+
+    def preload(self):
+        """Hash and compress everything in static/ up front."""
+        for folder, _, files in os.walk(self.static_folder):
+            for name in files:
+                self._load(os.path.relpath(os.path.join(folder, name), self.static_folder).replace(os.sep, '/'))
+
+    def _load(self, filename):
+        """Read, hash and compress one static file; cached until its mtime or size changes."""
+        path = os.path.join(self.static_folder, filename)
+        # Only files inside static/
+        if os.path.commonpath([os.path.realpath(path), os.path.realpath(self.static_folder)]) \
+                != os.path.realpath(self.static_folder):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(filename)
+        if asset is not None and asset.version == version:
+            return asset
+        with open(path, 'rb') as f:
+            body = f.read()
+        asset = _Asset()
+        asset.path = path
+        asset.version = version
+        asset.body = body
+        asset.fingerprint = make_etag(body)[:12]
+        asset.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        asset.gzipped = None
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE and len(body) >= MIN_COMPRESS_BYTES:
+            asset.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        with self._lock:
+            self._assets[filename] = asset
+        return asset
+
+    def url(self, filename):
+        """Fingerprinted URL for a file in static/ (falls back to /static/ if it is missing)."""
+        asset = self._assets.get(filename)
+        # Re-stat only when templates may change too; otherwise hashes are fixed for the process
+        if asset is None or self.app.jinja_env.auto_reload:
+            asset = self._load(filename)
+        if asset is None:
+            return f'{self.app.static_url_path}/{filename}'
+        return f'{self.url_prefix}/{asset.fingerprint}/{filename}'
+
+    def serve(self, fingerprint, filename):
+        asset = self._assets.get(filename) or self._load(filename)
+        if asset is None:
+            return Response('Not found', status=404)
+        if fingerprint != asset.fingerprint:
+            # A page rendered before the file changed; send the current version
+            return redirect(self.url(filename), code=302)
+        return _send(asset.body, asset.gzipped, asset.fingerprint, asset.mimetype, IMMUTABLE)
+
+
+class PageCache:
+    def __init__(self, app):
+        self.app = app
+        self._pages = {}  # template name -> (template mtime, body, gzipped, etag)
+        self._lock = threading.Lock()
+
+    def _template_mtime(self, name):
+        if not self.app.jinja_env.auto_reload:
+            return None
+        try:
+            return os.path.getmtime(os.path.join(self.app.root_path, self.app.template_folder, name))
+        except OSError:
+            return None
+
+    def render(self, name):
+        """Response for a template that takes no context, rendered once per worker."""
+        mtime = self._template_mtime(name)
+        page = self._pages.get(name)
+        if page is None or page[0] != mtime:
+            body = render_template(name).encode('utf-8')
+            page = (mtime, body, gzip.compress(body, compresslevel=6, mtime=0), make_etag(body))
+            with self._lock:
+                self._pages[name] = page
+        _, body, gzipped, etag = page
+        return _send(body, gzipped, etag, 'text/html', REVALIDATE)
@@ -0,0 +1,143 @@
+"""
+Background jobs run on a local process pool.
+
+Used for extracting large uploads outside the request thread, so a big
+question bank can't hit the gunicorn worker timeout. Job status lives in
+SQLite, so /jobs/<id> works no matter which worker the client polls.
+
+Job lifecycle: queued -> running -> done | failed
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are removed after this long
+JOB_MAX_AGE = 24 * 3600
+
+FINISHED = ('done', 'failed')
+
+_schema_ready = set()
+
+
+def _connect(db_path):
+    conn = get_connection(db_path)
+    if (os.getpid(), db_path) in _schema_ready:
+        return conn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            label TEXT,
+            status TEXT NOT NULL,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    _schema_ready.add((os.getpid(), db_path))
+    return conn
+
+
+def _set_status(db_path, job_id, status, message=None, result=None, error=None):
+    _connect(db_path).execute(
+        'UPDATE jobs SET status = ?, message = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?',
+        (status, message, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+    )
+
+
+def _run_in_worker(db_path, job_id, func, args):
+    """Runs inside the pool process: mark the job running, then do the work."""
+    _set_status(db_path, job_id, 'running', message='Extracting questions')
+    return func(*args)
+
+
+class JobQueue:
+    def __init__(self, db_path, max_workers=2):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # One pool per worker process, created after gunicorn forks
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _create(self, kind, label):
+        job_id = uuid.uuid4().hex[:16]
+        now = time.time()
+        conn = _connect(self.db_path)
+        conn.execute('DELETE FROM jobs WHERE updated_at < ?', (now - JOB_MAX_AGE,))
+        conn.execute(
+            'INSERT INTO jobs (job_id, kind, label, status, message, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, label, 'queued', 'Waiting for a free worker', now, now)
+        )
+        return job_id
+
+    def submit(self, kind, label, func, args, on_done=None):
+        """
+        Queue func(*args) on the process pool and return the job ID.
+        on_done(output) runs in this process once func finishes; whatever it
+        returns is stored as the job's result.
+        """
+        job_id = self._create(kind, label)
+        future = self._pool().submit(_run_in_worker, self.db_path, job_id, func, args)
+        future.add_done_callback(lambda f: self._finish(job_id, f, on_done))
+        return job_id
+
+    def run_in_thread(self, kind, label, func, args):
+        """
+        Run func(progress, *args) on a background thread of this process and
+        return the job ID. For jobs that manage their own process pool;
+        progress(message) updates the job's status message.
+        """
+        job_id = self._create(kind, label)
+
+        def progress(message):
+            _set_status(self.db_path, job_id, 'running', message=message)
+
+        def run():
+            try:
+                progress('Starting')
+                result = func(progress, *args)
+                _set_status(self.db_path, job_id, 'done', message='Finished', result=result)
+            except Exception as e:
+                logger.exception('Job %s (%s) failed: %s', job_id, kind, e)
+                _set_status(self.db_path, job_id, 'failed', message='Failed', error=str(e))
+
+        threading.Thread(target=run, name=f'job-{job_id}', daemon=True).start()
+        return job_id
+
+    def _finish(self, job_id, future, on_done):
+        try:
+            output = future.result()
+            result = on_done(output) if on_done else output
+            _set_status(self.db_path, job_id, 'done', message='Finished', result=result)
+        except Exception as e:
+            logger.exception('Job %s failed: %s', job_id, e)
+            _set_status(self.db_path, job_id, 'failed', message='Failed', error=str(e))
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it doesn't exist."""
+        row = _connect(self.db_path).execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
@@ -0,0 +1,313 @@
+"""
+Near-duplicate questions across the library.
+
+Every library question gets a MinHash signature of its normalized text
+(NUM_HASHES minimums over character shingles). The signature is cut into
+BANDS bands; questions that share a band land in the same LSH bucket.
+/library/duplicates reads the buckets holding more than one question,
+checks each candidate pair's estimated similarity, and joins pairs that
+pass into clusters. Questions that never share a bucket are never
+compared, so finding duplicates stays near-linear in library size,
+unlike comparing every pair with SequenceMatcher.
+
+With 16 bands of 4 rows, pairs with a similarity of about 0.5 or more
+are very likely to share a bucket. The threshold argument then decides
+which of them count as duplicates.
+
+Like the search index, signatures live in LIBRARY_SEARCH_DB. They are
+updated when a document is uploaded or deleted, and an mtime scan picks
+up metadata written any other way.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from hashlib import blake2b
+from operator import eq
+
+from db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_signatures (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    question_id INTEGER,
+    question TEXT,
+    signature BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_question_signatures_filename ON question_signatures (filename);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    signature_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets ON lsh_buckets (band, bucket);
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_signature ON lsh_buckets (signature_id);
+CREATE TABLE IF NOT EXISTS signed_documents (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.7
+SYNC_INTERVAL = 2.0  # seconds between metadata folder scans per worker
+FULL_PAIRS_BUCKET = 50  # larger buckets are compared in overlapping windows of this many members
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20250101)  # fixed, so signatures are comparable across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_HASHES)]
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_text(text):
+    """Lower-case, punctuation and blanks removed, single spaces."""
+    return _NON_WORD.sub(' ', (text or '').lower()).strip()
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature (array of NUM_HASHES ints) of normalized text, or None if it is empty."""
+    text = normalize_text(text)
+    if not text:
+        return None
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles(text)]
+    return array('Q', [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS])
+
+
+def band_keys(signature):
+    """One bucket key per band: a 63-bit hash of that band's rows."""
+    raw = signature.tobytes()
+    width = ROWS * signature.itemsize
+    return [int.from_bytes(blake2b(raw[i * width:(i + 1) * width], digest_size=8).digest(), 'big') >> 1
+            for i in range(BANDS)]
+
+
+def _candidate_pairs(bucket):
+    """
+    Pairs to compare within one LSH bucket. A bucket of up to
+    FULL_PAIRS_BUCKET members is compared in full; a larger one (sorted by
+    signature) in overlapping windows of that size, so every member is still
+    compared with its nearest neighbours and the cost stays linear.
+    """
+    if len(bucket) <= FULL_PAIRS_BUCKET:
+        windows = [bucket]
+    else:
+        step = FULL_PAIRS_BUCKET // 2
+        windows = [bucket[i:i + FULL_PAIRS_BUCKET] for i in range(0, len(bucket) - step, step)]
+    for window in windows:
+        for i, a in enumerate(window):
+            for b in window[i + 1:]:
+                yield a, b
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(map(eq, sig_a, sig_b)) / NUM_HASHES
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = parent.setdefault(x, x)
+        while root != parent[root]:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class DuplicateIndex:
+    def __init__(self, db_path, meta_folder):
+        self.db_path = db_path
+        self.meta_folder = meta_folder
+        self._ready_pid = None
+        self._last_sync = 0
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript(SCHEMA)
+            self._ready_pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _delete(conn, filename):
+        conn.execute('DELETE FROM lsh_buckets WHERE signature_id IN '
+                     '(SELECT id FROM question_signatures WHERE filename = ?)', (filename,))
+        conn.execute('DELETE FROM question_signatures WHERE filename = ?', (filename,))
+
+    @staticmethod
+    def _sign(meta):
+        """(question, signature) for every signable question; done before opening the write transaction."""
+        signed = []
+        for q in meta.get('questions', []):
+            signature = minhash(q.get('question'))
+            if signature is not None:
+                signed.append((q, signature))
+        return signed
+
+    def _write_document(self, conn, filename, signed, version):
+        self._delete(conn, filename)
+        for q, signature in signed:
+            cur = conn.execute(
+                'INSERT INTO question_signatures (filename, question_id, question, signature) VALUES (?, ?, ?, ?)',
+                (filename, q.get('id'), q.get('question'), signature.tobytes())
+            )
+            conn.executemany('INSERT INTO lsh_buckets (band, bucket, signature_id) VALUES (?, ?, ?)',
+                             [(band, key, cur.lastrowid) for band, key in enumerate(band_keys(signature))])
+        conn.execute(
+            'INSERT OR REPLACE INTO signed_documents (filename, mtime_ns, size) VALUES (?, ?, ?)',
+            (filename, version[0], version[1])
+        )
+
+    def _meta_version(self, filename):
+        stat = os.stat(os.path.join(self.meta_folder, filename + '.json'))
+        return stat.st_mtime_ns, stat.st_size
+
+    def index_document(self, meta):
+        """(Re-)sign one document after it has been saved to the meta folder."""
+        version = self._meta_version(meta['filename'])
+        signed = self._sign(meta)
+        with transaction(self._conn()) as conn:
+            self._write_document(conn, meta['filename'], signed, version)
+
+    def remove_document(self, filename):
+        with transaction(self._conn()) as conn:
+            self._delete(conn, filename)
+            conn.execute('DELETE FROM signed_documents WHERE filename = ?', (filename,))
+
+    def sync(self, force=False):
+        """Re-sign documents whose metadata file changed, drop deleted ones."""
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < SYNC_INTERVAL:
+                return
+            self._last_sync = time.monotonic()
+
+        conn = self._conn()
+        signed = {row['filename']: (row['mtime_ns'], row['size'])
+                  for row in conn.execute('SELECT filename, mtime_ns, size FROM signed_documents')}
+        on_disk = {}
+        for entry in os.scandir(self.meta_folder):
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                on_disk[entry.name[:-len('.json')]] = (entry.path, (stat.st_mtime_ns, stat.st_size))
+
+        for filename, (path, version) in on_disk.items():
+            if signed.get(filename) == version:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except Exception as e:
+                logger.warning("Error signing %s: %s", filename, e)
+                continue
+            signatures = self._sign(meta)
+            with transaction(conn):
+                self._write_document(conn, filename, signatures, version)
+        for filename in signed.keys() - on_disk.keys():
+            self.remove_document(filename)
+
+    def clusters(self, threshold=DEFAULT_THRESHOLD, filename=None, members=None, limit=100):
+        """
+        Clusters of near-duplicate questions, largest first. filename keeps
+        clusters that include a question from that document; members (a set
+        of (filename, question_id)) restricts clustering to those questions,
+        e.g. the questions of one composed exam.
+        """
+        self.sync()
+        conn = self._conn()
+        rows = conn.execute(
+            'SELECT b.band, b.bucket, b.signature_id FROM lsh_buckets b '
+            'JOIN (SELECT band, bucket FROM lsh_buckets GROUP BY band, bucket HAVING COUNT(*) > 1) d '
+            'ON b.band = d.band AND b.bucket = d.bucket ORDER BY b.band, b.bucket, b.signature_id'
+        ).fetchall()
+
+        buckets = []
+        current_key, current = None, []
+        for row in rows:
+            key = (row['band'], row['bucket'])
+            if key != current_key:
+                if len(current) > 1:
+                    buckets.append(current)
+                current_key, current = key, []
+            current.append(row['signature_id'])
+        if len(current) > 1:
+            buckets.append(current)
+
+        candidate_ids = list({sid for bucket in buckets for sid in bucket})
+        info = {}
+        groups = _UnionFind()
+        representative = {}  # signature bytes -> first signature_id with it
+        for chunk_start in range(0, len(candidate_ids), 500):
+            ids = candidate_ids[chunk_start:chunk_start + 500]
+            for row in conn.execute(
+                f"SELECT id, filename, question_id, question, signature FROM question_signatures "
+                f"WHERE id IN ({','.join('?' * len(ids))})", ids
+            ):
+                if members is not None and (row['filename'], row['question_id']) not in members:
+                    continue
+                signature = array('Q')
+                signature.frombytes(row['signature'])
+                info[row['id']] = (row['filename'], row['question_id'], row['question'], signature)
+                # Identical signatures (usually the same question in several banks) join without comparing
+                first = representative.setdefault(row['signature'], row['id'])
+                if first != row['id']:
+                    groups.union(first, row['id'])
+
+        # Compare the bucket's own members (one per distinct signature), never union-find roots:
+        # a root's signature is not the member's, and which one is root depends on insertion order
+        compared = set()
+        for bucket in buckets:
+            bucket = sorted({representative[info[sid][3].tobytes()] for sid in bucket if sid in info},
+                            key=lambda sid: (info[sid][3], sid))
+            for a, b in _candidate_pairs(bucket):
+                pair = (a, b) if a < b else (b, a)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                # Already connected pairs need no check; the clusters come out the same
+                if groups.find(a) != groups.find(b) and similarity(info[a][3], info[b][3]) >= threshold:
+                    groups.union(a, b)
+
+        clustered = {}
+        for sid in groups.parent:
+            clustered.setdefault(groups.find(sid), []).append(sid)
+        result = []
+        for ids in clustered.values():
+            if len(ids) < 2:
+                continue
+            questions = [{'filename': info[sid][0], 'question_id': info[sid][1], 'question': info[sid][2]}
+                         for sid in sorted(ids)]
+            if filename and not any(q['filename'] == filename for q in questions):
+                continue
+            result.append({'size': len(questions), 'documents': len({q['filename'] for q in questions}),
+                           'questions': questions})
+        result.sort(key=lambda c: (-c['size'], c['questions'][0]['filename'], c['questions'][0]['question_id'] or 0))
+        return result[:limit]
@@ -0,0 +1,147 @@
+"""
+In-memory catalog of the library documents.
+
+/library/list used to json.load every file in library_docs/meta on every
+request, even though the page only needs a few numbers per document. The
+catalog keeps a small summary per document (filename, question count,
+type breakdown, upload time) and only re-reads a metadata file when its
+mtime or size changes, so every worker stays in sync with uploads and
+deletes handled by other workers without re-parsing the whole library.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUESTION_CACHE_SIZE = 32  # parsed documents kept per worker for exam composition
+
+
+def summarize(meta):
+    questions = meta.get('questions', [])
+    return {
+        'filename': meta.get('filename'),
+        'question_count': len(questions),
+        'type_counts': dict(Counter(q.get('type', 'mcq') for q in questions)),
+        'uploaded_at': meta.get('uploaded_at'),
+        'sha256': meta.get('sha256'),
+    }
+
+
+class LibraryIndex:
+    def __init__(self, meta_folder):
+        self.meta_folder = meta_folder
+        self._entries = {}  # meta file name -> ((mtime_ns, size), summary)
+        self._questions = OrderedDict()  # filename -> ((mtime_ns, size), questions)
+        self._listing = None  # (entry versions, etag, JSON body) for /library/list
+        self._lock = threading.Lock()
+
+    def meta_path(self, filename):
+        return os.path.join(self.meta_folder, filename + '.json')
+
+    def _refresh(self):
+        """Re-read only the metadata files that changed since the last call."""
+        seen = set()
+        for entry in os.scandir(self.meta_folder):
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            cached = self._entries.get(entry.name)
+            if cached and cached[0] == version:
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except Exception as e:
+                logger.warning("Error reading library metadata %s: %s", entry.name, e)
+                self._entries.pop(entry.name, None)
+                continue
+            self._entries[entry.name] = (version, summarize(meta))
+        for name in list(self._entries):
+            if name not in seen:
+                del self._entries[name]
+
+    def summaries(self):
+        """Return the summary of every library document, sorted by filename."""
+        with self._lock:
+            self._refresh()
+            return [summary for _, summary in sorted(self._entries.values(), key=lambda e: e[1]['filename'] or '')]
+
+    def listing(self):
+        """Return (etag, JSON body) of {'library': summaries}; re-serialized only when a document changed."""
+        with self._lock:
+            self._refresh()
+            versions = tuple(sorted((name, version) for name, (version, _) in self._entries.items()))
+            if self._listing is None or self._listing[0] != versions:
+                summaries = [summary for _, summary in
+                             sorted(self._entries.values(), key=lambda e: e[1]['filename'] or '')]
+                etag = hashlib.blake2b(repr(versions).encode('utf-8'), digest_size=12).hexdigest()
+                self._listing = (versions, etag, json.dumps({'library': summaries}))
+            return self._listing[1], self._listing[2]
+
+    def load(self, filename):
+        """Return the full metadata (including questions) for one document, or None."""
+        try:
+            with open(self.meta_path(filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def questions(self, filename):
+        """
+        Return one document's questions, or None. Parsed documents are kept
+        (up to QUESTION_CACHE_SIZE of them) until their metadata file changes.
+        """
+        path = self.meta_path(filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._questions.get(filename)
+            if cached and cached[0] == version:
+                self._questions.move_to_end(filename)
+                return cached[1]
+        meta = self.load(filename)
+        if meta is None:
+            return None
+        questions = meta.get('questions', [])
+        with self._lock:
+            self._questions[filename] = (version, questions)
+            self._questions.move_to_end(filename)
+            while len(self._questions) > QUESTION_CACHE_SIZE:
+                self._questions.popitem(last=False)
+        return questions
+
+    def save(self, meta):
+        """Write a document's metadata atomically and update the catalog."""
+        path = self.meta_path(meta['filename'])
+        fd, tmp_path = tempfile.mkstemp(dir=self.meta_folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        stat = os.stat(path)
+        with self._lock:
+            self._entries[os.path.basename(path)] = ((stat.st_mtime_ns, stat.st_size), summarize(meta))
+
+    def remove(self, filename):
+        """Delete a document's metadata and drop it from the catalog."""
+        path = self.meta_path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+        with self._lock:
+            self._entries.pop(os.path.basename(path), None)
+            self._questions.pop(filename, None)
@@ -0,0 +1,242 @@
+"""
+Bulk ingest of question-bank documents into the library.
+
+    python library_ingest.py path/to/folder [more paths or .zip archives] [--workers 4] [--force]
+
+or POST /library/ingest with a zip archive (or a folder under
+LIBRARY_INGEST_ROOT). Every .docx/.txt file found is:
+  - skipped if a library document with the same content (SHA-256) exists,
+    unless --force / force=1 is given;
+  - extracted (through the shared extraction cache) from a staged copy,
+    moved into library_docs only once extraction succeeded, and its
+    metadata written atomically, on a process pool;
+  - added to the search index once the pool is done.
+
+The report lists what was ingested and skipped, per-file errors, and
+documents per second.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+import question_parser
+from extraction_cache import ExtractionCache, file_sha256
+from library_index import LibraryIndex
+
+logger = logging.getLogger(__name__)
+
+INGEST_EXTENSIONS = ('.docx', '.txt')
+MAX_ARCHIVE_FILES = 5000
+MAX_ARCHIVE_BYTES = 1024 ** 3  # uncompressed
+
+
+class IngestError(ValueError):
+    pass
+
+
+def collect_files(directory):
+    """Every document under directory that the library accepts, sorted."""
+    found = []
+    for folder, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name.lower().endswith(INGEST_EXTENSIONS) and not name.startswith(('.', '~$')):
+                found.append(os.path.join(folder, name))
+    return sorted(found)
+
+
+def _unique_name(name, used):
+    """name, or name-2, name-3... if a document of this ingest already uses it."""
+    stem, ext = os.path.splitext(name)
+    n = 1
+    while name.lower() in used:
+        n += 1
+        name = f'{stem}-{n}{ext}'
+    used.add(name.lower())
+    return name
+
+
+def unpack_archive(archive_path, dest):
+    """Extract the documents in a zip into dest (flattened) and return their paths."""
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile:
+        raise IngestError('Not a zip archive')
+    with archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith(INGEST_EXTENSIONS)
+                   and not os.path.basename(info.filename).startswith(('.', '~$'))]
+        if len(members) > MAX_ARCHIVE_FILES:
+            raise IngestError(f'Archive has more than {MAX_ARCHIVE_FILES} documents')
+        if sum(info.file_size for info in members) > MAX_ARCHIVE_BYTES:
+            raise IngestError('Archive is too large')
+        paths = []
+        used = set()
+        for info in members:
+            # Folder names are dropped; only the document name is kept
+            name = secure_filename(os.path.basename(info.filename))
+            if not name:
+                continue
+            name = _unique_name(name, used)
+            path = os.path.join(dest, name)
+            with archive.open(info) as src, open(path, 'wb') as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            paths.append(path)
+    return paths
+
+
+# --- Pool worker side ---
+
+_worker = {}
+
+
+def _init_worker(library_folder, meta_folder, cache_dir, cache_version):
+    _worker['library_folder'] = library_folder
+    _worker['index'] = LibraryIndex(meta_folder)
+    # Disk tier only; every document is seen once per ingest
+    _worker['cache'] = ExtractionCache(cache_dir, cache_version, max_memory_bytes=0)
+
+
+def _stage_copy(src, folder, extension):
+    """Copy src to a hidden temp file in folder, keeping its extension (the reader depends on it)."""
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.ingest-', suffix=extension)
+    try:
+        with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def _ingest_one(path, filename, sha256):
+    """Copy, extract and save one document; runs in a pool process."""
+    target = os.path.join(_worker['library_folder'], filename)
+    extract = question_parser.extract_questions_from_file
+    if os.path.realpath(path) == os.path.realpath(target):
+        questions = _worker['cache'].get_or_extract(target, extract, sha256=sha256)
+    else:
+        # Extract from a staged copy; a library document of the same name is only
+        # replaced once its successor has been read, so a failure leaves it untouched
+        staged = _stage_copy(path, _worker['library_folder'], os.path.splitext(filename)[1])
+        try:
+            questions = _worker['cache'].get_or_extract(staged, extract, sha256=sha256)
+            os.replace(staged, target)
+        except Exception:
+            os.remove(staged)
+            raise
+    _worker['index'].save({
+        'filename': filename,
+        'questions': questions,
+        'uploaded_at': datetime.now().isoformat(),
+        'sha256': sha256,
+    })
+    return len(questions)
+
+
+# --- Coordinator ---
+
+def ingest(paths, library_folder, library_index, library_search, extraction_cache,
+           workers=None, force=False, on_progress=None):
+    """Ingest the given document paths; return the report dict."""
+    started = time.perf_counter()
+    report = {'files': len(paths), 'ingested': [], 'skipped': [], 'errors': []}
+
+    known = {} if force else {s['sha256']: s['filename'] for s in library_index.summaries() if s.get('sha256')}
+    pending = []  # (path, filename, sha256)
+    used = set()
+    for path in paths:
+        try:
+            sha256 = file_sha256(path)
+        except OSError as e:
+            report['errors'].append({'file': path, 'error': str(e)})
+            continue
+        filename = secure_filename(os.path.basename(path))
+        if sha256 in known:
+            report['skipped'].append({'file': filename, 'duplicate_of': known[sha256]})
+            continue
+        filename = _unique_name(filename, used)
+        known[sha256] = filename  # identical files within one ingest
+        pending.append((path, filename, sha256))
+
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(library_folder, library_index.meta_folder,
+                                           extraction_cache.cache_dir, extraction_cache.version)) as pool:
+            futures = {pool.submit(_ingest_one, *item): item for item in pending}
+            for future in as_completed(futures):
+                path, filename, _ = futures[future]
+                try:
+                    report['ingested'].append({'file': filename, 'questions': future.result()})
+                except Exception as e:
+                    logger.warning('Ingest of %s failed: %s', filename, e)
+                    report['errors'].append({'file': filename, 'error': str(e)})
+                if on_progress:
+                    on_progress(report)
+        # One pass over the new metadata files
+        library_search.sync(force=True)
+
+    elapsed = time.perf_counter() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['docs_per_second'] = round(len(report['ingested']) / elapsed, 2) if elapsed else None
+    return report
+
+
+def ingest_sources(sources, workdir, **kwargs):
+    """Ingest folders, zip archives and single files; archives are unpacked into workdir."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(collect_files(source))
+        elif source.lower().endswith('.zip'):
+            dest = tempfile.mkdtemp(dir=workdir)
+            paths.extend(unpack_archive(source, dest))
+        elif source.lower().endswith(INGEST_EXTENSIONS) and os.path.isfile(source):
+            paths.append(source)
+        else:
+            raise IngestError(f'Not a folder, zip archive or document: {source}')
+    return ingest(paths, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-ingest question-bank documents into the library.')
+    parser.add_argument('sources', nargs='+', help='folders, .zip archives or .docx/.txt files')
+    parser.add_argument('--workers', type=int, default=None, help='extraction processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='re-ingest documents already in the library')
+    args = parser.parse_args()
+
+    from app import LIBRARY_FOLDER, library_index, library_search, extraction_cache
+
+    def progress(report):
+        done = len(report['ingested']) + len(report['errors'])
+        print(f"  {done}/{report['files'] - len(report['skipped'])} documents", end='\r', flush=True)
+
+    workdir = tempfile.mkdtemp(prefix='library-ingest-')
+    try:
+        report = ingest_sources(args.sources, workdir, library_folder=LIBRARY_FOLDER, library_index=library_index,
+                                library_search=library_search, extraction_cache=extraction_cache,
+                                workers=args.workers, force=args.force, on_progress=progress)
+    except IngestError as e:
+        parser.error(str(e))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    for error in report['errors']:
+        print(f"  ✗ {error['file']}: {error['error']}")
+    print(f"✓ Ingested {len(report['ingested'])} documents, skipped {len(report['skipped'])} duplicates, "
+          f"{len(report['errors'])} failed ({report['docs_per_second']} docs/s)")
+
+
+if __name__ == '__main__':
+    main()
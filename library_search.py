@@ -0,0 +1,190 @@
+"""
+Full-text search over library questions.
+
+Every question in library_docs/meta is indexed in a SQLite FTS5 table
+(question text, options and correct answer), ranked with bm25. The index
+is shared by all workers and updated incrementally: the uploading worker
+re-indexes just that document, and a cheap mtime scan before searches
+picks up metadata written any other way (bulk imports, manual edits).
+
+filename is UNINDEXED in the FTS table, so deleting by it would scan the
+whole index. indexed_questions maps every FTS rowid to its document, and
+a document's old rows are deleted by rowid.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    question, options, correct_answer,
+    filename UNINDEXED, question_id UNINDEXED, type UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS indexed_documents (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+ROW_MAP_SCHEMA = [
+    'CREATE TABLE indexed_questions (id INTEGER PRIMARY KEY, filename TEXT NOT NULL)',
+    'CREATE INDEX idx_indexed_questions_filename ON indexed_questions (filename)',
+]
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+SYNC_INTERVAL = 2.0  # seconds between metadata folder scans per worker
+MAX_LIMIT = 200
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 query: every word must match, and the
+    last word also matches as a prefix so results appear while typing.
+    """
+    tokens = TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{t}"' for t in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class LibrarySearch:
+    def __init__(self, db_path, meta_folder):
+        self.db_path = db_path
+        self.meta_folder = meta_folder
+        self._ready_pid = None
+        self._last_sync = 0
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript(SCHEMA)
+            with transaction(conn):
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'indexed_questions'").fetchone() is None:
+                    for statement in ROW_MAP_SCHEMA:
+                        conn.execute(statement)
+                    # An index built before the map existed is mapped once, with one full scan
+                    conn.execute('INSERT INTO indexed_questions (id, filename) '
+                                 'SELECT rowid, filename FROM questions_fts')
+            self._ready_pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _delete(conn, filename):
+        conn.execute('DELETE FROM questions_fts WHERE rowid IN '
+                     '(SELECT id FROM indexed_questions WHERE filename = ?)', (filename,))
+        conn.execute('DELETE FROM indexed_questions WHERE filename = ?', (filename,))
+
+    def _write_document(self, conn, meta, version):
+        filename = meta['filename']
+        self._delete(conn, filename)
+        # Explicit rowids, so the map is written in bulk too; the write transaction keeps them unique
+        first = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM indexed_questions').fetchone()[0]
+        rows = [
+            (first + i, q.get('question', ''), '\n'.join(q.get('options') or []), q.get('correct_answer') or '',
+             filename, q.get('id'), q.get('type'))
+            for i, q in enumerate(meta.get('questions', []))
+        ]
+        conn.executemany('INSERT INTO indexed_questions (id, filename) VALUES (?, ?)',
+                         [(row[0], filename) for row in rows])
+        conn.executemany(
+            'INSERT INTO questions_fts (rowid, question, options, correct_answer, filename, question_id, type) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO indexed_documents (filename, mtime_ns, size) VALUES (?, ?, ?)',
+            (filename, version[0], version[1])
+        )
+
+    def _meta_version(self, filename):
+        stat = os.stat(os.path.join(self.meta_folder, filename + '.json'))
+        return stat.st_mtime_ns, stat.st_size
+
+    def index_document(self, meta):
+        """(Re-)index one document after it has been saved to the meta folder."""
+        version = self._meta_version(meta['filename'])
+        with transaction(self._conn()) as conn:
+            self._write_document(conn, meta, version)
+
+    def remove_document(self, filename):
+        with transaction(self._conn()) as conn:
+            self._delete(conn, filename)
+            conn.execute('DELETE FROM indexed_documents WHERE filename = ?', (filename,))
+
+    def sync(self, force=False):
+        """Re-index documents whose metadata file changed, drop deleted ones."""
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < SYNC_INTERVAL:
+                return
+            self._last_sync = time.monotonic()
+
+        conn = self._conn()
+        indexed = {row['filename']: (row['mtime_ns'], row['size'])
+                   for row in conn.execute('SELECT filename, mtime_ns, size FROM indexed_documents')}
+        on_disk = {}
+        for entry in os.scandir(self.meta_folder):
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                on_disk[entry.name[:-len('.json')]] = (entry.path, (stat.st_mtime_ns, stat.st_size))
+
+        for filename, (path, version) in on_disk.items():
+            if indexed.get(filename) == version:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except Exception as e:
+                logger.warning("Error indexing %s: %s", filename, e)
+                continue
+            meta['filename'] = filename
+            with transaction(conn):
+                self._write_document(conn, meta, version)
+        for filename in indexed.keys() - on_disk.keys():
+            self.remove_document(filename)
+
+    def search(self, text, limit=20, filename=None, q_type=None):
+        """Return ranked hits for text, best first."""
+        match = build_match_query(text)
+        if match is None:
+            return []
+        self.sync()
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        clauses = ['questions_fts MATCH ?']
+        params = [match]
+        if filename:
+            clauses.append('filename = ?')
+            params.append(filename)
+        if q_type:
+            clauses.append('type = ?')
+            params.append(q_type)
+        rows = self._conn().execute(
+            "SELECT filename, question_id, type, "
+            "snippet(questions_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet, "
+            "correct_answer, bm25(questions_fts, 10.0, 3.0, 2.0) AS rank "
+            f"FROM questions_fts WHERE {' AND '.join(clauses)} ORDER BY rank LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [
+            {
+                'filename': row['filename'],
+                'question_id': row['question_id'],
+                'type': row['type'],
+                'snippet': row['snippet'],
+                'correct_answer': row['correct_answer'],
+                'score': round(-row['rank'], 4),
+            }
+            for row in rows
+        ]
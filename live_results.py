@@ -0,0 +1,324 @@
+"""
+Live results for proctors.
+
+/results/live/events?exam_id=... is a server-sent events stream. It sends
+the exam's aggregates when the dashboard connects, then one update per
+poll with the newly stored submissions and the refreshed aggregates:
+submissions so far, mean percentage, score distribution and per-question
+pass rate.
+
+Each worker runs one LiveResults bus. Its tail thread reads results added
+since the last poll (results may be stored by any worker), folds them into
+the aggregates of the exams someone is watching, and serializes one
+update per exam. Every viewer of that exam gets the same bytes, so an
+extra viewer costs a queue append, not a query. Exams nobody watches are
+skipped, and their aggregates are dropped once no stream is open and no
+one has connected or polled for KEEP_WATCHED_SECONDS.
+
+Streams hold a worker thread while open, so they are capped per worker
+(max_streams) and end after stream_seconds. The browser's EventSource
+reconnects on its own and gets a fresh snapshot. A sync worker would be
+taken over by a single stream, so there the dashboard polls view()
+(/results/live) instead.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from results_archive import SCORE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+RECENT_SUBMISSIONS = 20  # sent with the snapshot when a dashboard connects
+SUBSCRIBER_BUFFER = 50   # updates queued per viewer; a stalled viewer loses the oldest
+HEARTBEAT_SECONDS = 15
+RECONNECT_MS = 3000
+KEEP_WATCHED_SECONDS = 60  # aggregates outlive the last poll (or stream connect) by this long
+
+
+class LiveFull(Exception):
+    pass
+
+
+def _summary(result):
+    return {
+        'id': result['id'],
+        'student_name': result.get('student_name'),
+        'score': result.get('score'),
+        'total': result.get('total'),
+        'percentage': result.get('percentage'),
+        'submitted_at': result.get('submitted_at') or result.get('timestamp'),
+    }
+
+
+def _event(name, payload, event_id=None):
+    data = json.dumps(payload, separators=(',', ':'))
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {name}\ndata: {data}\n\n'
+
+
+class ExamAggregate:
+    """Running totals for one exam, updated one result at a time."""
+
+    def __init__(self, exam_id):
+        self.exam_id = exam_id
+        self.count = 0
+        self.percentage_sum = 0.0
+        self.buckets = [0] * SCORE_BUCKETS
+        self.questions = {}  # answer key ('q3') -> [question text, passed, graded]
+        self.recent = deque(maxlen=RECENT_SUBMISSIONS)
+
+    def add(self, result, key, decisions):
+        percentage = float(result.get('percentage') or 0)
+        self.count += 1
+        self.percentage_sum += percentage
+        self.buckets[min(int(percentage // (100 / SCORE_BUCKETS)), SCORE_BUCKETS - 1)] += 1
+        for question, correct in zip(key.questions, decisions):
+            stats = self.questions.get(f"q{question['id']}")
+            if stats is None:
+                stats = self.questions[f"q{question['id']}"] = [question.get('question'), 0, 0]
+            stats[1] += correct
+            stats[2] += 1
+        self.recent.append(_summary(result))
+
+    def stats(self):
+        width = 100 // SCORE_BUCKETS
+        return {
+            'exam_id': self.exam_id,
+            'results': self.count,
+            'mean_percentage': round(self.percentage_sum / self.count, 2) if self.count else None,
+            'score_distribution': [
+                {'range': f'{i * width}-{(i + 1) * width}', 'count': count} for i, count in enumerate(self.buckets)
+            ],
+            'questions': [
+                {'id': answer_key, 'question': text, 'passed': passed, 'graded': graded,
+                 'pass_rate': round(passed / graded, 4) if graded else None}
+                for answer_key, (text, passed, graded) in self.questions.items()
+            ],
+        }
+
+
+class _Subscriber:
+    __slots__ = ('exam_id', 'events', 'closed')
+
+    def __init__(self, exam_id):
+        self.exam_id = exam_id
+        self.events = deque(maxlen=SUBSCRIBER_BUFFER)
+        self.closed = False
+
+
+class LiveResults:
+    def __init__(self, store, answer_keys, poll_interval=0.5, max_streams=20, stream_seconds=300):
+        self.store = store
+        self.answer_keys = answer_keys
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.stream_seconds = stream_seconds
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        """Set up this process's bus and tail thread (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._lock = threading.Lock()
+            self._changed = threading.Condition(self._lock)
+            self._aggregates = {}  # exam_id -> ExamAggregate, only for watched exams
+            self._subscribers = {}  # exam_id -> set of _Subscriber
+            self._keep_until = {}  # exam_id -> monotonic time it stays watched without an open stream
+            self._streams = 0
+            self._last_id = None  # newest result folded in; None while nothing is watched
+            self._pid = os.getpid()
+            threading.Thread(target=self._run_tail, name='live-results', daemon=True).start()
+
+    # --- Aggregation ---
+
+    def _decide(self, result):
+        """(key, per-question decisions) for a result, or (None, None) if its key is unknown."""
+        key = self.answer_keys.get(result['exam_id'], result.get('key_version'))
+        if key is None:
+            return None, None
+        return key, self.answer_keys.scorer(key).decisions(result.get('answers') or {})
+
+    def _backfill(self, exam_id, up_to_id):
+        aggregate = ExamAggregate(exam_id)
+        for batch in self.store.iter_batches(0, up_to_id=up_to_id, exam_id=exam_id):
+            for result in batch:
+                key, decisions = self._decide(result)
+                if key is not None:
+                    aggregate.add(result, key, decisions)
+        return aggregate
+
+    def _run_tail(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception('Live results poll failed: %s', e)
+
+    def poll(self):
+        """Fold results stored since the last poll into the watched exams and notify viewers."""
+        with self._lock:
+            self._drop_unwatched()
+            last_id = self._last_id
+            watched = set(self._aggregates)
+        if last_id is None:
+            return
+        new = {}  # exam_id -> results, for watched exams only
+        newest = last_id
+        for batch in self.store.iter_batches(after_id=last_id):
+            for result in batch:
+                newest = result['id']
+                if result.get('exam_id') in watched:
+                    new.setdefault(result['exam_id'], []).append(result)
+        if newest == last_id:
+            return
+        # Scored outside the lock, so connecting viewers never wait on it
+        decided = {exam_id: [(result,) + self._decide(result) for result in results]
+                   for exam_id, results in new.items()}
+        with self._lock:
+            if self._last_id != last_id or not self._aggregates.keys() <= watched:
+                return  # the bus was reset, or an exam was backfilled up to last_id meanwhile; redo next poll
+            self._last_id = newest
+            for exam_id, results in decided.items():
+                aggregate = self._aggregates.get(exam_id)
+                if aggregate is None:
+                    continue
+                for result, key, decisions in results:
+                    if key is not None:
+                        aggregate.add(result, key, decisions)
+                # Serialized once, shared by every viewer of the exam
+                event = _event('update', {
+                    'submissions': [_summary(result) for result, _, _ in results],
+                    'stats': aggregate.stats(),
+                }, event_id=newest)
+                for subscriber in self._subscribers.get(exam_id, ()):
+                    subscriber.events.append(event)
+            self._changed.notify_all()
+
+    # --- Viewers ---
+
+    def _watch(self, exam_id):
+        """
+        Start keeping exam_id's aggregate. The backfill scan runs outside the
+        lock, like poll()'s scoring, so other viewers and the tail never wait
+        on it; results the tail moved past meanwhile are folded in before the
+        aggregate is installed.
+        """
+        with self._lock:
+            if exam_id in self._aggregates:
+                return
+            if self._last_id is None:
+                self._last_id = self.store.max_id()
+            up_to_id = self._last_id
+        aggregate = self._backfill(exam_id, up_to_id)
+        while True:
+            with self._lock:
+                if exam_id in self._aggregates:
+                    return  # another viewer got there first
+                if self._last_id is None:
+                    self._last_id = up_to_id  # the last viewer left meanwhile; restart the bus here
+                if self._last_id == up_to_id:
+                    self._aggregates[exam_id] = aggregate
+                    return
+                tail_id = self._last_id
+            for batch in self.store.iter_batches(up_to_id, up_to_id=tail_id, exam_id=exam_id):
+                for result in batch:
+                    key, decisions = self._decide(result)
+                    if key is not None:
+                        aggregate.add(result, key, decisions)
+            up_to_id = tail_id
+
+    def subscribe(self, exam_id):
+        """Register a viewer of exam_id and return it with the snapshot event; raises LiveFull."""
+        self._start()
+        with self._lock:
+            if self._streams >= self.max_streams:
+                raise LiveFull()
+            self._streams += 1
+            self._keep(exam_id)  # so nothing drops it between the backfill and registering
+        try:
+            while True:
+                self._watch(exam_id)
+                with self._lock:
+                    aggregate = self._aggregates.get(exam_id)
+                    if aggregate is None:
+                        continue  # dropped before we registered; watch again
+                    subscriber = _Subscriber(exam_id)
+                    self._subscribers.setdefault(exam_id, set()).add(subscriber)
+                    snapshot = _event('snapshot', {'submissions': list(aggregate.recent), 'stats': aggregate.stats()},
+                                      event_id=self._last_id)
+                    return subscriber, snapshot
+        except BaseException:
+            with self._lock:
+                self._streams -= 1
+            raise
+
+    def view(self, exam_id, after_id=0):
+        """
+        For dashboards that poll instead of streaming: the aggregates plus the
+        recent submissions newer than after_id. The exam stays watched for
+        KEEP_WATCHED_SECONDS after each call.
+        """
+        self._start()
+        while True:
+            with self._lock:
+                self._keep(exam_id)
+            self._watch(exam_id)
+            with self._lock:
+                aggregate = self._aggregates.get(exam_id)
+                if aggregate is None:
+                    continue
+                return {
+                    'last_id': self._last_id,
+                    'submissions': [r for r in aggregate.recent if r['id'] > after_id],
+                    'stats': aggregate.stats(),
+                }
+
+    def _keep(self, exam_id):
+        """Keep exam_id watched for a while without a stream; call with the lock held."""
+        self._keep_until[exam_id] = time.monotonic() + KEEP_WATCHED_SECONDS
+
+    def _drop_unwatched(self):
+        """Forget exams with no open stream whose keep time is over; call with the lock held."""
+        now = time.monotonic()
+        for exam_id in [e for e, until in self._keep_until.items() if until <= now]:
+            del self._keep_until[exam_id]
+        for exam_id in [e for e in self._aggregates if e not in self._subscribers and e not in self._keep_until]:
+            del self._aggregates[exam_id]
+        if not self._aggregates:
+            self._last_id = None
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber.closed:
+                return
+            self._streams -= 1
+            subscriber.closed = True
+            self._changed.notify_all()
+            watchers = self._subscribers.get(subscriber.exam_id)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self._subscribers[subscriber.exam_id]
+            self._drop_unwatched()
+
+    def stream(self, subscriber, snapshot):
+        """Generator of SSE text for a subscribed viewer; call unsubscribe() when the response closes."""
+        deadline = time.monotonic() + self.stream_seconds
+        yield f'retry: {RECONNECT_MS}\n' + snapshot
+        while time.monotonic() < deadline and not subscriber.closed:
+            with self._changed:
+                self._changed.wait_for(lambda: subscriber.events or subscriber.closed,
+                                       timeout=min(HEARTBEAT_SECONDS, deadline - time.monotonic()))
+                pending = list(subscriber.events)
+                subscriber.events.clear()
+            yield ''.join(pending) if pending else ': keepalive\n\n'
@@ -0,0 +1,322 @@
+"""
+Opt-in request metrics and profiling.
+
+Enabled with METRICS_ENABLED=1. Each process keeps its own counters and
+latency histograms in memory and writes a snapshot of them to
+METRICS_DIR/metrics-<pid>.json at most once a second; /metrics adds up
+the snapshots of every gunicorn worker (and extraction pool process) and
+serves them in the Prometheus text format.
+
+Recorded automatically:
+  - keeplearning_requests_total{route, method, status}
+  - keeplearning_request_duration_seconds{route, method}  (histogram)
+  - keeplearning_template_render_seconds{template}         (histogram)
+Plus whatever the app wraps in metrics.timer('name') / @metrics.timed('name'),
+as keeplearning_operation_duration_seconds{operation}. Gauges (set_gauge())
+are summed over the processes that are still running.
+
+PROFILE_SAMPLE_RATE (e.g. 0.01) runs cProfile on that share of requests and
+writes one .prof file per profiled request to PROFILE_DIR.
+
+When metrics are disabled, timer() returns a shared no-op context manager
+and timed() returns the function unchanged, so instrumented code pays
+nothing.
+"""
+
+import atexit
+import cProfile
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'keeplearning_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FLUSH_INTERVAL = 1.0  # seconds between snapshot writes per process
+
+HELP = {
+    'requests_total': ('counter', 'HTTP requests handled'),
+    'request_duration_seconds': ('histogram', 'Time spent handling HTTP requests'),
+    'template_render_seconds': ('histogram', 'Time spent rendering templates'),
+    'operation_duration_seconds': ('histogram', 'Time spent in instrumented operations'),
+    'admission_active': ('gauge', 'Requests being handled, by route class'),
+    'admission_queue_depth': ('gauge', 'Requests waiting for a slot, by route class'),
+    'admission_rejected_total': ('counter', 'Requests refused by admission control'),
+    'admission_wait_seconds': ('histogram', 'Time requests waited for a slot'),
+}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'labels', 'started')
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe('operation_duration_seconds', time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    def __init__(self, directory, enabled=False, profile_rate=0.0, profile_dir=None):
+        self.directory = directory
+        self.enabled = enabled
+        self.profile_rate = profile_rate if enabled else 0.0
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._reset()
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+        if self.profile_rate:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters = {}    # (name, label key) -> value
+        self._histograms = {}  # (name, label key) -> [bucket counts..., sum, count]
+        self._gauges = {}      # (name, label key) -> value
+        self._last_flush = 0.0  # so a new process shows up right away
+
+    def _check_pid(self):
+        # State inherited from the parent over a fork belongs to the parent
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            self._gauges[key] = value
+        self.maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += seconds
+            hist[-1] += 1
+        self.maybe_flush()
+
+    def timer(self, operation):
+        """Context manager that records the time spent in its block."""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, {'operation': operation})
+
+    def timed(self, operation):
+        """Decorator version of timer()."""
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(operation):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # --- Cross-process aggregation ---
+
+    def _snapshot(self):
+        with self._lock:
+            self._check_pid()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), hist] for (name, labels), hist in self._histograms.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+                'pid': os.getpid(),
+            }
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        if not self.enabled:
+            return
+        snapshot = self._snapshot()
+        self._last_flush = time.monotonic()
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._snapshot_path(os.getpid()))
+        except OSError as e:
+            logger.warning('Could not write metrics snapshot: %s', e)
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def collect(self):
+        """Add up the snapshots of every process; this process uses its live values."""
+        counters, histograms, gauges = {}, {}, {}
+        snapshots = [self._snapshot()]
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        for entry in os.scandir(self.directory):
+            if not entry.name.startswith('metrics-') or not entry.name.endswith('.json') or entry.name == own:
+                continue
+            try:
+                with open(entry.path, 'r') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(item) for item in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, hist in snapshot['histograms']:
+                key = (name, tuple(tuple(item) for item in labels))
+                total = histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(hist):
+                    total[i] += value
+            # Counters of exited processes still count; their gauges don't
+            if snapshot.get('gauges') and _alive(snapshot.get('pid')):
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, tuple(tuple(item) for item in labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        return counters, histograms, gauges
+
+    def render(self):
+        """Prometheus text exposition of the aggregated metrics."""
+        counters, histograms, gauges = self.collect()
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                kind, text = HELP.get(name, ('untyped', name))
+                lines.append(f'# HELP {PREFIX}{name} {text}')
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+                described.add(name)
+
+        for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+            describe(name)
+            lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+        for (name, labels), hist in sorted(histograms.items()):
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, ("le", "+Inf"))} {hist[-1]}')
+            lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {hist[-2]}')
+            lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {hist[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    # --- Flask integration ---
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        from flask import g, request, template_rendered, before_render_template
+
+        @app.before_request
+        def _start_request():
+            g._metrics_started = time.perf_counter()
+            if self.profile_rate and random.random() < self.profile_rate:
+                g._profiler = cProfile.Profile()
+                g._profiler.enable()
+
+        @app.after_request
+        def _finish_request(response):
+            started = g.pop('_metrics_started', None)
+            profiler = g.pop('_profiler', None)
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(profiler, request.endpoint or 'unmatched')
+            if started is not None:
+                self.observe('request_duration_seconds', time.perf_counter() - started,
+                             route=route, method=request.method)
+            self.inc('requests_total', route=route, method=request.method, status=response.status_code)
+            return response
+
+        def _template_started(sender, template, context, **extra):
+            g._template_started = time.perf_counter()
+
+        def _template_done(sender, template, context, **extra):
+            started = g.pop('_template_started', None)
+            if started is not None:
+                self.observe('template_render_seconds', time.perf_counter() - started,
+                             template=template.name or 'string')
+
+        before_render_template.connect(_template_started, app, weak=False)
+        template_rendered.connect(_template_done, app, weak=False)
+
+    def _dump_profile(self, profiler, endpoint):
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof'
+        try:
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+        except OSError as e:
+            logger.warning('Could not write profile %s: %s', name, e)
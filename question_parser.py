@@ -0,0 +1,176 @@
+"""
+Single-pass question parser used by extract_questions.
+
+Documents are a sequence of question blocks, each followed by an
+"Answer: ..." line:
+
+    Which of the following is used to define a function in Python?
+    (a) func
+    (b) def
+    Answer: def
+
+parse_lines() walks the document line by line as a small state machine, so
+every character is looked at once and lines can be fed straight from a
+streaming reader. A block's type is decided while scanning its lines:
+  - mcq:         two or more "A. ..." / "A) ..." / "(a) ..." option lines
+  - true_false:  contains "True or False"
+  - fill_blank:  contains an underscore
+  - descriptive: anything else
+"""
+
+import re
+
+from docx_reader import iter_paragraphs
+
+# "Answer:" / "answer -" anywhere in a line, plus the spaces after it
+ANSWER_RE = re.compile(r'Answer[^\S\n]*[:\-][^\S\n]*', re.IGNORECASE)
+# "A. text" / "A) text" or "(a) text" / "(A) text" at the start of a line
+OPTION_RE = re.compile(r'(?:([A-D])[.)]|\(([A-Da-d])\))\s+(.+)')
+# An answer that is just an option letter: "B", "b)", "(b)", "B. UNIQUE"
+LETTER_RE = re.compile(r'\(?([A-Da-d])\)?(?:[.):\s]|$)')
+TRUE_FALSE_RE = re.compile(r'True or False', re.IGNORECASE)
+
+OPTION_START = frozenset('ABCD(')
+
+# Parser states
+IN_BLOCK = 0       # collecting question text
+ANSWER_SPACE = 1   # just read "Answer:", skipping whitespace before the answer
+
+
+def _resolve_mcq_answer(answer_text, options):
+    """Map an MCQ answer (option text or option letter) to the option text."""
+    if not answer_text:
+        return None
+    lowered = answer_text.lower()
+    for option in options:
+        if option.lower() == lowered:
+            return option
+    letter = LETTER_RE.match(answer_text)
+    if letter:
+        index = ord(letter.group(1).upper()) - ord('A')
+        if 0 <= index < len(options):
+            return options[index]
+        return letter.group(1).upper()
+    return answer_text
+
+
+def build_question(q_id, q_block, answer_text):
+    """Classify one question block and return its question dict."""
+    options = []
+    for line in q_block.split('\n'):
+        if line[:1] in OPTION_START:
+            match = OPTION_RE.match(line)
+            if match:
+                options.append(match.group(3).strip())
+
+    if len(options) >= 2:
+        return {
+            'id': q_id,
+            'question': q_block,
+            'type': 'mcq',
+            'options': options,
+            'correct_answer': _resolve_mcq_answer(answer_text, options)
+        }
+    if TRUE_FALSE_RE.search(q_block):
+        return {
+            'id': q_id,
+            'question': q_block,
+            'type': 'true_false',
+            'correct_answer': answer_text if answer_text in ('True', 'False') else 'True'
+        }
+    if '_' in q_block:
+        return {
+            'id': q_id,
+            'question': q_block,
+            'type': 'fill_blank',
+            'correct_answer': answer_text
+        }
+    return {
+        'id': q_id,
+        'question': q_block,
+        'type': 'descriptive',
+        'correct_answer': answer_text
+    }
+
+
+def parse_lines(lines):
+    """
+    Yield question dicts from an iterable of text lines (or paragraphs).
+
+    Question IDs count every "Answer:" marker, so a marker whose block is
+    empty or shorter than 3 characters leaves a gap in the numbering.
+    """
+    state = IN_BLOCK
+    block = []          # lines of the current question block
+    answer = ''
+    q_block = None      # block waiting for its answer (None = skip it)
+    marker_count = 0
+    search = ANSWER_RE.search
+
+    for para in lines:
+        if '\n' in para or '\r' in para:
+            para_lines = para.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        else:
+            para_lines = (para,)
+
+        for line in para_lines:
+            # Fast path: most lines have no "Answer:" marker
+            if search(line) is None:
+                if state == IN_BLOCK:
+                    block.append(line)
+                    continue
+                rest = line.strip()
+                if not rest:
+                    continue  # still skipping whitespace before the answer
+                answer = rest
+            else:
+                pos = 0
+                for match in ANSWER_RE.finditer(line):
+                    segment = line[pos:match.start()]
+                    pos = match.end()
+                    if state == IN_BLOCK:
+                        q_block = '\n'.join(block + [segment]).strip()
+                    else:
+                        # A second marker on the answer line ends the previous
+                        # answer; the new marker has no question text of its own
+                        answer = segment.strip()
+                        if q_block is not None and len(q_block) >= 3:
+                            yield build_question(marker_count, q_block, answer)
+                        q_block = None
+                    block = []
+                    marker_count += 1
+                    state = ANSWER_SPACE
+                answer = line[pos:].strip()
+                if not answer:
+                    continue  # the answer is on a following line
+
+            # The answer line is over; the next block starts on the next line
+            if q_block is not None and len(q_block) >= 3:
+                yield build_question(marker_count, q_block, answer)
+            q_block = None
+            answer = ''
+            state = IN_BLOCK
+
+    if state != IN_BLOCK and q_block is not None and len(q_block) >= 3:
+        yield build_question(marker_count, q_block, answer)
+
+
+def parse_text(text):
+    return list(parse_lines(text.split('\n')))
+
+
+def iter_questions_from_file(filepath):
+    """
+    Yield question dicts from a .docx or .txt file as they are parsed.
+    .docx files are streamed paragraph by paragraph (see docx_reader).
+    """
+    if filepath.endswith('.docx'):
+        yield from parse_lines(iter_paragraphs(filepath))
+    elif filepath.endswith('.txt'):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            yield from parse_lines(line.rstrip('\n') for line in f)
+
+
+def extract_questions_from_file(filepath):
+    """Read a .docx or .txt file and return its list of question dicts."""
+    return list(iter_questions_from_file(filepath))
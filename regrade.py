@@ -0,0 +1,352 @@
+"""
+Bulk re-grading of stored results.
+
+When an answer key in library_docs/meta is corrected, every stored result
+that used those questions has to be scored again. A re-grade run:
+  - registers a new answer-key version (answer_keys.py) for every exam
+    whose questions changed in the library (matched on the question text)
+  - streams stored results in id order, a batch at a time
+  - re-scores results that reference an older key version against the
+    current one on a process pool, with the same thresholds as submit_exam
+    (scoring.ExamScorer); older results that embed their questions have
+    those questions updated from the library instead
+  - writes changed results back after every batch and checkpoints the
+    last result id, so an interrupted run can be resumed where it stopped
+  - holds a lease on the run, renewed at every checkpoint, so a run is
+    never processed by two workers at once; a run whose worker died can
+    be resumed once its lease runs out (LEASE_SECONDS)
+
+Runs are recorded in the results database. From the command line:
+
+    python regrade.py                          # re-grade against all documents
+    python regrade.py --document pydevsample.docx
+    python regrade.py --resume <run_id>
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from answer_keys import AnswerKeyRegistry
+from db import get_connection
+from scoring import ExamScorer
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+LEASE_SECONDS = 300  # a running run not checkpointed for this long is taken to be dead
+
+
+class RunBusy(Exception):
+    pass
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def normalize_question_text(text):
+    return ' '.join((text or '').split()).lower()
+
+
+def load_answer_keys(meta_folder, documents=None):
+    """Map normalized question text -> current answer key fields from the library."""
+    keys = {}
+    for meta_file in sorted(os.listdir(meta_folder)):
+        if not meta_file.endswith('.json'):
+            continue
+        if documents and meta_file[:-len('.json')] not in documents:
+            continue
+        try:
+            with open(os.path.join(meta_folder, meta_file), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception as e:
+            logger.warning("Skipping %s: %s", meta_file, e)
+            continue
+        for q in meta.get('questions', []):
+            key = {'type': q.get('type'), 'correct_answer': q.get('correct_answer')}
+            if 'options' in q:
+                key['options'] = q['options']
+            keys[normalize_question_text(q.get('question'))] = key
+    return keys
+
+
+def apply_answer_keys(questions, keys):
+    """Return questions with type/options/correct_answer taken from the library keys."""
+    updated = []
+    for q in questions:
+        key = keys.get(normalize_question_text(q.get('question')))
+        updated.append(dict(q, **key) if key else q)
+    return updated
+
+
+def refresh_exam_keys(registry, keys):
+    """Register a new key version for every exam whose questions changed; return how many."""
+    refreshed = 0
+    for exam_key in registry.iter_latest():
+        questions = apply_answer_keys(exam_key.questions, keys)
+        if questions != exam_key.questions:
+            registry.register(exam_key.exam_id, questions)
+            refreshed += 1
+    return refreshed
+
+
+def _graded(result, score, total, **changes):
+    return dict(
+        result,
+        score=score,
+        total=total,
+        percentage=round((score / total) * 100, 2) if total > 0 else 0,
+        regraded_at=datetime.now().isoformat(),
+        **changes
+    )
+
+
+def regrade_result(result, keys):
+    """Return the re-graded result, or None if nothing about it changed."""
+    questions = result.get('questions') or []
+    new_questions = apply_answer_keys(questions, keys)
+
+    scorer = ExamScorer(new_questions)
+    score = scorer.score(result.get('answers') or {})
+    if new_questions == questions and score == result.get('score'):
+        return None
+    return _graded(result, score, scorer.total, questions=new_questions)
+
+
+def regrade_keyed_result(result, registry, latest):
+    """
+    Re-score a result that references an answer-key version against the
+    exam's current key. latest caches exam_id -> current key for the run.
+    """
+    exam_id = result['exam_id']
+    if exam_id not in latest:
+        latest[exam_id] = registry.latest(exam_id)
+    key = latest[exam_id]
+    if key is None or key.version == result.get('key_version'):
+        return None
+    scorer = registry.scorer(key)
+    return _graded(result, scorer.score(result.get('answers') or {}), scorer.total, key_version=key.version)
+
+
+# Answer keys are sent to each pool process once, not with every batch
+_worker_keys = None
+_worker_registry = None
+_worker_latest = None
+
+
+def _init_worker(keys, db_path):
+    global _worker_keys, _worker_registry, _worker_latest
+    _worker_keys = keys
+    _worker_registry = AnswerKeyRegistry(db_path)
+    _worker_latest = {}
+
+
+def _regrade_batch(batch):
+    changed = []
+    for result in batch:
+        if result.get('exam_id') and 'questions' not in result:
+            updated = regrade_keyed_result(result, _worker_registry, _worker_latest)
+        else:
+            updated = regrade_result(result, _worker_keys)
+        if updated is not None:
+            changed.append(updated)
+    return changed
+
+
+_schema_ready = set()
+
+
+def _runs(db_path):
+    conn = get_connection(db_path)
+    if (os.getpid(), db_path) in _schema_ready:
+        return conn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS regrade_runs (
+            run_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            documents TEXT,
+            up_to_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL,
+            processed INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            results_per_second REAL,
+            error TEXT,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            owner TEXT,
+            lease_until REAL
+        )
+    """)
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(regrade_runs)')}
+    for column, kind in (('owner', 'TEXT'), ('lease_until', 'REAL')):
+        if column not in columns:
+            # Tables created before runs had leases; another worker may be adding it too
+            try:
+                conn.execute(f'ALTER TABLE regrade_runs ADD COLUMN {column} {kind}')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e):
+                    raise
+    _schema_ready.add((os.getpid(), db_path))
+    return conn
+
+
+def claim_run(store, run_id):
+    """
+    Take a run's lease so only one process or thread works on it. Returns
+    the owner token, or None if the run is done or another owner's lease is
+    still current. A running run whose owner died can be claimed once its
+    lease (renewed at every checkpoint) has run out.
+    """
+    owner = uuid.uuid4().hex
+    now = time.time()
+    cur = _runs(store.db_path).execute(
+        "UPDATE regrade_runs SET status = 'running', error = NULL, owner = ?, lease_until = ?, updated_at = ? "
+        "WHERE run_id = ? AND status != 'done' AND (status != 'running' OR COALESCE(lease_until, 0) < ?)",
+        (owner, now + LEASE_SECONDS, datetime.now().isoformat(), run_id, now)
+    )
+    return owner if cur.rowcount else None
+
+
+def _update_run(store, run_id, owner, **fields):
+    """Update the run and renew owner's lease; raises LeaseLost if the run has another owner now."""
+    fields['updated_at'] = datetime.now().isoformat()
+    fields.setdefault('lease_until', time.time() + LEASE_SECONDS)
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    cur = _runs(store.db_path).execute(
+        f'UPDATE regrade_runs SET {assignments} WHERE run_id = ? AND owner = ?',
+        list(fields.values()) + [run_id, owner]
+    )
+    if not cur.rowcount:
+        raise LeaseLost(f'Re-grade run {run_id} was taken over by another worker')
+
+
+def get_run(store, run_id):
+    row = _runs(store.db_path).execute('SELECT * FROM regrade_runs WHERE run_id = ?', (run_id,)).fetchone()
+    if row is None:
+        return None
+    run = dict(row)
+    run['documents'] = json.loads(run['documents']) if run['documents'] else None
+    del run['owner']
+    return run
+
+
+def create_run(store, documents=None):
+    """Record a new run covering every result stored so far; return its ID."""
+    run_id = uuid.uuid4().hex[:12]
+    up_to_id = store.max_id()
+    total = store.count(up_to_id)
+    now = datetime.now().isoformat()
+    _runs(store.db_path).execute(
+        'INSERT INTO regrade_runs (run_id, status, documents, up_to_id, total, started_at, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (run_id, 'queued', json.dumps(documents) if documents else None, up_to_id, total, now, now)
+    )
+    return run_id
+
+
+def run_regrade(store, meta_folder, run_id, workers=None, batch_size=BATCH_SIZE, on_progress=None, owner=None):
+    """
+    Run (or resume) a re-grade run until every result up to the run's
+    up_to_id has been processed. Returns the final run record. owner is
+    the token from claim_run() if the caller already claimed the run;
+    otherwise it is claimed here, and RunBusy is raised if that fails.
+    """
+    run = get_run(store, run_id)
+    if run is None:
+        raise ValueError(f'Unknown re-grade run: {run_id}')
+    if run['status'] == 'done':
+        return run
+    if owner is None:
+        owner = claim_run(store, run_id)
+        if owner is None:
+            raise RunBusy(f'Re-grade run {run_id} is already running')
+        run = get_run(store, run_id)
+
+    keys = load_answer_keys(meta_folder, run['documents'])
+    processed = run['processed']
+    changed = run['changed']
+    started = time.perf_counter()
+    processed_now = 0
+
+    workers = workers or os.cpu_count() or 1
+    in_flight = deque()
+
+    def drain_one():
+        nonlocal processed, changed, processed_now
+        future, last_id, size = in_flight.popleft()
+        updated = future.result()
+        if updated:
+            store.update_results(updated)
+        processed += size
+        processed_now += size
+        changed += len(updated)
+        elapsed = time.perf_counter() - started
+        rate = processed_now / elapsed if elapsed > 0 else None
+        # Checkpoint after the write: a crash in between only redoes this batch
+        _update_run(store, run_id, owner, last_id=last_id, processed=processed, changed=changed,
+                    results_per_second=rate)
+        if on_progress:
+            on_progress(get_run(store, run_id))
+
+    try:
+        # Safe to repeat on resume: unchanged exams get no new version
+        refresh_exam_keys(AnswerKeyRegistry(store.db_path), keys)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(keys, store.db_path)) as pool:
+            for batch in store.iter_batches(run['last_id'], run['up_to_id'], batch_size):
+                in_flight.append((pool.submit(_regrade_batch, batch), batch[-1]['id'], len(batch)))
+                # Bounded window keeps memory flat and batches committed in order
+                if len(in_flight) >= workers * 2:
+                    drain_one()
+            while in_flight:
+                drain_one()
+    except LeaseLost:
+        raise
+    except Exception as e:
+        _update_run(store, run_id, owner, status='failed', error=str(e), lease_until=None)
+        raise
+    _update_run(store, run_id, owner, status='done', lease_until=None)
+    return get_run(store, run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-grade stored exam results against the current library answer keys.')
+    parser.add_argument('--document', action='append', dest='documents',
+                        help='only use answer keys from this library document (repeatable)')
+    parser.add_argument('--resume', metavar='RUN_ID', help='resume an interrupted run')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import results_archive, results_store, LIBRARY_META_FOLDER
+
+    run_id = args.resume or create_run(results_store, args.documents)
+    print(f"Re-grade run {run_id}")
+    archived = results_archive.count()
+    if archived:
+        print(f"  {archived} archived results are not re-graded")
+
+    def report(run):
+        rate = run['results_per_second'] or 0
+        print(f"  {run['processed']}/{run['total']} results, {run['changed']} changed, {rate:.0f} results/s")
+
+    try:
+        run = run_regrade(results_store, LIBRARY_META_FOLDER, run_id, workers=args.workers,
+                          batch_size=args.batch_size, on_progress=report)
+    except RunBusy as e:
+        sys.exit(f"✗ {e}")
+    print(f"✓ Done: {run['processed']} results processed, {run['changed']} changed")
+
+
+if __name__ == '__main__':
+    main()
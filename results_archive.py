@@ -0,0 +1,628 @@
+"""
+Columnar archive of old exam results, with analytics.
+
+Compaction moves results older than a cutoff out of the results database
+into immutable chunk files in results_archive/. A chunk stores each field
+as its own column:
+  - ids, scores, totals and percentages as packed binary arrays
+  - strings (names, timestamps, answers) as zlib-compressed JSON lists
+  - per-question correctness as one bit array per question, for every
+    (exam, answer-key version) group in the chunk
+
+The bit arrays are Python ints, so p-values (share of students answering a
+question correctly) and upper/lower-27% discrimination indices come from a
+few AND + popcount operations per question instead of a loop over every
+result. Questions are never stored in a chunk for keyed results; they stay
+in the answer-key registry.
+
+Chunks are listed in the archive_chunks table of the results database. A
+chunk is only listed, and its rows only deleted from the results table, in
+one transaction after the file has been fully written, so an interrupted
+compaction leaves at most an unlisted file that a later run removes once
+it is older than ORPHAN_GRACE_SECONDS.
+
+Archived results leave the results table: /results/query and re-grading
+no longer see them (both report how many there are), while
+/results/<id>, /download/results and analytics read them from the chunks.
+
+Analytics over live results keep the same columns per worker and only
+score results added since the previous call; they are rebuilt when a
+compaction, clear or re-grade changes results already counted.
+
+From the command line:
+
+    python results_archive.py --older-than-days 90
+    python results_archive.py --before 2025-01-01 --vacuum
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from db import get_connection, transaction
+from scoring import ExamScorer
+
+MAGIC = b'KRA1'
+CHUNK_ROWS = 20000
+DISCRIMINATION_SHARE = 0.27  # upper/lower group size for discrimination indices
+SCORE_BUCKETS = 10
+ORPHAN_GRACE_SECONDS = 3600  # unlisted files younger than this may belong to a running compaction
+
+# Fields kept in their own columns; anything else goes to the 'extra' column
+BASE_FIELDS = ('id', 'timestamp', 'student_name', 'score', 'total', 'percentage',
+               'started_at', 'submitted_at', 'answers', 'exam_id', 'key_version', 'questions')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_chunks (
+    name TEXT PRIMARY KEY,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def mask_of(rows, n):
+    """Bit array with the given row positions set."""
+    buf = bytearray((n + 7) // 8)
+    for i in rows:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+class GroupColumns:
+    """Scores and per-question correctness bits of the results for one answer key."""
+
+    def __init__(self, exam_id, key_version, questions):
+        self.exam_id = exam_id
+        self.key_version = key_version
+        self.questions = questions  # [{'id', 'question'}] for labels
+        self.scores = array('q')
+        self._bits = [0] * len(questions)
+        self._rows = [[] for _ in questions]  # correct rows added since the bits were last built
+
+    @property
+    def count(self):
+        return len(self.scores)
+
+    @property
+    def bits(self):
+        """One bit array per question. Rows added since the last read are set in one pass, not one shift each."""
+        if any(self._rows):
+            n = len(self.scores)
+            self._bits = [bits | mask_of(rows, n) if rows else bits for bits, rows in zip(self._bits, self._rows)]
+            self._rows = [[] for _ in self.questions]
+        return self._bits
+
+    @bits.setter
+    def bits(self, value):
+        self._bits = value
+        self._rows = [[] for _ in self.questions]
+
+    def add(self, score, decisions):
+        row = len(self.scores)
+        self.scores.append(score)
+        for j, correct in enumerate(decisions):
+            if correct:
+                self._rows[j].append(row)
+
+    def extend(self, other):
+        """Append other's rows after this group's rows."""
+        bits, shift = self.bits, len(self.scores)
+        self.scores.extend(other.scores)
+        self.bits = [a | (b << shift) for a, b in zip(bits, other.bits)]
+
+    def analyze(self):
+        n = self.count
+        k = max(1, math.ceil(n * DISCRIMINATION_SHARE))
+        # Bit masks of the top and bottom k results by score
+        order = sorted(range(n), key=self.scores.__getitem__)
+        lower = mask_of(order[:k], n)
+        upper = mask_of(order[-k:], n)
+        questions = []
+        for q, bits in zip(self.questions, self.bits):
+            questions.append({
+                'id': q['id'],
+                'question': q['question'],
+                'p_value': round(popcount(bits) / n, 4),
+                'discrimination': round((popcount(bits & upper) - popcount(bits & lower)) / k, 4),
+            })
+        return {
+            'exam_id': self.exam_id,
+            'key_version': self.key_version,
+            'results': n,
+            'mean_score': round(sum(self.scores) / n, 4),
+            'questions': questions,
+        }
+
+
+def _group_id(result):
+    if result.get('exam_id') and 'questions' not in result:
+        return f"{result['exam_id']}:{result.get('key_version')}"
+    # Older results embed their questions; group them by question set
+    texts = json.dumps([q.get('question') for q in result.get('questions') or []])
+    return f'embedded:{zlib.crc32(texts.encode("utf-8")):08x}'
+
+
+def _new_group(answer_keys, gid, result):
+    """(GroupColumns, embedded questions or None, scorer) for the first result of a group."""
+    if gid.startswith('embedded:'):
+        questions = result.get('questions') or []
+        return GroupColumns(None, None, questions), questions, ExamScorer(questions)
+    key = answer_keys.get(result['exam_id'], result.get('key_version'))
+    scorer = answer_keys.scorer(key) if key else ExamScorer([])
+    return GroupColumns(result['exam_id'], result.get('key_version'), key.questions if key else []), None, scorer
+
+
+class ColumnBuilder:
+    """Accumulates results column by column."""
+
+    def __init__(self, answer_keys):
+        self.answer_keys = answer_keys
+        self.ids = array('q')
+        self.scores = array('q')
+        self.totals = array('q')
+        self.percentages = array('d')
+        self.group_index = array('q')
+        self.strings = {name: [] for name in ('timestamp', 'student_name', 'started_at', 'submitted_at')}
+        self.answers = []
+        self.extra = []
+        self.groups = {}  # group id -> (GroupColumns, embedded questions or None)
+        self._group_numbers = {}
+        self._scorers = {}
+
+    def _group(self, result):
+        gid = _group_id(result)
+        if gid not in self.groups:
+            columns, embedded, self._scorers[gid] = _new_group(self.answer_keys, gid, result)
+            self.groups[gid] = (columns, embedded)
+            self._group_numbers[gid] = len(self._group_numbers)
+        return gid
+
+    def add(self, result):
+        gid = self._group(result)
+        columns = self.groups[gid][0]
+        answers = result.get('answers') or {}
+        columns.add(result.get('score', 0), self._scorers[gid].decisions(answers))
+
+        self.ids.append(result['id'])
+        self.scores.append(result.get('score', 0) or 0)
+        self.totals.append(result.get('total', 0) or 0)
+        self.percentages.append(float(result.get('percentage', 0) or 0))
+        self.group_index.append(self._group_numbers[gid])
+        for name, values in self.strings.items():
+            values.append(result.get(name))
+        self.answers.append(answers)
+        self.extra.append({k: v for k, v in result.items() if k not in BASE_FIELDS} or None)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _pack_array(values):
+    return {'type': 'array', 'typecode': values.typecode}, values.tobytes()
+
+
+def _pack_json(values):
+    return {'type': 'json'}, zlib.compress(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+
+
+def _pack_bits(bits, n):
+    return {'type': 'bits'}, bits.to_bytes((n + 7) // 8 or 1, 'little')
+
+
+def write_chunk(path, builder):
+    """Write builder's columns to path atomically."""
+    sections = []
+    blobs = []
+    offset = 0
+
+    def add(name, packed):
+        nonlocal offset
+        info, blob = packed
+        info.update(name=name, offset=offset, length=len(blob))
+        sections.append(info)
+        blobs.append(blob)
+        offset += len(blob)
+
+    add('id', _pack_array(builder.ids))
+    add('score', _pack_array(builder.scores))
+    add('total', _pack_array(builder.totals))
+    add('percentage', _pack_array(builder.percentages))
+    add('group', _pack_array(builder.group_index))
+    for name, values in builder.strings.items():
+        add(name, _pack_json(values))
+    add('answers', _pack_json(builder.answers))
+    add('extra', _pack_json(builder.extra))
+
+    groups = []
+    for g, (columns, embedded) in enumerate(builder.groups.values()):
+        add(f'g{g}.scores', _pack_array(columns.scores))
+        for j, bits in enumerate(columns.bits):
+            add(f'g{g}.q{j}', _pack_bits(bits, columns.count))
+        groups.append({
+            'exam_id': columns.exam_id,
+            'key_version': columns.key_version,
+            'labels': [{'id': q.get('id'), 'question': q.get('question')} for q in columns.questions],
+            'embedded_questions': embedded,
+        })
+
+    header = json.dumps({
+        'rows': len(builder),
+        'byteorder': sys.byteorder,
+        'sections': sections,
+        'groups': groups,
+    }).encode('utf-8')
+
+    folder = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Chunk:
+    """Read access to one chunk file; sections are decoded on demand."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f'Not a results archive chunk: {path}')
+        header_len = struct.unpack('<I', data[4:8])[0]
+        self.header = json.loads(data[8:8 + header_len])
+        self._data = memoryview(data)[8 + header_len:]
+        self._sections = {s['name']: s for s in self.header['sections']}
+        self.rows = self.header['rows']
+
+    def column(self, name):
+        section = self._sections[name]
+        blob = self._data[section['offset']:section['offset'] + section['length']]
+        if section['type'] == 'array':
+            values = array(section['typecode'])
+            values.frombytes(blob)
+            if self.header['byteorder'] != sys.byteorder:
+                values.byteswap()
+            return values
+        if section['type'] == 'json':
+            return json.loads(zlib.decompress(blob))
+        return int.from_bytes(blob, 'little')
+
+    def groups(self):
+        for g, info in enumerate(self.header['groups']):
+            columns = GroupColumns(info['exam_id'], info['key_version'], info['labels'])
+            columns.scores = self.column(f'g{g}.scores')
+            columns.bits = [self.column(f'g{g}.q{j}') for j in range(len(info['labels']))]
+            yield columns
+
+    def _columns(self):
+        return {name: self.column(name) for name in
+                ('id', 'score', 'total', 'percentage', 'group', 'timestamp', 'student_name',
+                 'started_at', 'submitted_at', 'answers', 'extra')}
+
+    def _record(self, columns, i):
+        group = self.header['groups'][columns['group'][i]]
+        result = {
+            'id': columns['id'][i],
+            'timestamp': columns['timestamp'][i],
+            'student_name': columns['student_name'][i],
+            'score': columns['score'][i],
+            'total': columns['total'][i],
+            'percentage': columns['percentage'][i],
+            'started_at': columns['started_at'][i],
+            'submitted_at': columns['submitted_at'][i],
+        }
+        if group['embedded_questions'] is not None:
+            result['questions'] = group['embedded_questions']
+        else:
+            result['exam_id'] = group['exam_id']
+            result['key_version'] = group['key_version']
+        result['answers'] = columns['answers'][i]
+        result.update(columns['extra'][i] or {})
+        return result
+
+    def iter_results(self):
+        """Rebuild the original result records."""
+        columns = self._columns()
+        for i in range(self.rows):
+            yield self._record(columns, i)
+
+    def get(self, result_id):
+        """The original record of one result, or None."""
+        ids = self.column('id')
+        i = bisect_left(ids, result_id)
+        if i == len(ids) or ids[i] != result_id:
+            return None
+        return self._record(self._columns(), i)
+
+
+class LiveColumns:
+    """
+    Analytics columns for the live results table, extended as results are
+    added. Rows go into segments of at most CHUNK_ROWS per group, so
+    setting a row's bits never shifts an ever-growing int.
+    """
+
+    def __init__(self, answer_keys, version):
+        self.answer_keys = answer_keys
+        self.version = version  # (chunk names, store generation) the columns are valid for
+        self.last_id = 0
+        self.segments = [{}]  # [group id -> GroupColumns]
+        self.percentages = {}  # exam_id -> array('d')
+        self._scorers = {}
+        self._first = {}  # group id -> its first GroupColumns, for the labels
+
+    def add(self, result):
+        gid = _group_id(result)
+        columns = self.segments[-1].get(gid)
+        if columns is None or columns.count >= CHUNK_ROWS:
+            if columns is not None:
+                self.segments.append({})
+            if gid in self._scorers:
+                first = self._first[gid]
+                columns = GroupColumns(first.exam_id, first.key_version, first.questions)
+            else:
+                columns, _, self._scorers[gid] = _new_group(self.answer_keys, gid, result)
+                self._first[gid] = columns
+            self.segments[-1][gid] = columns
+        columns.add(result.get('score', 0), self._scorers[gid].decisions(result.get('answers') or {}))
+        self.percentages.setdefault(columns.exam_id, array('d')).append(float(result.get('percentage', 0) or 0))
+        self.last_id = result['id']
+
+    def groups(self):
+        return [columns for groups in self.segments for columns in groups.values()]
+
+
+def matches(result, student_name=None, date_from=None, date_to=None):
+    """The filters of results_store.build_filters, applied to one record."""
+    if student_name and not (result.get('student_name') or '').lower().startswith(student_name.lower()):
+        return False
+    timestamp = result.get('timestamp') or ''
+    if date_from and timestamp < date_from:
+        return False
+    if date_to:
+        if len(date_to) == 10:
+            date_to += 'T23:59:59.999999'
+        if timestamp > date_to:
+            return False
+    return True
+
+
+def _merge_groups(groups):
+    merged = {}
+    for columns in groups:
+        key = (columns.exam_id, columns.key_version,
+               json.dumps([q['question'] for q in columns.questions]) if columns.exam_id is None else None)
+        if key in merged:
+            merged[key].extend(columns)
+        else:
+            merged[key] = columns
+    return list(merged.values())
+
+
+def analyze(groups, percentages):
+    """Score distribution plus per-question p-values and discrimination for each exam."""
+    buckets = [0] * SCORE_BUCKETS
+    for p in percentages:
+        buckets[min(int(p // (100 / SCORE_BUCKETS)), SCORE_BUCKETS - 1)] += 1
+    width = 100 // SCORE_BUCKETS
+    total = len(percentages)
+    return {
+        'results': total,
+        'mean_percentage': round(sum(percentages) / total, 2) if total else None,
+        'score_distribution': [
+            {'range': f'{i * width}-{(i + 1) * width}', 'count': count} for i, count in enumerate(buckets)
+        ],
+        'exams': [columns.analyze() for columns in _merge_groups(groups) if columns.count],
+    }
+
+
+class ResultsArchive:
+    def __init__(self, archive_dir, store, answer_keys):
+        self.archive_dir = archive_dir
+        self.store = store
+        self.answer_keys = answer_keys
+        self._ready_pid = None
+        self._cache = None  # (chunk names, groups, percentages by exam) for the archived part
+        self._lock = threading.Lock()
+        self._live = None  # LiveColumns, extended on each analytics() call
+        self._live_lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.store.db_path)
+        if self._ready_pid != os.getpid():
+            conn.executescript(SCHEMA)
+            self._ready_pid = os.getpid()
+        return conn
+
+    def chunks(self):
+        rows = self._conn().execute('SELECT * FROM archive_chunks ORDER BY first_id').fetchall()
+        return [dict(row) for row in rows]
+
+    def _remove_orphans(self, grace=ORPHAN_GRACE_SECONDS):
+        """Delete unlisted files, except recent ones a compaction in another process may still be writing."""
+        listed = {c['name'] for c in self.chunks()}
+        cutoff = time.time() - grace
+        for entry in os.scandir(self.archive_dir):
+            if entry.is_file() and entry.name not in listed and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def compact(self, before, chunk_rows=CHUNK_ROWS):
+        """
+        Move results submitted before `before` into new chunks. Chunks cover
+        contiguous id ranges, so this archives everything up to the newest
+        such result. Returns the number of results archived.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._remove_orphans()
+        up_to_id = self.store.last_id_before(before)
+        if not up_to_id:
+            return 0
+        archived = 0
+        builder = ColumnBuilder(self.answer_keys)
+        for batch in self.store.iter_batches(0, up_to_id):
+            for result in batch:
+                builder.add(result)
+                if len(builder) >= chunk_rows:
+                    archived += self._flush(builder)
+                    builder = ColumnBuilder(self.answer_keys)
+        if len(builder):
+            archived += self._flush(builder)
+        return archived
+
+    def _flush(self, builder):
+        first_id, last_id = builder.ids[0], builder.ids[-1]
+        name = f'results-{first_id:012d}-{last_id:012d}.kra'
+        write_chunk(os.path.join(self.archive_dir, name), builder)
+        with transaction(self._conn()) as conn:
+            conn.execute(
+                'INSERT INTO archive_chunks (name, first_id, last_id, rows, created_at) VALUES (?, ?, ?, ?, ?)',
+                (name, first_id, last_id, len(builder), datetime.now().isoformat())
+            )
+            self.store.delete_range(first_id, last_id, conn=conn)
+        return len(builder)
+
+    def iter_results(self, student_name=None, date_from=None, date_to=None):
+        """Yield archived results oldest first, with the same filters as ResultsStore.iter_results()."""
+        for chunk in self.chunks():
+            for result in Chunk(os.path.join(self.archive_dir, chunk['name'])).iter_results():
+                if matches(result, student_name, date_from, date_to):
+                    yield result
+
+    def exists(self, **filters):
+        return next(self.iter_results(**filters), None) is not None
+
+    def get(self, result_id):
+        """One archived result, or None; only the chunk covering result_id is read."""
+        row = self._conn().execute(
+            'SELECT name FROM archive_chunks WHERE ? BETWEEN first_id AND last_id', (result_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Chunk(os.path.join(self.archive_dir, row['name'])).get(result_id)
+
+    def count(self):
+        return self._conn().execute('SELECT COALESCE(SUM(rows), 0) FROM archive_chunks').fetchone()[0]
+
+    def _archived_columns(self, names):
+        """Groups and per-exam percentages for the whole archive; chunks are immutable, so cache them."""
+        with self._lock:
+            if self._cache and self._cache[0] == names:
+                return self._cache[1], self._cache[2]
+        groups, percentages = [], {}
+        for name in names:
+            chunk = Chunk(os.path.join(self.archive_dir, name))
+            groups.extend(chunk.groups())
+            exam_ids = [g['exam_id'] for g in chunk.header['groups']]
+            for percentage, g in zip(chunk.column('percentage'), chunk.column('group')):
+                percentages.setdefault(exam_ids[g], array('d')).append(percentage)
+        groups = _merge_groups(groups)
+        with self._lock:
+            self._cache = (names, groups, percentages)
+        return groups, percentages
+
+    def _live_columns(self, names):
+        """
+        Copies of the live results' groups and per-exam percentages. Only
+        results added since the last call are scored; a compaction, clear or
+        re-grade (a new store generation) starts the columns over.
+        """
+        version = (names, self.store.generation())
+        with self._live_lock:
+            live = self._live
+            if live is None or live.version != version:
+                live = LiveColumns(self.answer_keys, version)
+            for batch in self.store.iter_batches(live.last_id):
+                for result in batch:
+                    live.add(result)
+            self._live = live
+            return ([self._copy(g) for g in live.groups()],
+                    {exam_id: array('d', values) for exam_id, values in live.percentages.items()})
+
+    def analytics(self, include_live=True, exam_id=None):
+        names = tuple(c['name'] for c in self.chunks())
+        groups, percentages = self._archived_columns(names)
+        # Merge into fresh copies so the cached archive columns stay untouched
+        groups = [self._copy(g) for g in groups]
+        percentages = {e: [values] for e, values in percentages.items()}
+        if include_live:
+            live_groups, live_percentages = self._live_columns(names)
+            groups += live_groups
+            for e, values in live_percentages.items():
+                percentages.setdefault(e, []).append(values)
+        if exam_id:
+            groups = [g for g in groups if g.exam_id == exam_id]
+            percentages = {exam_id: percentages.get(exam_id, [])}
+        selected = array('d')
+        for parts in percentages.values():
+            for values in parts:
+                selected.extend(values)
+        return analyze(_merge_groups(groups), selected)
+
+    @staticmethod
+    def _copy(columns):
+        copy = GroupColumns(columns.exam_id, columns.key_version, columns.questions)
+        copy.scores = array('q', columns.scores)
+        copy.bits = list(columns.bits)
+        return copy
+
+    def clear(self):
+        with transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM archive_chunks')
+        if os.path.isdir(self.archive_dir):
+            self._remove_orphans(grace=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old exam results into the columnar archive.')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--before', help='archive results submitted before this ISO date or datetime')
+    group.add_argument('--older-than-days', type=int, help='archive results older than this many days')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--vacuum', action='store_true', help='shrink the results database afterwards')
+    args = parser.parse_args()
+
+    from app import results_archive, results_store
+
+    before = args.before or (datetime.now() - timedelta(days=args.older_than_days)).isoformat()
+    archived = results_archive.compact(before, chunk_rows=args.chunk_rows)
+    print(f"✓ Archived {archived} results submitted before {before}")
+    if archived:
+        print("  They are still in downloads, result details and analytics, "
+              "but no longer listed by /results/query or re-graded.")
+    if args.vacuum:
+        results_store.vacuum()
+        print("✓ Results database vacuumed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Streaming exports for /download/results.
+
+Each exporter is a generator that reads results from the store one row at a
+time and yields the output in ~64KB chunks, so memory use stays flat no
+matter how many results are exported.
+"""
+
+import json
+from datetime import datetime
+from itertools import chain
+
+CHUNK_SIZE = 64 * 1024
+
+CSV_HEADER = "Student Name,Score,Total,Percentage,Started,Submitted,Duration\n"
+DATE_FORMAT = '%b %d, %Y, %H:%M:%S %p'
+
+
+def _chunked(pieces, size=CHUNK_SIZE):
+    """Group small string pieces into chunks of roughly `size` characters."""
+    buf = []
+    buffered = 0
+    for piece in pieces:
+        buf.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf = []
+            buffered = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        # JavaScript toISOString() ends in 'Z', which older Pythons reject
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _csv_quote(value):
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _csv_rows(summaries):
+    yield CSV_HEADER
+    for r in summaries:
+        # Parse each timestamp once and reuse it for the duration
+        start = _parse_time(r.get('started_at'))
+        end = _parse_time(r.get('submitted_at'))
+        submitted = end or _parse_time(r.get('timestamp'))
+
+        started_str = start.strftime(DATE_FORMAT) if start else 'N/A'
+        submitted_str = submitted.strftime(DATE_FORMAT) if submitted else 'N/A'
+        if start and end:
+            seconds_total = (end - start).total_seconds()
+            duration_str = f"{int(seconds_total // 60)}m {int(seconds_total % 60)}s"
+        else:
+            duration_str = "N/A"
+
+        yield (
+            f'{_csv_quote(r.get("student_name") or "Unknown")},{r.get("score", 0)},{r.get("total", 0)},'
+            f'{r.get("percentage", 0)}%,"{started_str}","{submitted_str}","{duration_str}"\n'
+        )
+
+
+def _json_rows(results):
+    # Same layout as json.dumps(results, indent=2), one element at a time
+    yield '['
+    first = True
+    for r in results:
+        element = json.dumps(r, indent=2).replace('\n', '\n  ')
+        yield ('\n  ' if first else ',\n  ') + element
+        first = False
+    yield '\n]' if not first else ']'
+
+
+def _ndjson_rows(results):
+    for r in results:
+        yield json.dumps(r) + '\n'
+
+
+# format -> (mimetype, file extension, generator, needs full records)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', _csv_rows, False),
+    'json': ('application/json', 'json', _json_rows, True),
+    'ndjson': ('application/x-ndjson', 'ndjson', _ndjson_rows, True),
+}
+
+
+def export_results(store, format_type, hydrate=None, archive=None, **filters):
+    """
+    Return (mimetype, extension, chunk generator) for the requested format.
+    hydrate, if given, is applied to each full record (e.g. to attach the
+    answer key a result references). archive, if given, is a ResultsArchive
+    whose results are exported before the live ones. Raises ValueError for
+    an unknown format.
+    """
+    if format_type not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {format_type}')
+    mimetype, extension, rows, full = EXPORT_FORMATS[format_type]
+    source = store.iter_results(**filters) if full else store.iter_summaries(**filters)
+    if archive is not None:
+        # Archived results are all older than the live ones
+        source = chain(archive.iter_results(**filters), source)
+    if full and hydrate:
+        source = map(hydrate, source)
+    return mimetype, extension, _chunked(rows(source))
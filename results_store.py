@@ -0,0 +1,303 @@
+"""
+Append-only storage for exam results.
+
+Each submission is written as a single row in a SQLite database running in
+WAL mode with synchronous=FULL, so every append is fsync'd and several
+gunicorn workers can write at the same time without losing results.
+
+The old exam_results.json array is imported once, the first time the store
+is opened, and is left on disk untouched.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+
+from db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    student_name TEXT,
+    score INTEGER,
+    total INTEGER,
+    percentage REAL,
+    started_at TEXT,
+    submitted_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_results_score ON results (score, id);
+CREATE INDEX IF NOT EXISTS idx_results_student ON results (student_name COLLATE NOCASE, timestamp);
+"""
+
+# Columns returned by query(); the heavy questions/answers payload is left out
+SUMMARY_COLUMNS = 'id, timestamp, student_name, score, total, percentage, started_at, submitted_at'
+SORT_COLUMNS = {'timestamp': 'timestamp', 'score': 'score'}
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def build_filters(student_name=None, date_from=None, date_to=None):
+    """
+    Build the WHERE clauses shared by query() and iter_results().
+    student_name matches case-insensitively by prefix; date_from/date_to
+    are ISO dates or datetimes compared against the submission timestamp.
+    """
+    clauses, params = [], []
+    if student_name:
+        # Prefix range on the NOCASE index instead of a LIKE scan
+        clauses.append('student_name >= ? COLLATE NOCASE AND student_name < ? COLLATE NOCASE')
+        params += [student_name, student_name + '\U0010ffff']
+    if date_from:
+        clauses.append('timestamp >= ?')
+        params.append(date_from)
+    if date_to:
+        # A bare date means "up to the end of that day"
+        if len(date_to) == 10:
+            date_to += 'T23:59:59.999999'
+        clauses.append('timestamp <= ?')
+        params.append(date_to)
+    return clauses, params
+
+
+class ResultsStore:
+    def __init__(self, db_path, legacy_json=None):
+        self.db_path = db_path
+        self.legacy_json = legacy_json
+        self._ready_pid = None
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path, synchronous='FULL')
+        if self._ready_pid != os.getpid():
+            with self._lock:
+                if self._ready_pid != os.getpid():
+                    conn.executescript(SCHEMA)
+                    self._migrate_legacy(conn)
+                    self._ready_pid = os.getpid()
+        return conn
+
+    def _migrate_legacy(self, conn):
+        """Import the old exam_results.json array exactly once."""
+        if not self.legacy_json or not os.path.exists(self.legacy_json):
+            return
+        with transaction(conn):
+            done = conn.execute("SELECT value FROM store_meta WHERE key = 'legacy_json_migrated'").fetchone()
+            if done:
+                return
+            try:
+                with open(self.legacy_json, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except Exception as e:
+                logger.error("Error reading legacy results file: %s", e)
+                legacy = []
+            for result in legacy if isinstance(legacy, list) else []:
+                self._insert(conn, result)
+            conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES ('legacy_json_migrated', ?)",
+                (str(len(legacy)),)
+            )
+            logger.info("Migrated %d results from %s", len(legacy), self.legacy_json)
+
+    @staticmethod
+    def _insert(conn, result):
+        cur = conn.execute(
+            'INSERT INTO results (timestamp, student_name, score, total, percentage, started_at, submitted_at, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                result.get('timestamp'),
+                result.get('student_name', 'Unknown'),
+                result.get('score', 0),
+                result.get('total', 0),
+                result.get('percentage', 0),
+                result.get('started_at'),
+                result.get('submitted_at'),
+                json.dumps(result),
+            )
+        )
+        return cur.lastrowid
+
+    def append(self, result, conn=None):
+        """Append one result and return its id (inside the caller's transaction if conn is given)."""
+        own = self._conn()
+        return self._insert(conn or own, result)
+
+    def append_many(self, results):
+        """Append several results in one transaction (one fsync); return their ids."""
+        with transaction(self._conn()) as conn:
+            return [self._insert(conn, result) for result in results]
+
+    def iter_results(self, student_name=None, date_from=None, date_to=None):
+        """Yield stored results oldest first without loading them all."""
+        clauses, params = build_filters(student_name, date_from, date_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        cur = self._conn().execute(f'SELECT id, data FROM results {where} ORDER BY id', params)
+        for row in cur:
+            result = json.loads(row['data'])
+            result['id'] = row['id']
+            yield result
+
+    def iter_batches(self, after_id=0, up_to_id=None, batch_size=500, exam_id=None):
+        """
+        Yield lists of full results with id > after_id (and <= up_to_id),
+        oldest first, batch_size at a time. Each batch is its own query, so
+        no read transaction stays open while the caller works. exam_id keeps
+        only that exam's results (filtered in SQLite, before JSON decoding).
+        """
+        last_id = after_id
+        while True:
+            params = [last_id]
+            bound = ''
+            if up_to_id is not None:
+                bound = 'AND id <= ?'
+                params.append(up_to_id)
+            if exam_id is not None:
+                bound += " AND json_extract(data, '$.exam_id') = ?"
+                params.append(exam_id)
+            rows = self._conn().execute(
+                f'SELECT id, data FROM results WHERE id > ? {bound} ORDER BY id LIMIT ?',
+                params + [batch_size]
+            ).fetchall()
+            if not rows:
+                return
+            batch = []
+            for row in rows:
+                result = json.loads(row['data'])
+                result['id'] = row['id']
+                batch.append(result)
+            last_id = rows[-1]['id']
+            yield batch
+
+    def max_id(self):
+        return self._conn().execute('SELECT MAX(id) FROM results').fetchone()[0] or 0
+
+    def generation(self):
+        """Bumped whenever stored results are rewritten or deleted; appends leave it alone."""
+        row = self._conn().execute("SELECT value FROM store_meta WHERE key = 'generation'").fetchone()
+        return int(row['value']) if row else 0
+
+    @staticmethod
+    def _bump_generation(conn):
+        conn.execute(
+            "INSERT INTO store_meta (key, value) VALUES ('generation', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def update_results(self, results):
+        """Rewrite the stored score and payload of existing results, in one transaction."""
+        with transaction(self._conn()) as conn:
+            for result in results:
+                record = {k: v for k, v in result.items() if k != 'id'}
+                conn.execute(
+                    'UPDATE results SET score = ?, total = ?, percentage = ?, data = ? WHERE id = ?',
+                    (record.get('score', 0), record.get('total', 0), record.get('percentage', 0),
+                     json.dumps(record), result['id'])
+                )
+            self._bump_generation(conn)
+
+    def iter_summaries(self, student_name=None, date_from=None, date_to=None):
+        """Like iter_results(), but only the summary columns (no JSON parsing)."""
+        clauses, params = build_filters(student_name, date_from, date_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        cur = self._conn().execute(f'SELECT {SUMMARY_COLUMNS} FROM results {where} ORDER BY id', params)
+        for row in cur:
+            yield dict(row)
+
+    def exists(self, student_name=None, date_from=None, date_to=None):
+        """True if at least one result matches the filters."""
+        clauses, params = build_filters(student_name, date_from, date_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return self._conn().execute(f'SELECT 1 FROM results {where} LIMIT 1', params).fetchone() is not None
+
+    def get(self, result_id):
+        """Return one full result, including questions and answers, or None."""
+        row = self._conn().execute('SELECT id, data FROM results WHERE id = ?', (result_id,)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row['data'])
+        result['id'] = row['id']
+        return result
+
+    def query(self, student_name=None, date_from=None, date_to=None,
+              sort='timestamp', order='desc', limit=50, cursor=None):
+        """
+        Return one page of result summaries and the cursor for the next page.
+        Uses keyset pagination on (sort column, id) so every page is an
+        index range scan no matter how deep the client has paged.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'Invalid sort: {sort}')
+        if order not in ('asc', 'desc'):
+            raise ValueError(f'Invalid order: {order}')
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        column = SORT_COLUMNS[sort]
+
+        clauses, params = build_filters(student_name, date_from, date_to)
+        if cursor:
+            sort_value, row_id = decode_cursor(cursor)
+            op = '<' if order == 'desc' else '>'
+            clauses.append(f'({column}, id) {op} (?, ?)')
+            params += [sort_value, row_id]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        direction = order.upper()
+
+        rows = self._conn().execute(
+            f'SELECT {SUMMARY_COLUMNS} FROM results {where} '
+            f'ORDER BY {column} {direction}, id {direction} LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(last[column], last['id'])
+        return page, next_cursor
+
+    def all(self):
+        return list(self.iter_results())
+
+    def count(self, up_to_id=None):
+        if up_to_id is None:
+            return self._conn().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM results WHERE id <= ?', (up_to_id,)).fetchone()[0]
+
+    def last_id_before(self, timestamp):
+        """Id of the newest result submitted before timestamp, or None."""
+        return self._conn().execute('SELECT MAX(id) FROM results WHERE timestamp < ?', (timestamp,)).fetchone()[0]
+
+    def delete_range(self, first_id, last_id, conn=None):
+        """Delete results first_id..last_id (inside the caller's transaction if conn is given)."""
+        conn = conn or self._conn()
+        conn.execute('DELETE FROM results WHERE id BETWEEN ? AND ?', (first_id, last_id))
+        self._bump_generation(conn)
+
+    def vacuum(self):
+        self._conn().execute('VACUUM')
+
+    def clear(self):
+        with transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM results')
+            self._bump_generation(conn)
@@ -0,0 +1,140 @@
+"""
+Batch scoring of exam answers.
+
+ExamScorer gives the same pass/fail decisions as running submit_exam's
+loop over calculate_similarity, but does the per-question work once per
+exam instead of once per answer:
+  - the reference answer is stripped, lower-cased and tokenized up front
+  - each question keeps a SequenceMatcher with the reference already set as
+    the second sequence, so its character index is built once
+  - the similarity is only computed as far as needed to decide pass/fail:
+    the keyword score alone bounds the final score to
+    [keyword * 0.6, keyword * 0.6 + 0.4], and SequenceMatcher's cheap upper
+    bounds are tried before the full ratio()
+
+A scorer holds SequenceMatcher state, so use one per thread.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been',
+    'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with',
+    'by', 'from', 'it', 'as', 'that', 'this', 'which', 'who'
+})
+WORD_RE = re.compile(r'\w+')
+
+# Minimum similarity to count an answer as correct
+THRESHOLDS = {'mcq': 0.95, 'true_false': 0.95, 'fill_blank': 0.85}
+DEFAULT_THRESHOLD = 0.70  # descriptive
+MAX_ANSWER_CHARS = 5000   # for descriptive and fill_blank answers
+
+KEYWORD_WEIGHT = 0.6
+SEQUENCE_WEIGHT = 0.4
+
+
+def threshold_for(q_type):
+    return THRESHOLDS.get(q_type, DEFAULT_THRESHOLD)
+
+
+def keywords(text):
+    return set(WORD_RE.findall(text)) - STOP_WORDS
+
+
+class QuestionKey:
+    """Everything about one question's answer key that scoring needs."""
+
+    __slots__ = ('answer_key', 'q_type', 'threshold', 'correct', 'words', 'matcher')
+
+    def __init__(self, question, correct=None):
+        self.answer_key = f"q{question['id']}"
+        self.q_type = question.get('type', 'mcq')
+        self.threshold = threshold_for(self.q_type)
+        if correct is None:
+            correct = (question.get('correct_answer', '') or '').strip().lower()
+        self.correct = correct
+        self.words = keywords(self.correct)
+        self.matcher = SequenceMatcher(None, '', self.correct)
+
+    def _quick(self, user_answer):
+        """
+        The cheap checks: (decision, None, None) if they settle it, else
+        (None, normalized answer, keyword part) for the sequence ratio.
+        """
+        if not user_answer or not self.correct:
+            return False, None, None
+        if self.q_type in ('descriptive', 'fill_blank') and len(user_answer) > MAX_ANSWER_CHARS:
+            user_answer = user_answer[:MAX_ANSWER_CHARS]
+        user_ans = user_answer.strip().lower()
+        if user_ans == self.correct:
+            return True, None, None
+
+        user_words = keywords(user_ans)
+        if user_words and self.words:
+            keyword_similarity = len(user_words & self.words) / len(user_words | self.words)
+        else:
+            keyword_similarity = 0
+        keyword_part = keyword_similarity * KEYWORD_WEIGHT
+
+        # The sequence ratio is between 0 and 1, so these bounds can settle it
+        if keyword_part + SEQUENCE_WEIGHT < self.threshold:
+            return False, None, None
+        if keyword_part >= self.threshold:
+            return True, None, None
+        return None, user_ans, keyword_part
+
+    def quick_decision(self, user_answer):
+        """True/False if the answer is decided without SequenceMatcher, else None."""
+        return self._quick(user_answer)[0]
+
+    def is_correct(self, user_answer):
+        """Decide one answer; user_answer must already be stripped."""
+        decision, user_ans, keyword_part = self._quick(user_answer)
+        if decision is not None:
+            return decision
+
+        matcher = self.matcher
+        matcher.set_seq1(user_ans)
+        if keyword_part + matcher.real_quick_ratio() * SEQUENCE_WEIGHT < self.threshold:
+            return False
+        if keyword_part + matcher.quick_ratio() * SEQUENCE_WEIGHT < self.threshold:
+            return False
+        return keyword_part + matcher.ratio() * SEQUENCE_WEIGHT >= self.threshold
+
+
+class ExamScorer:
+    def __init__(self, questions, normalized=None):
+        # normalized: already stripped/lower-cased correct answers (see answer_keys)
+        if normalized is None:
+            self.keys = [QuestionKey(q) for q in questions]
+        else:
+            self.keys = [QuestionKey(q, correct) for q, correct in zip(questions, normalized)]
+
+    @property
+    def total(self):
+        return len(self.keys)
+
+    def decisions(self, answers):
+        """Return a list of True/False, one per question, for one submission."""
+        return [key.is_correct((answers.get(key.answer_key) or '').strip()) for key in self.keys]
+
+    def score(self, answers):
+        return sum(self.decisions(answers))
+
+    def score_many(self, submissions):
+        """
+        Score many submissions (a list of answers dicts) in one pass per
+        question. Identical answers to the same question are decided once.
+        """
+        scores = [0] * len(submissions)
+        for key in self.keys:
+            seen = {}
+            for i, answers in enumerate(submissions):
+                user_answer = (answers.get(key.answer_key) or '').strip()
+                decision = seen.get(user_answer)
+                if decision is None:
+                    decision = seen[user_answer] = key.is_correct(user_answer)
+                if decision:
+                    scores[i] += 1
+        return scores
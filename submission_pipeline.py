@@ -0,0 +1,420 @@
+"""
+Exam submission pipeline.
+
+/exam/submit no longer scores and writes the result while the student
+waits. It validates the submission, appends it to this worker's
+write-ahead journal, and answers 202 with a receipt ID. A writer thread
+drains the queue, scores each submission against its answer key and
+stores a whole batch of results in one transaction (group commit), along
+with a receipt row that /exam/receipt/<id> reads the final score from.
+
+  - The queue is bounded (SUBMISSION_QUEUE_SIZE); when it is full the
+    submission is refused with 503 + Retry-After instead of piling up.
+  - A submission is only acknowledged after its journal line is fsync'd.
+    Threads that journal at the same time share one fsync.
+  - On startup each worker replays the journals of workers that are no
+    longer running. Receipt IDs are unique in the receipts table, so a
+    submission that was committed before the crash is never stored twice.
+    A journal is named by PID plus a random token, so a restarted worker
+    that gets its predecessor's PID (routine in containers) replays that
+    journal instead of appending to and truncating it.
+  - A batch that cannot be stored after COMMIT_ATTEMPTS keeps its queue
+    slots and is retried with backoff while new batches go ahead.
+  - The journal is truncated whenever everything in it has been committed.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from db import get_connection, transaction
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    receipt_id TEXT PRIMARY KEY,
+    result_id INTEGER,
+    status TEXT NOT NULL,
+    score INTEGER,
+    total INTEGER,
+    percentage REAL,
+    error TEXT,
+    committed_at TEXT NOT NULL
+);
+"""
+
+# A receipt that is not committed yet may be in another worker's queue
+PENDING_WINDOW = 15 * 60  # seconds
+COMMIT_ATTEMPTS = 3
+RETRY_BACKOFF_MAX = 60  # seconds between retries of a batch that still could not be stored
+
+
+class PipelineFull(Exception):
+    pass
+
+
+def new_receipt_id():
+    # Creation time first, so a lookup can tell "still queued" from "unknown"
+    return f'{int(time.time() * 1000):x}-{uuid.uuid4().hex[:12]}'
+
+
+def receipt_age(receipt_id):
+    """Seconds since the receipt was issued, or None if it is not a receipt ID."""
+    try:
+        issued_ms = int(receipt_id.split('-', 1)[0], 16)
+    except (ValueError, AttributeError):
+        return None
+    return time.time() - issued_ms / 1000
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Journal:
+    """Append-only, fsync'd log of acknowledged submissions for one process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.written = 0   # lines written since the last truncate
+        self._synced = 0
+        self.committed = 0
+
+    def append(self, record):
+        """Write one record and return once it is on disk."""
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.written += 1
+            seq = self.written
+        with self._sync_lock:
+            # Another thread's fsync may already have covered this line
+            if self._synced < seq:
+                with self._lock:
+                    target = self.written
+                os.fsync(self._file.fileno())
+                self._synced = target
+
+    def mark_committed(self, count):
+        """Record count more committed submissions; truncate once nothing is outstanding."""
+        with self._lock:
+            self.committed += count
+            if self.committed >= self.written:
+                self._file.truncate(0)
+                self._file.seek(0)
+                self.written = self.committed = 0
+                with self._sync_lock:
+                    self._synced = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SubmissionPipeline:
+    def __init__(self, journal_dir, store, answer_keys, max_queue=1000, batch_size=100,
+                 batch_wait=0.01, metrics=None, grading_memo=None):
+        self.journal_dir = journal_dir
+        self.store = store
+        self.answer_keys = answer_keys
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.metrics = metrics or Metrics(None)
+        self.grading_memo = grading_memo
+        self._pid = None
+        self._start_lock = threading.Lock()
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def _conn(self):
+        return get_connection(self.store.db_path, synchronous='FULL')
+
+    def start(self):
+        """Start this process's journal and writer (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._conn().executescript(SCHEMA)
+            # Create the results tables now; executescript() inside a batch would commit it early
+            self.store.max_id()
+            self._queue = queue.Queue()
+            self._slots = threading.BoundedSemaphore(self.max_queue)
+            self._pending = {}  # receipt_id -> True while queued in this process
+            self._retry = []  # (due, backoff, records) for batches that could not be stored
+            self._journal_name = f'journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.ndjson'
+            self._journal = Journal(os.path.join(self.journal_dir, self._journal_name))
+            self._stopping = False
+            self._writer = threading.Thread(target=self._run_writer, name='submission-writer', daemon=True)
+            self._pid = os.getpid()
+            self._writer.start()
+            atexit.register(self.stop)
+
+    # --- Request side ---
+
+    def submit(self, key, answers, student_name, started_at=None, submitted_at=None):
+        """Journal a validated submission and queue it; return the receipt ID."""
+        self.start()
+        if not self._slots.acquire(blocking=False):
+            self.metrics.inc('submissions_rejected_total')
+            raise PipelineFull()
+        record = {
+            'receipt_id': new_receipt_id(),
+            'exam_id': key.exam_id,
+            'key_version': key.version,
+            'answers': answers,
+            'student_name': student_name,
+            'started_at': started_at,
+            'submitted_at': submitted_at,
+            'timestamp': datetime.now().isoformat(),
+        }
+        try:
+            self._journal.append(record)
+        except Exception:
+            self._slots.release()
+            raise
+        self._pending[record['receipt_id']] = True
+        self._queue.put(record)
+        return record['receipt_id']
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    def lookup(self, receipt_id):
+        """Return the receipt row as a dict, {'status': 'queued'/'pending'}, or None."""
+        if self._pid == os.getpid() and receipt_id in self._pending:
+            return {'receipt_id': receipt_id, 'status': 'queued'}
+        self.start()
+        row = self._conn().execute('SELECT * FROM receipts WHERE receipt_id = ?', (receipt_id,)).fetchone()
+        if row is not None:
+            return dict(row)
+        age = receipt_age(receipt_id)
+        if age is not None and -60 < age < PENDING_WINDOW:
+            return {'receipt_id': receipt_id, 'status': 'pending'}
+        return None
+
+    # --- Writer side ---
+
+    def _run_writer(self):
+        try:
+            self._replay_orphaned_journals()
+        except Exception as e:
+            logger.exception('Journal replay failed: %s', e)
+        while not self._stopping or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._retry_due()
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._store(batch)
+            self._retry_due()
+
+    def _store(self, batch, attempts=COMMIT_ATTEMPTS, delay=0):
+        """Commit a batch; if every attempt fails, schedule it to be tried again later."""
+        for attempt in range(attempts):
+            try:
+                self._commit(batch)
+                break
+            except Exception as e:
+                logger.exception('Could not store %d submissions (attempt %d): %s', len(batch), attempt + 1, e)
+                if attempt + 1 < attempts:
+                    time.sleep(attempt + 1)
+        else:
+            # Keep its queue slots and journal lines; new batches go ahead meanwhile
+            delay = min(RETRY_BACKOFF_MAX, max(1, delay * 2))
+            self._retry.append((time.monotonic() + delay, delay, batch))
+            return
+        for record in batch:
+            self._pending.pop(record['receipt_id'], None)
+            self._slots.release()
+        self._journal.mark_committed(len(batch))
+
+    def _retry_due(self):
+        """Try once more to store the failed batches whose backoff has run out."""
+        now = time.monotonic()
+        due = [entry for entry in self._retry if entry[0] <= now]
+        if not due:
+            return
+        self._retry = [entry for entry in self._retry if entry[0] > now]
+        for _, delay, batch in due:
+            logger.info('Retrying %d submissions that could not be stored', len(batch))
+            self._store(batch, attempts=1, delay=delay)
+
+    def _score(self, records):
+        """
+        Score a batch, one key version at a time; returns (record, result, error)
+        per record. With a grading memo, repeated answers cost one lookup.
+        """
+        by_key = {}
+        for record in records:
+            by_key.setdefault((record['exam_id'], record['key_version']), []).append(record)
+        scores = {}  # receipt_id -> (score, total) or error message
+        for (exam_id, version), group in by_key.items():
+            key = self.answer_keys.get(exam_id, version)
+            if key is None:
+                for record in group:
+                    scores[record['receipt_id']] = f'Unknown answer key {exam_id} v{version}'
+                continue
+            try:
+                with self.metrics.timer('score_submissions'):
+                    scorer = self.answer_keys.scorer(key)
+                    answers = [record['answers'] for record in group]
+                    if self.grading_memo is not None:
+                        group_scores = self.grading_memo.score_many(key, scorer, answers)
+                    else:
+                        group_scores = [scorer.score(a) for a in answers]
+            except Exception as e:
+                # One bad record must not fail the rest of its group
+                logger.warning('Scoring %d submissions for %s v%s failed, scoring one by one: %s',
+                               len(group), exam_id, version, e)
+                self._score_each(key, group, scores)
+                continue
+            for record, score in zip(group, group_scores):
+                scores[record['receipt_id']] = (score, scorer.total)
+
+        scored = []
+        for record in records:
+            outcome = scores[record['receipt_id']]
+            if isinstance(outcome, str):
+                scored.append((record, None, outcome))
+                continue
+            score, total = outcome
+            scored.append((record, {
+                'score': score,
+                'total': total,
+                'percentage': round((score / total) * 100, 2) if total > 0 else 0,
+                'timestamp': record['timestamp'],
+                'student_name': record['student_name'],
+                'started_at': record['started_at'],
+                'submitted_at': record['submitted_at'],
+                'exam_id': record['exam_id'],
+                'key_version': record['key_version'],
+                'answers': record['answers'],
+                'receipt_id': record['receipt_id'],
+            }, None))
+        return scored
+
+    def _score_each(self, key, records, scores):
+        """Score records one at a time, without the memo; a record that raises gets its own error."""
+        for record in records:
+            try:
+                scorer = self.answer_keys.scorer(key)
+                scores[record['receipt_id']] = (scorer.score(record['answers']), scorer.total)
+            except Exception as e:
+                logger.warning('Could not score receipt %s: %s', record['receipt_id'], e)
+                scores[record['receipt_id']] = str(e)
+
+    def _commit(self, records):
+        """Score and store a batch in one transaction; skip receipts already stored."""
+        started = time.perf_counter()
+        # Score before taking the write lock
+        scored = self._score(records)
+        conn = self._conn()
+        now = datetime.now().isoformat()
+        with transaction(conn):
+            for record, result, error in scored:
+                if conn.execute('SELECT 1 FROM receipts WHERE receipt_id = ?', (record['receipt_id'],)).fetchone():
+                    continue
+                if result is None:
+                    conn.execute(
+                        'INSERT INTO receipts (receipt_id, status, error, committed_at) VALUES (?, ?, ?, ?)',
+                        (record['receipt_id'], 'failed', error, now)
+                    )
+                    continue
+                result_id = self.store.append(result, conn=conn)
+                conn.execute(
+                    'INSERT INTO receipts (receipt_id, result_id, status, score, total, percentage, committed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (record['receipt_id'], result_id, 'done', result['score'], result['total'],
+                     result['percentage'], now)
+                )
+                logger.debug('Stored result %s for receipt %s', result_id, record['receipt_id'])
+            if self.grading_memo is not None:
+                self.grading_memo.flush(conn)
+        self.metrics.observe('operation_duration_seconds', time.perf_counter() - started,
+                             operation='results_group_commit')
+        self.metrics.inc('submissions_committed_total', len(records))
+
+    def _replay_orphaned_journals(self):
+        """Commit what journals of dead workers still hold, then delete them."""
+        # Listed up front, so the replay- files claimed below are not seen again
+        for entry in list(os.scandir(self.journal_dir)):
+            name = entry.name
+            if name.startswith('journal-') and name.endswith('.ndjson'):
+                if name == self._journal_name:
+                    continue
+                try:
+                    # journal-<pid>-<token>.ndjson, or journal-<pid>.ndjson from older versions
+                    pid = int(name[len('journal-'):-len('.ndjson')].split('-')[0])
+                except ValueError:
+                    continue
+                # Another journal with this process's PID was left by an earlier process with the same PID
+                if pid != os.getpid() and _pid_alive(pid):
+                    continue
+                # Claim it; if another worker renamed it first, skip
+                claimed = os.path.join(self.journal_dir, f'replay-{os.getpid()}-{name}')
+                try:
+                    os.rename(entry.path, claimed)
+                except FileNotFoundError:
+                    continue
+            elif name.startswith('replay-'):
+                # A replay that was itself interrupted
+                try:
+                    owner = int(name.split('-')[1])
+                except (IndexError, ValueError):
+                    continue
+                if owner != os.getpid() and _pid_alive(owner):
+                    continue
+                claimed = entry.path
+            else:
+                continue
+            self._replay_file(claimed)
+
+    def _replay_file(self, path):
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn last line was never acknowledged
+                    continue
+        for i in range(0, len(records), self.batch_size):
+            self._commit(records[i:i + self.batch_size])
+        os.remove(path)
+        if records:
+            logger.info('Replayed %d journaled submissions from %s', len(records), os.path.basename(path))
+
+    def stop(self, timeout=10):
+        """Drain the queue and stop the writer (called at exit)."""
+        if self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._writer.join(timeout)
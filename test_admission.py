@@ -0,0 +1,123 @@
+"""
+Admission control: exam traffic gets freed slots before lower classes and
+keeps its reserved share, a full queue is refused straight away, and
+session token buckets answer 429 once a browser that keeps its cookie
+runs dry.
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from admission import Admission, RouteClass
+
+
+@pytest.fixture
+def admission(request):
+    """Two slots per worker and small classes; a test may override settings with indirect parametrization."""
+    settings = dict(max_active=2, reserved=0, queue_size=2, wait_seconds=5.0)
+    settings.update(getattr(request, 'param', {}))
+    max_active, queue_size, wait_seconds = settings['max_active'], settings['queue_size'], settings['wait_seconds']
+    classes = {
+        'exam': RouteClass('exam', 2, max_active, queue_size, wait_seconds, rate=5.0, burst=30, retry_after=1),
+        'default': RouteClass('default', 1, max_active, queue_size, wait_seconds, rate=0.5, burst=2,
+                              retry_after=1),
+        'heavy': RouteClass('heavy', 0, 1, queue_size, wait_seconds, rate=0.2, burst=5, retry_after=1),
+    }
+    return Admission(classes, max_active=max_active, reserved=settings['reserved'])
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def acquire_in_thread(admission, route_class, outcomes):
+    thread = threading.Thread(target=lambda: outcomes.append((route_class.name, admission.acquire(route_class))))
+    thread.start()
+    return thread
+
+
+def test_freed_slot_goes_to_exam_first(admission):
+    exam, default = admission.classes['exam'], admission.classes['default']
+    assert admission.acquire(exam) is None
+    assert admission.acquire(exam) is None
+
+    outcomes = []
+    waiting_default = acquire_in_thread(admission, default, outcomes)
+    wait_until(lambda: default.waiting == 1)
+    waiting_exam = acquire_in_thread(admission, exam, outcomes)
+    wait_until(lambda: exam.waiting == 1)
+
+    admission.release(exam)
+    waiting_exam.join(5)
+    assert outcomes == [('exam', None)]
+    assert default.waiting == 1
+
+    admission.release(exam)
+    waiting_default.join(5)
+    assert outcomes == [('exam', None), ('default', None)]
+    admission.release(exam)
+    admission.release(default)
+    assert admission.active == 0
+
+
+@pytest.mark.parametrize('admission', [{'reserved': 1, 'wait_seconds': 0.05}], indirect=True)
+def test_reserved_slots_only_go_to_exam(admission):
+    exam, heavy, default = admission.classes['exam'], admission.classes['heavy'], admission.classes['default']
+    assert admission.acquire(default) is None
+    assert admission.acquire(heavy) == 'timeout'  # only the reserved slot is left
+    assert admission.acquire(exam) is None
+    assert admission.active == 2
+
+
+@pytest.mark.parametrize('admission', [{'queue_size': 1}], indirect=True)
+def test_full_queue_is_refused_without_waiting(admission):
+    heavy = admission.classes['heavy']
+    assert admission.acquire(heavy) is None
+
+    outcomes = []
+    waiter = acquire_in_thread(admission, heavy, outcomes)
+    wait_until(lambda: heavy.waiting == 1)
+    started = time.monotonic()
+    assert admission.acquire(heavy) == 'queue_full'
+    assert time.monotonic() - started < 1
+
+    admission.release(heavy)
+    waiter.join(5)
+    assert outcomes == [('heavy', None)]
+
+
+def test_token_bucket_per_session(admission):
+    default = admission.classes['default']
+    assert admission.take_token(default, 'browser-1') == 0
+    assert admission.take_token(default, 'browser-1') == 0
+    wait = admission.take_token(default, 'browser-1')
+    assert 0 < wait <= 1 / default.rate
+    assert admission.take_token(default, 'browser-2') == 0
+
+
+def test_rate_limit_follows_the_session_cookie(admission):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    admission.init_app(app)
+
+    @app.route('/ping')
+    def ping():
+        return 'pong'
+
+    with app.test_client() as client:
+        # The first request only sets the cookie; the burst of 2 starts after it
+        statuses = [client.get('/ping').status_code for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+        response = client.get('/ping')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+
+    # A client that never sends the cookie back is held to the queues only
+    with app.test_client(use_cookies=False) as client:
+        assert {client.get('/ping').status_code for _ in range(5)} == {200}
@@ -0,0 +1,98 @@
+"""
+Autosave ordering: a delta is only applied if its seq is newer, a worker
+reloads a draft another worker saved past its copy, a submitted draft
+stays deleted, and the final submission keeps every posted answer over
+the draft.
+"""
+
+import pytest
+
+from draft_store import DraftError, DraftStore, check_answers
+
+
+@pytest.fixture
+def sessions_db(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def worker(sessions_db):
+    """One worker's DraftStore; flushed by hand, the background flusher never wakes up during a test."""
+    return DraftStore(sessions_db, flush_interval=3600)
+
+
+@pytest.fixture
+def drafts(sessions_db):
+    return worker(sessions_db)
+
+
+def test_older_seq_never_rolls_answers_back(drafts):
+    draft_id = drafts.apply(None, 'exam-1', 1, {'q1': 'first'})['draft_id']
+    drafts.apply(draft_id, 'exam-1', 3, {'q1': 'third', 'q2': 'kept'})
+    reply = drafts.apply(draft_id, 'exam-1', 2, {'q1': 'second', 'q2': None})  # late retry
+
+    assert reply['seq'] == 3
+    assert drafts.get(draft_id)['answers'] == {'q1': 'third', 'q2': 'kept'}
+
+    drafts.apply(draft_id, 'exam-1', 4, {'q2': None})
+    assert drafts.get(draft_id)['answers'] == {'q1': 'third'}
+
+
+def test_worker_reloads_draft_saved_by_another(sessions_db):
+    worker_a = worker(sessions_db)
+    worker_b = worker(sessions_db)
+    draft_id = worker_a.apply(None, 'exam-1', 1, {'q1': 'a'})['draft_id']
+    worker_a.flush()
+
+    # The browser's next autosave lands on the other worker
+    reply = worker_b.apply(draft_id, 'exam-1', 2, {'q2': 'b'}, base_seq=1)
+    assert worker_b.get(draft_id)['answers'] == {'q1': 'a', 'q2': 'b'}
+    worker_b.flush()
+    assert worker_b.apply(draft_id, 'exam-1', 2, {})['saved_seq'] == 2
+    assert reply['saved_seq'] == 1
+
+    # Back on the first worker, whose copy is older than what was saved
+    worker_a.apply(draft_id, 'exam-1', 3, {'q3': 'c'}, base_seq=2)
+    assert worker_a.get(draft_id)['answers'] == {'q1': 'a', 'q2': 'b', 'q3': 'c'}
+    worker_a.flush()
+    assert worker(sessions_db).get(draft_id)['seq'] == 3
+
+
+def test_merge_prefers_posted_answers(drafts):
+    draft_id = drafts.apply(None, 'exam-1', 1, {'q1': 'draft', 'q2': 'draft', 'q4': 'draft'})['draft_id']
+    posted = {'q1': '', 'q2': 'posted', 'q3': None}  # q1 was cleared on purpose
+
+    assert drafts.merge(draft_id, 'exam-1', posted) == {'q1': '', 'q2': 'posted', 'q3': None, 'q4': 'draft'}
+    # A draft from another exam is ignored
+    assert drafts.merge(draft_id, 'exam-2', posted) == posted
+    assert drafts.merge(None, 'exam-1', posted) == posted
+
+
+def test_discarded_draft_is_not_written_back(sessions_db):
+    worker_a = worker(sessions_db)
+    worker_b = worker(sessions_db)
+    draft_id = worker_a.apply(None, 'exam-1', 1, {'q1': 'a'})['draft_id']
+    worker_a.flush()
+    worker_b.apply(draft_id, 'exam-1', 2, {'q2': 'b'}, base_seq=1)  # not flushed yet
+
+    worker_a.discard(draft_id)  # submitted through the first worker
+    assert worker(sessions_db).get(draft_id) is None
+    worker_b.flush()
+    assert worker(sessions_db).get(draft_id) is None
+    assert draft_id not in worker_b._drafts
+
+
+def test_apply_rejects_bad_deltas(drafts):
+    with pytest.raises(DraftError):
+        drafts.apply(None, 'exam-1', 0, {'q1': 'a'})
+    with pytest.raises(DraftError):
+        drafts.apply('not-a-draft-id', 'exam-1', 1, {'q1': 'a'})
+    draft_id = drafts.apply(None, 'exam-1', 1, {'q1': 'a'})['draft_id']
+    with pytest.raises(DraftError):
+        drafts.apply(draft_id, 'exam-2', 2, {'q1': 'b'})
+
+
+def test_check_answers_rejects_bad_submissions():
+    check_answers({'q1': 'Paris', 'q2': None})
+    for answers in (['Paris'], {'q1': 42}, {'q1': ['a']}, {'q1': 'x' * 5001}, {'q' * 65: 'a'}):
+        with pytest.raises(DraftError):
+            check_answers(answers)
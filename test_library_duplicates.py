@@ -0,0 +1,49 @@
+"""
+Near-duplicate clusters: the result depends only on the library, not on
+the order documents were indexed in, and oversized LSH buckets are split
+rather than cut short.
+"""
+
+import itertools
+import json
+
+import pytest
+
+from library_duplicates import FULL_PAIRS_BUCKET, DuplicateIndex, _candidate_pairs, minhash, similarity
+
+# A chain: each neighbour is a near duplicate, the two ends are not
+CHAIN = [
+    'kappa desert valley epsilon river island ocean desert gamma island alpha ocean lambda valley',
+    'kappa desert valley ocean river island ocean desert gamma island alpha ocean lambda valley',
+    'kappa desert valley ocean river island ocean desert stone island alpha ocean lambda ocean',
+]
+
+
+def index_documents(tmp_path, texts, order):
+    meta_folder = tmp_path / 'meta'
+    meta_folder.mkdir()
+    index = DuplicateIndex(str(tmp_path / 'search.db'), str(meta_folder))
+    for i in order:
+        meta = {'filename': f'doc{i}', 'questions': [{'id': 1, 'question': texts[i]}]}
+        (meta_folder / f'doc{i}.json').write_text(json.dumps(meta), encoding='utf-8')
+        index.index_document(meta)
+    return index
+
+
+def test_chain_setup():
+    a, b, c = (minhash(t) for t in CHAIN)
+    assert similarity(a, b) >= 0.7 and similarity(b, c) >= 0.7
+    assert similarity(a, c) < 0.7
+
+
+@pytest.mark.parametrize('order', list(itertools.permutations(range(3))))
+def test_clusters_do_not_depend_on_insertion_order(tmp_path, order):
+    clusters = index_documents(tmp_path, CHAIN, order).clusters(threshold=0.7)
+    assert [sorted(q['filename'] for q in c['questions']) for c in clusters] == [['doc0', 'doc1', 'doc2']]
+
+
+def test_oversized_bucket_is_split_not_truncated():
+    bucket = list(range(FULL_PAIRS_BUCKET * 3 + 7))
+    pairs = set(_candidate_pairs(bucket))
+    assert all((i, i + 1) in pairs for i in bucket[:-1])  # every member still meets its neighbours
+    assert len(pairs) < len(bucket) * FULL_PAIRS_BUCKET
@@ -0,0 +1,53 @@
+"""
+Bulk ingest: a document that replaces a library file of the same name
+only lands once it has been extracted, so a failed ingest leaves the
+original in place.
+"""
+
+import os
+
+import pytest
+
+import library_ingest
+from extraction_cache import ExtractionCache, file_sha256
+from library_index import LibraryIndex
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """The library folder, with a pool worker's state set up in this process."""
+    folder = tmp_path / 'library'
+    (folder / 'meta').mkdir(parents=True)
+    monkeypatch.setattr(library_ingest, '_worker', {
+        'library_folder': str(folder),
+        'index': LibraryIndex(str(folder / 'meta')),
+        'cache': ExtractionCache(str(tmp_path / 'cache'), 'test', max_memory_bytes=0),
+    })
+    return folder
+
+
+def ingest_one(path, filename):
+    return library_ingest._ingest_one(str(path), filename, file_sha256(str(path)))
+
+
+def test_replaces_library_document_after_extraction(tmp_path, library):
+    (library / 'bank.txt').write_text('Old question?\nAnswer: old\n', encoding='utf-8')
+    source = tmp_path / 'bank.txt'
+    source.write_text('Capital of France?\nAnswer: Paris\n\nIs water wet? True or False\nAnswer: True\n',
+                      encoding='utf-8')
+
+    assert ingest_one(source, 'bank.txt') == 2
+    assert (library / 'bank.txt').read_text(encoding='utf-8') == source.read_text(encoding='utf-8')
+    assert sorted(os.listdir(library)) == ['bank.txt', 'meta']
+
+
+def test_failed_extraction_keeps_library_document(tmp_path, library):
+    original = b'original document'
+    (library / 'bank.docx').write_bytes(original)
+    source = tmp_path / 'bank.docx'
+    source.write_bytes(b'not a zip, so not a docx')
+
+    with pytest.raises(Exception):
+        ingest_one(source, 'bank.docx')
+    assert (library / 'bank.docx').read_bytes() == original
+    assert sorted(os.listdir(library)) == ['bank.docx', 'meta']
@@ -0,0 +1,57 @@
+"""
+Search index upkeep: re-indexing or removing a document replaces exactly
+its own rows, including in an index built before rows were mapped to
+documents.
+"""
+
+import json
+
+import pytest
+
+from db import get_connection
+from library_search import SCHEMA, LibrarySearch
+
+
+@pytest.fixture
+def meta_folder(tmp_path):
+    folder = tmp_path / 'meta'
+    folder.mkdir()
+    return folder
+
+
+def save(meta_folder, filename, questions):
+    meta = {'filename': filename,
+            'questions': [{'id': i + 1, 'type': 'descriptive', 'question': q, 'correct_answer': ''}
+                          for i, q in enumerate(questions)]}
+    (meta_folder / f'{filename}.json').write_text(json.dumps(meta), encoding='utf-8')
+    return meta
+
+
+def hits(search, text):
+    return sorted((h['filename'], h['question_id']) for h in search.search(text))
+
+
+def test_reindex_and_remove_replace_only_own_rows(tmp_path, meta_folder):
+    search = LibrarySearch(str(tmp_path / 'search.db'), str(meta_folder))
+    search.index_document(save(meta_folder, 'a', ['photosynthesis in plants', 'mitochondria energy']))
+    search.index_document(save(meta_folder, 'b', ['photosynthesis and light']))
+
+    search.index_document(save(meta_folder, 'a', ['mitochondria only']))
+    assert hits(search, 'photosynthesis') == [('b', 1)]
+    assert hits(search, 'mitochondria') == [('a', 1)]
+
+    search.remove_document('b')
+    assert hits(search, 'photosynthesis') == []
+    assert search._conn().execute('SELECT COUNT(*) FROM questions_fts').fetchone()[0] == 1
+
+
+def test_index_built_without_row_map_is_mapped(tmp_path, meta_folder):
+    db_path = str(tmp_path / 'search.db')
+    conn = get_connection(db_path)
+    conn.executescript(SCHEMA)  # as written before indexed_questions existed
+    conn.execute("INSERT INTO questions_fts (question, options, correct_answer, filename, question_id, type) "
+                 "VALUES ('photosynthesis in plants', '', '', 'a', 1, 'descriptive')")
+
+    search = LibrarySearch(db_path, str(meta_folder))
+    search.remove_document('a')
+    assert hits(search, 'photosynthesis') == []
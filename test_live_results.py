@@ -0,0 +1,92 @@
+"""
+Live results: the aggregates of a watched exam match what was stored,
+new results reach every viewer as one shared update, and stream slots
+and unwatched exams are given back.
+"""
+
+import json
+
+import pytest
+
+import live_results
+from live_results import LiveFull, LiveResults
+
+
+@pytest.fixture
+def live(request, store, answer_keys):
+    """A LiveResults bus; poll() is called by hand, the tail thread never wakes up during a test."""
+    max_streams = getattr(request, 'param', 20)
+    return LiveResults(store, answer_keys, poll_interval=3600, max_streams=max_streams, stream_seconds=1)
+
+
+@pytest.fixture
+def submit(store, exam_keys, make_result):
+    """Store a result for one of the exams and return its id."""
+    def add(exam_id, answers, name):
+        return store.append(make_result(exam_keys[exam_id], answers, name))
+    return add
+
+
+def event_data(event):
+    return json.loads(event.split('data: ', 1)[1])
+
+
+def test_view_aggregates_and_new_submissions(live, submit):
+    submit('exam-a', {'q1': 'Paris', 'q2': 'True'}, 'Ann')
+    submit('exam-a', {'q1': 'Rome', 'q2': 'True'}, 'Ben')
+    submit('exam-b', {'q1': '4'}, 'Cat')
+
+    view = live.view('exam-a')
+    stats = view['stats']
+    assert stats['results'] == 2
+    assert stats['mean_percentage'] == 75.0
+    assert [(q['id'], q['passed'], q['graded']) for q in stats['questions']] == [('q1', 1, 2), ('q2', 2, 2)]
+    assert [s['student_name'] for s in view['submissions']] == ['Ann', 'Ben']
+
+    last_id = view['last_id']
+    dee = submit('exam-a', {'q1': 'Paris', 'q2': 'False'}, 'Dee')
+    submit('exam-b', {'q1': '4'}, 'Eve')
+    live.poll()
+    view = live.view('exam-a', after_id=last_id)
+    assert [s['id'] for s in view['submissions']] == [dee]
+    assert view['stats']['results'] == 3
+    assert set(live._aggregates) == {'exam-a'}  # exam-b is not watched
+
+
+def test_viewers_share_one_update(live, submit):
+    submit('exam-a', {'q1': 'Paris', 'q2': 'True'}, 'Ann')
+    first, snapshot = live.subscribe('exam-a')
+    second, _ = live.subscribe('exam-a')
+    assert event_data(snapshot)['stats']['results'] == 1
+
+    submit('exam-a', {'q1': 'Rome', 'q2': 'False'}, 'Ben')
+    live.poll()
+    assert len(first.events) == len(second.events) == 1
+    assert first.events[0] is second.events[0]
+    update = event_data(first.events[0])
+    assert [s['student_name'] for s in update['submissions']] == ['Ben']
+    assert update['stats']['results'] == 2
+
+    chunks = list(live.stream(first, snapshot))
+    assert chunks[0].startswith('retry: ') and chunks[0].endswith(snapshot)
+    assert 'event: update' in chunks[1]
+    live.unsubscribe(first)
+    live.unsubscribe(second)
+
+
+@pytest.mark.parametrize('live', [1], indirect=True)
+def test_stream_slots_and_unwatched_exams_are_released(live, submit, monkeypatch):
+    monkeypatch.setattr(live_results, 'KEEP_WATCHED_SECONDS', 0)
+    submit('exam-a', {'q1': 'Paris', 'q2': 'True'}, 'Ann')
+
+    subscriber, _ = live.subscribe('exam-a')
+    with pytest.raises(LiveFull):
+        live.subscribe('exam-b')
+    live.unsubscribe(subscriber)
+    live.unsubscribe(subscriber)  # closing twice gives back one slot
+    assert live._streams == 0
+    assert live._aggregates == {}
+
+    other, _ = live.subscribe('exam-b')
+    assert set(live._aggregates) == {'exam-b'}
+    live.unsubscribe(other)
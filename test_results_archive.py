@@ -0,0 +1,108 @@
+"""
+Results archive: compaction keeps every result readable, analytics give
+the same answer before and after compaction, live analytics pick up new
+and re-graded results, and unlisted chunk files are only removed once
+they are old enough not to belong to a running compaction.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from results_archive import ORPHAN_GRACE_SECONDS, ResultsArchive
+from results_export import export_results
+
+
+@pytest.fixture
+def archive(tmp_path, store, answer_keys):
+    return ResultsArchive(str(tmp_path / 'archive'), store, answer_keys)
+
+
+@pytest.fixture
+def stored(store, exam_keys, make_result):
+    """Ten January results and four March ones, across both exams; returns them as stored."""
+    a, b = exam_keys['exam-a'], exam_keys['exam-b']
+    answers_a = [{'q1': 'Paris', 'q2': 'True'}, {'q1': 'Paris', 'q2': 'False'}, {'q1': 'Rome', 'q2': 'False'}]
+    results = []
+    for i in range(10):
+        timestamp = f'2026-01-{10 + i}T09:00:00'
+        if i % 3 == 2:
+            results.append(make_result(b, {'q1': '4' if i % 2 else '5'}, f'Bea {i}', timestamp))
+        else:
+            results.append(make_result(a, answers_a[i % 3], f'Ann {i}', timestamp))
+    for i in range(4):
+        results.append(make_result(a, answers_a[i % 3], f'Cal {i}', f'2026-03-0{1 + i}T09:00:00'))
+    store.append_many(results)
+    return list(store.iter_results())
+
+
+def test_compaction_keeps_results_readable(archive, store, stored):
+    assert archive.compact('2026-02-01', chunk_rows=4) == 10
+    assert len(archive.chunks()) == 3
+    assert store.count() == 4
+    assert archive.count() == 10
+
+    assert list(archive.iter_results()) + list(store.iter_results()) == stored
+    for original in stored[:10]:
+        assert archive.get(original['id']) == original
+    assert archive.get(stored[-1]['id']) is None
+
+    assert [r['student_name'] for r in archive.iter_results(student_name='bea')] == ['Bea 2', 'Bea 5', 'Bea 8']
+    assert [r['id'] for r in archive.iter_results(date_from='2026-01-18', date_to='2026-01-18')] == [9]
+    assert archive.exists(student_name='Ann')
+    assert not archive.exists(student_name='Cal')
+
+    _, _, chunks = export_results(store, 'ndjson', archive=archive)
+    exported = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    assert exported == stored
+
+
+def test_analytics_match_across_compaction(archive, stored):
+    expected = {exam_id: archive.analytics(exam_id=exam_id) for exam_id in (None, 'exam-a', 'exam-b')}
+    assert expected['exam-a']['results'] == 11
+    assert expected['exam-b']['results'] == 3
+    assert expected[None]['results'] == 14
+    assert [e['exam_id'] for e in expected['exam-b']['exams']] == ['exam-b']
+
+    archive.compact('2026-02-01', chunk_rows=4)
+    for exam_id, analytics in expected.items():
+        assert archive.analytics(exam_id=exam_id) == analytics
+    assert archive.analytics(include_live=False, exam_id='exam-a')['results'] == 7
+
+
+def test_live_analytics_follow_new_and_regraded_results(archive, store, stored, exam_keys, make_result):
+    archive.compact('2026-02-01')
+    first = archive.analytics(exam_id='exam-a')
+
+    store.append(make_result(exam_keys['exam-a'], {'q1': 'Paris', 'q2': 'True'}, 'Dee', '2026-03-09T09:00:00'))
+    added = archive.analytics(exam_id='exam-a')
+    assert added['results'] == first['results'] + 1
+
+    # Re-grading rewrites counted results; the live columns start over
+    regraded = [dict(r, score=0, percentage=0.0) for r in store.iter_results()]
+    store.update_results(regraded)
+    after = archive.analytics(exam_id='exam-a')
+    assert after['results'] == added['results']
+    assert after['mean_percentage'] < added['mean_percentage']
+
+
+def test_orphan_files_get_a_grace_period(archive, stored):
+    archive.compact('2026-02-01')
+    young = os.path.join(archive.archive_dir, 'results-in-progress.kra')
+    old = os.path.join(archive.archive_dir, 'results-abandoned.kra')
+    for path in (young, old):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+    stale = time.time() - ORPHAN_GRACE_SECONDS - 60
+    os.utime(old, (stale, stale))
+
+    archive._remove_orphans()
+    assert os.path.exists(young)
+    assert not os.path.exists(old)
+    assert all(os.path.exists(os.path.join(archive.archive_dir, c['name'])) for c in archive.chunks())
+
+    archive.clear()
+    assert os.listdir(archive.archive_dir) == []
+    assert archive.count() == 0
@@ -0,0 +1,70 @@
+"""
+Regression test: ExamScorer must make the same pass/fail decisions as the
+original per-question loop over calculate_similarity in submit_exam.
+"""
+
+import json
+import os
+import random
+
+import pytest
+
+from scoring import ExamScorer, threshold_for
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def reference_decision(calculate_similarity, question, answers):
+    """The scoring loop submit_exam used before ExamScorer."""
+    user_answer = answers.get(f"q{question['id']}", '').strip()
+    correct_answer = (question.get('correct_answer', '') or '').strip()
+    q_type = question.get('type', 'mcq')
+    if q_type in ['descriptive', 'fill_blank'] and len(user_answer) > 5000:
+        user_answer = user_answer[:5000]
+    if not user_answer:
+        return False
+    return calculate_similarity(user_answer, correct_answer) >= threshold_for(q_type)
+
+
+def library_questions():
+    questions = []
+    meta_folder = os.path.join(APP_DIR, 'library_docs', 'meta')
+    for name in sorted(os.listdir(meta_folder)):
+        with open(os.path.join(meta_folder, name), 'r', encoding='utf-8') as f:
+            questions.extend(json.load(f)['questions'])
+    return questions
+
+
+def variants(correct, rng):
+    """Answers close to, and far from, the correct answer."""
+    words = correct.split()
+    out = ['', correct, correct.upper(), ' ' + correct + ' ', correct[:-1], correct + 's']
+    if len(words) > 1:
+        out.append(' '.join(words[:-1]))
+        out.append(' '.join(reversed(words)))
+        out.append(' '.join(w for w in words if rng.random() > 0.3))
+    out.append(''.join(rng.choice('abcdefgh ') for _ in range(rng.randint(1, 40))))
+    return out
+
+
+def test_scorer_matches_calculate_similarity(app_module):
+    rng = random.Random(42)
+    questions = [dict(q, id=i + 1) for i, q in enumerate(library_questions())]
+    questions.append({'id': len(questions) + 1, 'type': 'descriptive', 'correct_answer': ''})
+    scorer = ExamScorer(questions)
+
+    submissions = []
+    for _ in range(200):
+        answers = {}
+        for q in questions:
+            answers[f"q{q['id']}"] = rng.choice(variants(q.get('correct_answer') or 'x', rng))
+        submissions.append(answers)
+
+    for answers in submissions:
+        expected = [reference_decision(app_module.calculate_similarity, q, answers) for q in questions]
+        assert scorer.decisions(answers) == expected
+    assert scorer.score_many(submissions) == [scorer.score(a) for a in submissions]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,133 @@
+"""
+Durability of the submission pipeline: journals of dead workers are
+replayed exactly once, a batch that cannot be stored is retried rather
+than dropped, and one bad record does not fail the rest of its batch.
+"""
+
+import json
+import os
+
+import pytest
+
+from submission_pipeline import SubmissionPipeline, _pid_alive, new_receipt_id
+
+
+@pytest.fixture
+def pipeline(tmp_path, store, answer_keys):
+    return SubmissionPipeline(str(tmp_path / 'journal'), store, answer_keys, batch_wait=0)
+
+
+@pytest.fixture
+def stopped_pipeline(pipeline):
+    """A started pipeline whose writer has exited, so a test can drive the writer side by hand."""
+    pipeline.start()
+    pipeline.stop()
+    return pipeline
+
+
+def record(key, answers, name='Student'):
+    return {
+        'receipt_id': new_receipt_id(),
+        'exam_id': key.exam_id,
+        'key_version': key.version,
+        'answers': answers,
+        'student_name': name,
+        'started_at': None,
+        'submitted_at': None,
+        'timestamp': '2026-01-01T09:00:00',
+    }
+
+
+def dead_pid():
+    pid = 4000000
+    while _pid_alive(pid):
+        pid -= 1
+    return pid
+
+
+def write_journal(path, records, torn_tail=False):
+    with open(path, 'w', encoding='utf-8') as f:
+        for r in records:
+            f.write(json.dumps(r) + '\n')
+        if torn_tail:
+            f.write('{"receipt_id": "cut sho')
+
+
+def test_replays_journal_of_dead_worker_once(pipeline, store, exam_keys):
+    records = [record(exam_keys['exam-a'], {'q1': 'Paris', 'q2': 'True'}, name=f'S{i}') for i in range(5)]
+    journal = os.path.join(pipeline.journal_dir, f'journal-{dead_pid()}.ndjson')
+    write_journal(journal, records, torn_tail=True)
+
+    pipeline.start()
+    pipeline.stop()
+
+    assert not os.path.exists(journal)
+    assert store.count() == 5
+    for r in records:
+        receipt = pipeline.lookup(r['receipt_id'])
+        assert receipt['status'] == 'done'
+        assert (receipt['score'], receipt['total']) == (2, 2)
+
+    # A crash after the commit but before the delete leaves the journal behind
+    write_journal(journal, records)
+    pipeline._replay_orphaned_journals()
+    assert store.count() == 5
+
+
+def test_replays_journal_left_under_own_pid(pipeline, store, exam_keys):
+    # A restarted container often gets the same PID as the worker that died
+    records = [record(exam_keys['exam-a'], {'q1': 'Paris', 'q2': 'True'}, name=f'S{i}') for i in range(3)]
+    os.makedirs(pipeline.journal_dir, exist_ok=True)
+    left = [os.path.join(pipeline.journal_dir, f'journal-{os.getpid()}-0ld0ld00.ndjson'),
+            os.path.join(pipeline.journal_dir, f'journal-{os.getpid()}.ndjson')]  # named before the token
+    write_journal(left[0], records[:2])
+    write_journal(left[1], records[2:])
+
+    pipeline.start()
+    receipt_id = pipeline.submit(exam_keys['exam-a'], {'q1': 'Rome', 'q2': 'True'}, 'New')
+    pipeline.stop()
+
+    assert store.count() == 4
+    assert all(pipeline.lookup(r['receipt_id'])['status'] == 'done' for r in records)
+    assert pipeline.lookup(receipt_id)['status'] == 'done'
+    assert not any(os.path.exists(path) for path in left)
+
+
+def test_failed_batch_is_retried_not_dropped(stopped_pipeline, store, exam_keys):
+    pipeline = stopped_pipeline
+    receipt_id = pipeline.submit(exam_keys['exam-a'], {'q1': 'Paris', 'q2': 'False'}, 'Student')
+    batch = [pipeline._queue.get_nowait()]
+
+    commit = pipeline._commit
+
+    def failing_commit(records):
+        raise OSError('disk full')
+
+    pipeline._commit = failing_commit
+    pipeline._store(batch, attempts=1)
+    assert store.count() == 0
+    assert pipeline.lookup(receipt_id)['status'] == 'queued'
+    assert pipeline._journal.written == 1
+
+    pipeline._commit = commit
+    pipeline._retry_due()  # backoff not over yet
+    assert store.count() == 0
+    pipeline._retry = [(0, delay, records) for _, delay, records in pipeline._retry]
+    pipeline._retry_due()
+    assert store.count() == 1
+    assert pipeline.lookup(receipt_id)['score'] == 1
+    assert pipeline._retry == []
+    assert pipeline._journal.written == 0
+
+
+def test_bad_record_does_not_fail_its_batch(stopped_pipeline, store, exam_keys):
+    pipeline = stopped_pipeline
+    good = record(exam_keys['exam-a'], {'q1': 'Paris', 'q2': 'True'})
+    bad = record(exam_keys['exam-a'], {'q1': 42})  # e.g. from a journal written before answers were checked
+    pipeline._commit([good, bad])
+
+    assert pipeline.lookup(good['receipt_id'])['status'] == 'done'
+    failed = pipeline.lookup(bad['receipt_id'])
+    assert failed['status'] == 'failed'
+    assert failed['error']
+    assert store.count() == 1